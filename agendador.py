@@ -0,0 +1,239 @@
+"""Agendador de tarefas recorrentes, com uma execução por horário entre as réplicas.
+
+Cada tarefa é registrada com uma agenda no formato do cron (`minuto hora dia mês
+dia-da-semana`, com `*`, `*/n`, intervalos `a-b` e listas `a,b`; dia da semana
+0-6 a partir de domingo, 7 também é domingo). `iniciar()` sobe uma thread daemon
+por processo (junto com o app) que dorme até o próximo horário e então executa
+as tarefas vencidas.
+
+Com várias réplicas do app, todas acordam no mesmo horário; cada execução:
+1. tenta a trava consultiva da tarefa (`pg_try_advisory_lock`, `db.trava_consultiva`),
+   sem esperar: quem não a obtém desiste;
+2. com a trava, confere em `agendador_execucao` se o horário já foi executado
+   (uma réplica com o relógio um pouco atrasado chega depois que a outra terminou);
+3. executa e grava horário, início, duração, resultado e réplica, exibidos na
+   página Developer.
+
+Variáveis de ambiente:
+- `AGENDADOR_ATIVO` (default 1): 0 não inicia o agendador nesta réplica;
+- `AGENDA_<TAREFA>` (p.ex. `AGENDA_LIMPEZA_TOKENS_REDEFINICAO`): substitui a agenda
+  padrão da tarefa; `desligado` a remove.
+"""
+
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, FrozenSet, List, NamedTuple, Optional
+
+import db
+import metricas
+
+logger = logging.getLogger(__name__)
+
+# Cochilo máximo do laço: tarefas registradas depois do início entram na próxima volta
+_ESPERA_MAXIMA = 60.0
+INSTANCIA = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _campo(texto: str, minimo: int, maximo: int) -> FrozenSet[int]:
+    valores = set()
+    for parte in texto.split(","):
+        if not re.fullmatch(r"(\*|\d+(-\d+)?)(/\d+)?", parte):
+            raise ValueError(f"Campo de agenda inválido: '{parte}'")
+        intervalo, _, passo_texto = parte.partition("/")
+        passo = int(passo_texto) if passo_texto else 1
+        if intervalo == "*":
+            inicio, fim = minimo, maximo
+        elif "-" in intervalo:
+            inicio_texto, fim_texto = intervalo.split("-", 1)
+            inicio, fim = int(inicio_texto), int(fim_texto)
+        else:
+            inicio = int(intervalo)
+            fim = maximo if passo_texto else inicio
+        if passo < 1 or inicio < minimo or fim > maximo or inicio > fim:
+            raise ValueError(f"Valor fora do intervalo {minimo}-{maximo}: '{parte}'")
+        valores.update(range(inicio, fim + 1, passo))
+    return frozenset(valores)
+
+
+class Cron:
+    """Agenda no formato do cron, avaliada no horário local do servidor."""
+
+    def __init__(self, expressao: str) -> None:
+        campos = expressao.split()
+        if len(campos) != 5:
+            raise ValueError(f"Agenda inválida (esperado 'minuto hora dia mês dia-da-semana'): '{expressao}'")
+        self.expressao = expressao
+        self.minutos = _campo(campos[0], 0, 59)
+        self.horas = _campo(campos[1], 0, 23)
+        self.dias = _campo(campos[2], 1, 31)
+        self.meses = _campo(campos[3], 1, 12)
+        # cron: 0 e 7 são domingo; datetime.weekday(): segunda = 0
+        self.dias_semana = frozenset((d - 1) % 7 for d in _campo(campos[4], 0, 7))
+        # Como no cron, se dia e dia da semana forem restritos, basta um dos dois
+        self._dia_livre = campos[2] == "*"
+        self._semana_livre = campos[4] == "*"
+
+    def _dia_confere(self, momento: datetime) -> bool:
+        no_mes = momento.day in self.dias
+        na_semana = momento.weekday() in self.dias_semana
+        if self._dia_livre or self._semana_livre:
+            return no_mes and na_semana
+        return no_mes or na_semana
+
+    def proxima(self, apos: datetime) -> datetime:
+        """Primeiro horário da agenda estritamente depois de `apos` (resolução de minuto)."""
+        momento = apos.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limite = momento + timedelta(days=366 * 5)
+        while momento < limite:
+            if momento.month not in self.meses:
+                ano, mes = divmod(momento.month, 12)
+                momento = momento.replace(year=momento.year + ano, month=mes + 1, day=1, hour=0, minute=0)
+            elif not self._dia_confere(momento):
+                momento = (momento + timedelta(days=1)).replace(hour=0, minute=0)
+            elif momento.hour not in self.horas:
+                momento = (momento + timedelta(hours=1)).replace(minute=0)
+            elif momento.minute not in self.minutos:
+                momento += timedelta(minutes=1)
+            else:
+                return momento
+        raise ValueError(f"Agenda sem horários possíveis: '{self.expressao}'")
+
+
+class Tarefa(NamedTuple):
+    nome: str
+    agenda: Cron
+    funcao: Callable[[], object]
+    descricao: str
+
+
+_tarefas: Dict[str, Tarefa] = {}
+_tarefas_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+_thread_lock = threading.Lock()
+
+
+def registrar(nome: str, expressao: str, funcao: Callable[[], object], descricao: str = "") -> Optional[Tarefa]:
+    """Registra (ou substitui) uma tarefa; `AGENDA_<NOME>` sobrepõe a agenda padrão.
+
+    Retorna None se a tarefa estiver desligada pela variável de ambiente.
+    """
+    expressao = os.getenv(f"AGENDA_{nome.upper()}", expressao).strip()
+    if expressao.lower() in ("", "desligado", "off"):
+        with _tarefas_lock:
+            _tarefas.pop(nome, None)
+        return None
+    tarefa = Tarefa(nome, Cron(expressao), funcao, descricao)
+    with _tarefas_lock:
+        _tarefas[nome] = tarefa
+    return tarefa
+
+
+def tarefas() -> List[Tarefa]:
+    with _tarefas_lock:
+        return sorted(_tarefas.values(), key=lambda t: t.nome)
+
+
+def executar(tarefa: Tarefa, agendada_para: Optional[datetime] = None) -> Optional[bool]:
+    """Executa a tarefa se esta réplica obtiver a trava e o horário ainda não tiver rodado.
+
+    Sem `agendada_para`, é uma execução manual (horário = agora). Retorna True/False
+    (sucesso/falha) ou None se outra réplica executa ou já executou o horário.
+    """
+    agendada_para = (agendada_para or datetime.now()).astimezone()
+    with db.trava_consultiva(f"agendador:{tarefa.nome}") as obtida:
+        if not obtida:
+            metricas.AGENDADOR_EXECUCOES.inc(tarefa=tarefa.nome, resultado="em_outra_replica")
+            return None
+        ultima = db.ultima_execucao_agendada(tarefa.nome)
+        if ultima is not None and ultima >= agendada_para:
+            metricas.AGENDADOR_EXECUCOES.inc(tarefa=tarefa.nome, resultado="ja_executada")
+            return None
+
+        inicio = datetime.now().astimezone()
+        t0 = time.perf_counter()
+        try:
+            retorno = tarefa.funcao()
+            sucesso, mensagem = True, (None if retorno is None else str(retorno))
+        except Exception as e:  # noqa: BLE001
+            logger.exception("Falha na tarefa agendada %s", tarefa.nome)
+            sucesso, mensagem = False, f"{type(e).__name__}: {e}"
+        duracao = time.perf_counter() - t0
+
+        db.registrar_execucao_agendada(
+            tarefa.nome, agendada_para, inicio, duracao * 1000, sucesso, mensagem, INSTANCIA
+        )
+    resultado = "sucesso" if sucesso else "falha"
+    metricas.AGENDADOR_EXECUCOES.inc(tarefa=tarefa.nome, resultado=resultado)
+    metricas.AGENDADOR_DURACAO.observe(duracao, tarefa=tarefa.nome)
+    logger.info("Tarefa agendada %s: %s em %.1f ms", tarefa.nome, resultado, duracao * 1000)
+    return sucesso
+
+
+def _executar_periodicamente() -> None:
+    proximas: Dict[str, datetime] = {}
+    while True:
+        agora = datetime.now()
+        for tarefa in tarefas():
+            if tarefa.nome not in proximas:
+                proximas[tarefa.nome] = tarefa.agenda.proxima(agora)
+            elif proximas[tarefa.nome] <= agora:
+                try:
+                    executar(tarefa, proximas[tarefa.nome])
+                except Exception:  # noqa: BLE001
+                    # Falha pontual (p.ex. banco indisponível) não encerra a thread
+                    logger.exception("Falha ao executar a tarefa agendada %s", tarefa.nome)
+                proximas[tarefa.nome] = tarefa.agenda.proxima(datetime.now())
+        espera = min([(p - datetime.now()).total_seconds() for p in proximas.values()] + [_ESPERA_MAXIMA])
+        time.sleep(max(1.0, espera))
+
+
+def proximas_execucoes() -> Dict[str, datetime]:
+    """Próximo horário de cada tarefa registrada, a partir de agora."""
+    agora = datetime.now()
+    return {t.nome: t.agenda.proxima(agora) for t in tarefas()}
+
+
+def _registrar_padrao() -> None:
+    import manutencao
+
+    registrar(
+        "limpeza_tokens_redefinicao",
+        "0 * * * *",
+        manutencao.limpar_tokens_redefinicao,
+        "Remove códigos de redefinição de senha expirados.",
+    )
+    registrar(
+        "limpeza_limite_taxa",
+        "30 3 * * *",
+        manutencao.limpar_limites_taxa,
+        "Remove baldes ociosos do limitador de taxa.",
+    )
+    registrar(
+        "resumo_financeiro",
+        "5 0 * * *",
+        manutencao.atualizar_resumo_financeiro,
+        "Atualiza a contagem de mensalidades vencidas após a virada do dia.",
+    )
+
+
+def iniciar() -> bool:
+    """Registra as tarefas padrão e inicia o agendador (uma thread por processo).
+
+    Retorna True se a thread está (ou já estava) em execução.
+    """
+    global _thread
+
+    if os.getenv("AGENDADOR_ATIVO", "1").strip().lower() in ("0", "false", "nao", "não"):
+        return False
+    with _thread_lock:
+        if _thread is not None:
+            return True
+        _registrar_padrao()
+        _thread = threading.Thread(target=_executar_periodicamente, name="agendador", daemon=True)
+        _thread.start()
+        return True
@@ -1,9 +1,7 @@
 """Aplicação principal - Gestão de Associados."""
 
-import re
 from datetime import date
 import os
-import secrets
 try:
     from dotenv import load_dotenv
     load_dotenv()
@@ -14,26 +12,28 @@ import streamlit as st
 import streamlit_authenticator as stauth
 import os
 
+from autenticacao import Autenticador, chave_assinatura
 from db import (
-    carregar_credenciais,
+    carregar_tabelas_status,
     inserir_usuario,
     init_db,
+    normalizar_cpf,
     obter_login_id,
     inserir_associado,
-    atualizar_senha_usuario,
     verificar_usuario_existe,
 )
 from db import (
     obter_login_por_email,
     inserir_token_redefinicao,
-    obter_token_ativo,
-    consumir_token,
+    redefinir_senha_com_token,
 )
-from area_associado import area_associado
-from area_admin import area_admin
-from dialogs import dialog_cadastro_sucesso, dialog_usuario_ja_existe
 from helpers import esconder_botao_fechar_dialog
 from helpers import enviar_email_codigo
+from helpers import resolver_modo_mobile
+import agendador
+import limitador
+import metricas
+import rotulos
 
 
 # --- Utility -----------------------------------------------------------------------
@@ -135,13 +135,26 @@ def main():
     # Esconde o botão "X" de diálogos específicos
     esconder_botao_fechar_dialog()
 
+    # Métricas do processo: endpoint lateral (se METRICS_PORT definido) e sessão ativa
+    metricas.iniciar_servidor()
+    metricas.registrar_atividade_sessao()
+
+    # Layout mobile/desktop resolvido antes de qualquer consulta (sem recarregar a página)
+    resolver_modo_mobile()
+
     # Inicializa o banco de dados
     try:
         init_db()
+        # Tabelas de status são estáticas: uma leitura por processo
+        if not rotulos.carregado():
+            carregar_tabelas_status()
     except Exception as e:  # noqa: BLE001
         st.error(f"Erro ao inicializar o banco de dados: {e}")
         return
 
+    # Tarefas recorrentes (limpezas etc.): uma thread por processo, uma execução por horário entre réplicas
+    agendador.iniciar()
+
     # Cria usuário 'developer' automaticamente se DEV_USER_PASSWORD estiver definido
     dev_pwd = os.getenv("DEV_USER_PASSWORD") or os.getenv("DEV_PASSWORD")
     try:
@@ -152,22 +165,17 @@ def main():
         # ignora erro de criação (p.ex. já existe)
         pass
 
-    # Prepara autenticador
-    credentials = carregar_credenciais()
-
+    # Prepara autenticador (cada login consulta só o usuário digitado)
     # Use uma chave segura a partir da variável de ambiente GESTAO_SECRET_KEY.
-    # Se não definida, gera uma chave forte em runtime (não persistente entre reinícios).
-    secret_key = os.environ.get("GESTAO_SECRET_KEY")
-    if not secret_key:
-        # Gera uma chave URL-safe longa (>=32 bytes quando codificada)
-        secret_key = secrets.token_urlsafe(48)
+    # Se não definida, usa uma chave forte gerada uma vez por processo (não persistente entre reinícios).
+    secret_key, chave_configurada = chave_assinatura()
+    if not chave_configurada:
         st.warning(
             "Aviso: chave de assinatura de cookies não encontrada. "
             "Uma chave temporária foi gerada; defina a variável de ambiente GESTAO_SECRET_KEY para persistência."
         )
 
-    authenticator = stauth.Authenticate(
-        credentials,
+    authenticator = Autenticador(
         "gestao_associado_cookie",
         secret_key,
         cookie_expiry_days=30,
@@ -182,10 +190,7 @@ def main():
 
     # Se já autenticado, redireciona para área adequada
     if authentication_status:
-        if (username or "").lower() in ("admin", "developer"):
-            area_admin(authenticator)
-        else:
-            area_associado(authenticator, username or "")
+        _render_area_autenticada(authenticator, username)
         return
 
     # Se não autenticado, mostra página de login/cadastro
@@ -202,28 +207,46 @@ def main():
         _render_esqueceu_senha_tab()
 
 
+def _render_area_autenticada(authenticator, username) -> None:
+    """Encaminha para a área do admin ou do associado.
+
+    As áreas (pandas, st_aggrid, diálogos) são importadas só aqui, para que a tela
+    de login/cadastro não pague o custo de carregá-las.
+    """
+    if (username or "").lower() in ("admin", "developer"):
+        from area_admin import area_admin
+
+        area_admin(authenticator)
+    else:
+        from area_associado import area_associado
+
+        area_associado(authenticator, username or "")
+
+
 def _render_login_tab(authenticator):
     """Renderiza a aba de login."""
-    authenticator.login(
-        "main",
-        fields={
-            "Form name": "Login",
-            "Username": "CPF",
-            "Password": "Senha",
-            "Login": "Entrar",
-        },
-        key="Login",
-    )
+    try:
+        authenticator.login(
+            "main",
+            fields={
+                "Form name": "Login",
+                "Username": "CPF",
+                "Password": "Senha",
+                "Login": "Entrar",
+            },
+            key="Login",
+        )
+    except ValueError as e:
+        # Tentativa recusada pelo limitador de taxa
+        st.error(str(e))
+        return
 
     name = st.session_state.get("name")
     authentication_status = st.session_state.get("authentication_status")
     username = st.session_state.get("username")
 
     if authentication_status:
-        if (username or "").lower() in ("admin", "developer"):
-            area_admin(authenticator)
-        else:
-            area_associado(authenticator, username or "")
+        _render_area_autenticada(authenticator, username)
     elif authentication_status is False:
         st.error("Usuário ou senha inválidos")
 
@@ -260,21 +283,15 @@ def _render_cadastro_tab():
     situacao_trabalho = st.text_input("Situação de trabalho", key="cad_situacao_trabalho")
     tipo_sanguineo = st.selectbox(
         "Tipo sanguíneo",
-        ["", "A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"],
+        rotulos.TIPOS_SANGUINEOS,
         key="cad_tipo_sanguineo",
     )
     quantidade_filhos = st.number_input(
         "Quantidade de filhos", min_value=0, step=1, key="cad_qtd_filhos"
     )
 
-    identidade_map = {
-        "SURDO": "Surdo",
-        "SURDOCEGO": "Surdocego",
-        "DEFICIENCIA_AUDITIVA": "Deficiência Auditiva (DA)",
-        "OUVINTE": "Ouvinte",
-    }
     identidade_label_sel = st.selectbox(
-        "Identidade", list(identidade_map.values()), key="cad_identidade"
+        "Identidade", rotulos.IDENTIDADE_ROTULOS, key="cad_identidade"
     )
 
     submitted = st.button("Cadastrar")
@@ -286,20 +303,13 @@ def _render_cadastro_tab():
             st.error("As senhas não conferem.")
         else:
             try:
-                cpf_digits = re.sub(r"\D", "", cpf_input or "")
+                cpf_digits = normalizar_cpf(cpf_input)
                 if len(cpf_digits) != 11:
                     raise ValueError("CPF deve conter 11 dígitos.")
-                cpf_formatado = (
-                    f"{cpf_digits[:3]}.{cpf_digits[3:6]}.{cpf_digits[6:9]}-{cpf_digits[9:]}"
-                )
 
                 novo_username = cpf_digits
 
-                identidade_codigo = None
-                for codigo, label in identidade_map.items():
-                    if label == identidade_label_sel:
-                        identidade_codigo = codigo
-                        break
+                identidade_codigo = rotulos.IDENTIDADE_POR_ROTULO.get(identidade_label_sel)
                 if identidade_codigo is None:
                     raise ValueError("Identidade inválida selecionada.")
                 
@@ -313,7 +323,7 @@ def _render_cadastro_tab():
 
                 inserir_associado(
                     login_id=login_id,
-                    cpf=cpf_formatado,
+                    cpf=cpf_digits,
                     nome_completo=novo_nome,
                     data_nascimento=data_nascimento,
                     email=email,
@@ -328,9 +338,13 @@ def _render_cadastro_tab():
                     foto_bytes=foto_bytes,
                 )
 
+                from dialogs import dialog_cadastro_sucesso
+
                 dialog_cadastro_sucesso()
             except ValueError as e:
                 if str(e) == "Usuário já existe":
+                    from dialogs import dialog_usuario_ja_existe
+
                     dialog_usuario_ja_existe()
                 else:
                     st.error(str(e))
@@ -362,6 +376,12 @@ def _render_password_reset_form(*, show_header: bool = True, key_prefix: str = "
             st.error("Informe o e‑mail cadastrado.")
         else:
             try:
+                # Recusa rajadas antes da consulta e do envio por SMTP
+                limitador.exigir(
+                    ("codigo_ip", limitador.ip_cliente()),
+                    ("codigo_email", email_value),
+                    mensagem="Muitos pedidos de código. Aguarde alguns minutos e tente novamente.",
+                )
                 dados = obter_login_por_email(email_value)
                 if not dados:
                     st.error("E‑mail não encontrado no sistema.")
@@ -380,6 +400,8 @@ def _render_password_reset_form(*, show_header: bool = True, key_prefix: str = "
                     st.session_state["rec_username"] = username
                     st.session_state[validation_flag_key] = True
                     _scroll_to_reset_section()
+            except ValueError as e:
+                st.error(str(e))
             except Exception as e:  # noqa: BLE001
                 st.error(f"Erro ao enviar código: {e}")
 
@@ -415,14 +437,16 @@ def _render_password_reset_form(*, show_header: bool = True, key_prefix: str = "
                     st.error("Primeiro solicite o código pelo e‑mail cadastrado.")
                     return
 
-                token_row = obter_token_ativo(login_id, codigo_input)
-                if not token_row:
+                limitador.exigir(
+                    ("codigo_login", str(login_id)),
+                    mensagem="Muitas tentativas com código inválido. Aguarde alguns minutos e tente novamente.",
+                )
+                # Validação do código, consumo e troca de senha em uma só transação
+                senha_hash = stauth.Hasher.hash_list([nova_senha_rec])[0]
+                if redefinir_senha_com_token(login_id, codigo_input, senha_hash) is None:
                     st.error("Código inválido, expirado ou já utilizado.")
                     return
 
-                senha_hash = stauth.Hasher.hash_list([nova_senha_rec])[0]
-                atualizar_senha_usuario(username, senha_hash)
-                consumir_token(login_id, codigo_input)
                 st.success("✅ Senha redefinida com sucesso! Faça login com sua nova senha.")
                 for k in (
                     "rec_login_id",
@@ -434,6 +458,8 @@ def _render_password_reset_form(*, show_header: bool = True, key_prefix: str = "
                     validation_flag_key,
                 ):
                     st.session_state.pop(k, None)
+            except ValueError as e:
+                st.error(str(e))
             except Exception as e:  # noqa: BLE001
                 st.error(f"Erro ao redefinir senha: {e}")
 
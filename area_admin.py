@@ -4,15 +4,23 @@ from datetime import date
 from decimal import Decimal
 import pandas as pd
 import streamlit as st
-import streamlit.components.v1 as components
-from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, JsCode
+from streamlit.errors import StreamlitAPIException
+from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode
 
 from db import (
-    listar_associados,
+    buscar_associados,
+    buscar_mensalidades,
+    contar_associados,
+    contar_mensalidades,
+    pagina_associados,
+    pagina_mensalidades,
+    obter_associado_por_id,
     listar_associados_contribuintes_habilitados,
     inserir_mensalidade,
     inserir_pagamento_inicial,
-    listar_mensalidades,
+    marcar_mensalidades_pagas,
+    alterar_status_mensalidades,
+    excluir_mensalidades,
 )
 from dialogs import (
     dialog_erro_pagamento,
@@ -21,7 +29,33 @@ from dialogs import (
     dialog_editar_mensalidade,
     dialog_editar_associado,
 )
-from helpers import fechar_sidebar_ao_clicar_menu, solicitar_fechamento_sidebar
+from helpers import (
+    fechar_sidebar_ao_clicar_menu,
+    fragmento,
+    resolver_modo_mobile,
+    solicitar_fechamento_sidebar,
+)
+from grade import clique_editar_na_grade, configurar_grade_editavel, ids_selecionados_na_grade
+import rotulos
+
+# Máximo de linhas devolvidas pelas buscas (ordenadas por relevância)
+_LIMITE_BUSCA = 100
+# Linhas por página nas listagens sem busca (lidas em lotes por cursor nomeado)
+_TAMANHO_PAGINA = 100
+
+
+def _selecionar_pagina(total: int, chave: str):
+    """Seletor de página das listagens; retorna (inicio, limite) para o banco."""
+    paginas = max(1, -(-total // _TAMANHO_PAGINA))
+    if paginas == 1:
+        return 0, _TAMANHO_PAGINA
+    # A lista pode ter encolhido (exclusões) desde a última página escolhida
+    if st.session_state.get(chave, 1) > paginas:
+        st.session_state[chave] = paginas
+    pagina = st.number_input("Página", min_value=1, max_value=paginas, step=1, key=chave)
+    inicio = (int(pagina) - 1) * _TAMANHO_PAGINA
+    st.caption(f"Mostrando {inicio + 1}–{min(inicio + _TAMANHO_PAGINA, total)} de {total}")
+    return inicio, _TAMANHO_PAGINA
 
 
 def area_admin(authenticator) -> None:
@@ -36,7 +70,7 @@ def area_admin(authenticator) -> None:
         st.header("Área do administrador")
         st.markdown(f"Admin: {name} ({username})")
         # menu dinâmico: adiciona Developer apenas para admin/developer
-        menu_items = ["Associados", "Mensalidades"]
+        menu_items = ["Associados", "Mensalidades", "Conciliação", "Importação", "Exportação"]
         if (username or "").lower() in ("admin", "developer"):
             menu_items.append("Developer")
         menu = st.radio(
@@ -49,6 +83,14 @@ def area_admin(authenticator) -> None:
 
     fechar_sidebar_ao_clicar_menu()
 
+    # Senhas temporárias da importação só ficam visíveis enquanto a tela estiver aberta
+    if menu != "Importação":
+        st.session_state.pop("importacao_resultado", None)
+    if menu != "Exportação":
+        st.session_state.pop("exportacao_arquivo", None)
+    if menu != "Conciliação":
+        st.session_state.pop("conciliacao_resultado", None)
+
     # Se sair de "Mensalidades", limpa eventuais flags de erro de pagamento
     if menu != "Mensalidades":
         st.session_state.pop("mostrar_dialog_erro_pagamento", None)
@@ -73,6 +115,18 @@ def area_admin(authenticator) -> None:
         _render_mensalidades_section()
         return
 
+    if menu == "Conciliação":
+        _render_conciliacao_section()
+        return
+
+    if menu == "Importação":
+        _render_importacao_section()
+        return
+
+    if menu == "Exportação":
+        _render_exportacao_section()
+        return
+
     if menu == "Developer":
         _render_developer_section()
         return
@@ -80,50 +134,9 @@ def area_admin(authenticator) -> None:
     _render_associados_section()
 
 
-def _get_query_param(name: str):
-    """Lê query param com compatibilidade entre versões do Streamlit."""
-    try:
-        value = st.query_params.get(name)
-        if isinstance(value, list):
-            return value[0] if value else None
-        return value
-    except Exception:
-        try:
-            value = st.experimental_get_query_params().get(name)
-            if isinstance(value, list):
-                return value[0] if value else None
-            return value
-        except Exception:
-            return None
-
-
 def _is_mobile_view() -> bool:
-    """Detecta largura de tela para alternar layout no admin."""
-    mobile_param = _get_query_param("mobile")
-    if str(mobile_param).lower() in ("1", "true"):
-        return True
-    if str(mobile_param).lower() in ("0", "false"):
-        return False
-
-    # Define o modo com base no viewport e recarrega com query param
-    components.html(
-        """
-        <script>
-        (function() {
-            const isMobile = window.innerWidth <= 768;
-            const url = new URL(window.location.href);
-            if (!url.searchParams.get('mobile')) {
-                url.searchParams.set('mobile', isMobile ? '1' : '0');
-                window.location.replace(url.toString());
-            }
-        })();
-        </script>
-        """,
-        height=0,
-        width=0,
-    )
-    # Fallback: assume desktop until query param is set by JS
-    return False
+    """Layout mobile do admin, resolvido uma vez por sessão (ver `resolver_modo_mobile`)."""
+    return resolver_modo_mobile()
 
 
 def _render_mensalidades_section():
@@ -146,32 +159,33 @@ def _render_lancar_mensalidade():
     # Contador para resetar o formulário
     form_counter = st.session_state.get("lancar_mens_form_counter", 0)
     
+    if _is_mobile_view():
+        busca_nome = st.text_input(
+            "🔍 Procurar por nome ou CPF",
+            placeholder="Digite o nome ou CPF do associado...",
+            key="busca_nome_assoc_mensalidade_mobile",
+        )
+    else:
+        busca_nome = None
+
     try:
-        associados_disponiveis = listar_associados_contribuintes_habilitados()
+        if busca_nome and busca_nome.strip():
+            associados_disponiveis = buscar_associados(
+                busca_nome, limite=_LIMITE_BUSCA, somente_contribuintes_habilitados=True
+            )
+        else:
+            associados_disponiveis = listar_associados_contribuintes_habilitados()
     except Exception as e:  # noqa: BLE001
         st.error(f"Erro ao carregar associados: {e}")
         return
-    
+
+    if busca_nome and busca_nome.strip() and not associados_disponiveis:
+        st.warning("Nenhum associado encontrado com esse nome ou CPF.")
+        return
+
     if not associados_disponiveis:
         st.warning("Nenhum associado CONTRIBUINTE e HABILITADO disponível para lançamento.")
     else:
-        if _is_mobile_view():
-            busca_nome = st.text_input(
-                "🔍 Procurar por nome",
-                placeholder="Digite o nome do associado...",
-                key="busca_nome_assoc_mensalidade_mobile",
-            )
-        else:
-            busca_nome = None
-
-        if busca_nome:
-            associados_disponiveis = [
-                a for a in associados_disponiveis
-                if busca_nome.strip().lower() in str(a.get("nome_completo", "")).lower()
-            ]
-            if not associados_disponiveis:
-                st.warning("Nenhum associado encontrado com esse nome.")
-                return
 
         opcoes_assoc = {
             f"{a['nome_completo']}": a["id"] for a in associados_disponiveis
@@ -205,14 +219,10 @@ def _render_lancar_mensalidade():
             key=f"lancar_mens_venc_{form_counter}",
         )
 
-        status_mens_labels = {
-            1: "Não Pago",
-            2: "Ainda Falta Pagar!",
-            3: "Pago",
-        }
+        status_mens_labels = rotulos.status_mensalidade()
         st.selectbox(
             "Status da Mensalidade",
-            [1, 2, 3],
+            list(status_mens_labels),
             format_func=lambda x: status_mens_labels.get(x, str(x)),
             index=0,
             disabled=True,
@@ -260,6 +270,7 @@ def _render_lancar_mensalidade():
                 st.error(f"Erro ao lançar mensalidade: {e}")
 
 
+@fragmento
 def _render_listar_mensalidades():
     """Renderiza a grid de mensalidades lançadas."""
     st.markdown("### Mensalidades Lançadas")
@@ -271,15 +282,26 @@ def _render_listar_mensalidades():
         key="busca_mensalidades"
     )
     
+    busca = (busca or "").strip()
     try:
-        mensalidades = listar_mensalidades()
+        if busca:
+            # Filtro, ordenação e limite no banco (índices de trigramas e de vencimento)
+            mensalidades = buscar_mensalidades(busca, limite=_LIMITE_BUSCA)
+        else:
+            inicio, limite = _selecionar_pagina(contar_mensalidades(), "pagina_mensalidades")
+            mensalidades = pagina_mensalidades(inicio, limite)
     except Exception as e:  # noqa: BLE001
         st.error(f"Erro ao carregar mensalidades: {e}")
         return
-    
+
     if not mensalidades:
-        st.info("Nenhuma mensalidade lançada.")
+        if busca:
+            st.info(f"Nenhuma mensalidade encontrada para: {busca}")
+        else:
+            st.info("Nenhuma mensalidade lançada.")
         return
+    if busca and len(mensalidades) >= _LIMITE_BUSCA:
+        st.caption(f"Mostrando as {_LIMITE_BUSCA} mensalidades mais relevantes. Refine a busca para ver outras.")
     
     df_mens = pd.DataFrame(mensalidades)
     mensalidade_by_id = {m.get("id"): m for m in mensalidades if m.get("id") is not None}
@@ -360,38 +382,6 @@ def _render_listar_mensalidades():
 
     df_mens["acao"] = "Editar"
 
-    busca_lower = (busca or "").strip().lower()
-
-    def _match_filter(row):
-        if not busca_lower:
-            return True
-
-        # Buscar no nome
-        nome = str(row.get("nome_completo", "")).lower()
-        if busca_lower in nome:
-            return True
-
-        # Buscar no mes/ano do vencimento (formato MM/AAAA ou M/AAAA)
-        data_venc_str = str(row.get("data_vencimento", ""))
-        if data_venc_str:
-            parts = data_venc_str.split("/")
-            if len(parts) == 3:
-                mes_ano = f"{parts[1]}/{parts[2]}"
-                if busca_lower in mes_ano.lower():
-                    return True
-            if busca_lower in data_venc_str.lower():
-                return True
-
-        return False
-
-    # Aplicar filtro de busca (antes do modo mobile)
-    if busca_lower:
-        df_mens = df_mens[df_mens.apply(_match_filter, axis=1)]
-
-        if df_mens.empty:
-            st.info(f"Nenhuma mensalidade encontrada para: {busca}")
-            return
-
     if _is_mobile_view():
         # Lista simples para celular (evita WebSocket pesado do AgGrid)
         cols_visiveis = [
@@ -410,11 +400,6 @@ def _render_listar_mensalidades():
             st.dataframe(df_mobile, use_container_width=True, hide_index=True)
 
         rows = df_mens.to_dict("records")
-        if busca_lower:
-            rows = [r for r in rows if _match_filter(r)]
-            if not rows:
-                st.info(f"Nenhuma mensalidade encontrada para: {busca}")
-                return
         row_by_id = {r.get("id"): r for r in rows if r.get("id") is not None}
         if row_by_id:
             ordered_ids = sorted(
@@ -437,156 +422,171 @@ def _render_listar_mensalidades():
             if st.button("Editar mensalidade", type="primary"):
                 row_raw = mensalidade_by_id.get(selected_id, row_by_id[selected_id])
                 dialog_editar_mensalidade(row_raw)
+
+            ids_lote = st.multiselect(
+                "Selecionar mensalidades para ações em lote",
+                ordered_ids,
+                format_func=_label_mid,
+                key="admin_mensalidades_lote",
+            )
+            _render_acoes_em_lote([i for i in ids_lote if i in row_by_id])
         return
 
-    gb_m = GridOptionsBuilder.from_dataframe(df_mens)
+    # A grade recebe só as colunas exibidas + id; o registro completo vem de mensalidade_by_id
+    colunas_grade = ["id", "nome_completo", "data_vencimento", "status_mensalidade", "status_pagamento", "acao"]
+    df_grade = df_mens[[c for c in colunas_grade if c in df_mens.columns]]
+
+    gb_m = GridOptionsBuilder.from_dataframe(df_grade)
+    gb_m.configure_column("id", hide=True)
     gb_m.configure_column("nome_completo", header_name="Associado", flex=1)
     gb_m.configure_column("data_vencimento", header_name="Vencimento", width=120, sort="asc")
     gb_m.configure_column("status_mensalidade", header_name="Status Mensalidade", width=160)
     gb_m.configure_column("status_pagamento", header_name="Status Pagamento", width=150)
-
-    for col in ["id", "valor", "data_emissao", "associado_id", "status_mensalidade_id", "pagamento_id", "data_pagamento", "status_pagamento_id"]:
-        if col in df_mens.columns:
-            gb_m.configure_column(col, hide=True)
-
-    button_mens_editar = JsCode("""
-        class BtnCellRenderer {
-            init(params) {
-                this.eGui = document.createElement('button');
-                this.eGui.innerHTML = 'Editar';
-                this.eGui.style.cssText = 'padding:3px 8px; border:none; background-color:#2c7be5; color:white; border-radius:4px; cursor:pointer;';
-                this.eGui.addEventListener('click', (event) => {
-                    event.stopPropagation();
-                    if (params.api && params.api.deselectAll) {
-                        params.api.deselectAll();
-                    }
-                    params.node.setSelected(true);
-                });
-            }
-            getGui() {
-                return this.eGui;
-            }
-        }
-    """)
-
-    gb_m.configure_column(
-        "acao",
-        header_name="Ação",
-        cellRenderer=button_mens_editar,
-        width=120,
-        suppressMenu=True,
-    )
-
-    gb_m.configure_selection(
-        "single",
-        use_checkbox=False,
-        rowMultiSelectWithClick=False,
-        suppressRowClickSelection=True,
-    )
-
+    configurar_grade_editavel(gb_m, multipla=True)
     grid_options_m = gb_m.build()
-    grid_mens_counter = st.session_state.get("grid_mens_counter", 0)
 
     grid_response_m = AgGrid(
-        df_mens,
+        df_grade,
         gridOptions=grid_options_m,
         update_mode=GridUpdateMode.SELECTION_CHANGED,
         fit_columns_on_grid_load=True,
         height=400,
         allow_unsafe_jscode=True,
-        key=f"grid_mensalidades_{grid_mens_counter}",
+        key="grid_mensalidades",
     )
 
-    selected_rows_m = grid_response_m["selected_rows"]
+    # Só abre o diálogo para um clique novo no botão Editar
+    row_m_id = clique_editar_na_grade(grid_response_m["selected_rows"], "clique_grade_mensalidades_admin")
+    if row_m_id is not None and row_m_id in mensalidade_by_id:
+        dialog_editar_mensalidade(mensalidade_by_id[row_m_id])
 
-    # Só abre o diálogo se houver uma NOVA seleção
-    if selected_rows_m is not None and len(selected_rows_m) > 0:
-        row_m_id = selected_rows_m.iloc[0].get("id")
-        last_selected_id = st.session_state.get("last_selected_mensalidade_admin_id")
+    # A seleção devolvida pela grade pode ainda citar linhas já excluídas ou de outra página
+    ids_lote = [i for i in ids_selecionados_na_grade(grid_response_m["selected_rows"]) if i in mensalidade_by_id]
+    _render_acoes_em_lote(ids_lote)
 
-        if row_m_id != last_selected_id:
-            st.session_state["last_selected_mensalidade_admin_id"] = row_m_id
-            row_m = selected_rows_m.iloc[0].to_dict()
-            row_raw = mensalidade_by_id.get(row_m_id, row_m)
-            dialog_editar_mensalidade(row_raw)
-    else:
-        st.session_state.pop("last_selected_mensalidade_admin_id", None)
 
+def _recarregar_listagem() -> None:
+    """Reexecuta só a listagem (fragmento) quando possível; senão, a página."""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        # Execução completa da página (não um rerun do fragmento) ou Streamlit antigo
+        st.rerun()
+
+
+def _render_acoes_em_lote(mensalidade_ids) -> None:
+    """Ações sobre as mensalidades marcadas; cada uma é um único comando no banco."""
+    mensagem = st.session_state.pop("msg_lote_mensalidades", None)
+    if mensagem:
+        st.success(mensagem)
+    if not mensalidade_ids:
+        st.caption("Marque mensalidades na lista para pagar, alterar o status ou excluir em lote.")
+        return
 
+    total = len(mensalidade_ids)
+    with st.expander(f"Ações em lote ({total} selecionada(s))", expanded=True):
+        acao = st.radio(
+            "Ação",
+            ["Marcar como pagas", "Alterar status", "Excluir"],
+            horizontal=True,
+            key="lote_mensalidades_acao",
+        )
+        try:
+            if acao == "Marcar como pagas":
+                data_pagamento = st.date_input(
+                    "Data do Pagamento",
+                    value=date.today(),
+                    format="DD/MM/YYYY",
+                    key="lote_mensalidades_data",
+                    help="Cada mensalidade recebe um pagamento 'Pago' com o valor integral.",
+                )
+                if st.button(f"Marcar {total} como pagas", type="primary", key="lote_mensalidades_pagar"):
+                    quantidade = marcar_mensalidades_pagas(mensalidade_ids, data_pagamento)
+                    st.session_state["msg_lote_mensalidades"] = (
+                        f"{quantidade} mensalidade(s) marcada(s) como paga(s) em {data_pagamento:%d/%m/%Y}."
+                    )
+                    _recarregar_listagem()
+            elif acao == "Alterar status":
+                status_mens_labels = rotulos.status_mensalidade()
+                status_id = st.selectbox(
+                    "Novo status",
+                    list(status_mens_labels),
+                    format_func=lambda x: status_mens_labels.get(x, str(x)),
+                    key="lote_mensalidades_status",
+                )
+                if st.button(f"Alterar status de {total}", type="primary", key="lote_mensalidades_alterar"):
+                    quantidade = alterar_status_mensalidades(mensalidade_ids, int(status_id))
+                    st.session_state["msg_lote_mensalidades"] = (
+                        f"Status de {quantidade} mensalidade(s) alterado para "
+                        f"'{status_mens_labels.get(status_id, status_id)}'."
+                    )
+                    _recarregar_listagem()
+            else:
+                st.warning(
+                    f"As {total} mensalidades selecionadas serão excluídas. Esta ação não poderá ser desfeita."
+                )
+                confirmar = st.checkbox("Confirmo a exclusão", key="lote_mensalidades_confirmar")
+                if st.button(
+                    f"Excluir {total}", type="primary", disabled=not confirmar, key="lote_mensalidades_excluir"
+                ):
+                    quantidade = excluir_mensalidades(mensalidade_ids)
+                    st.session_state["msg_lote_mensalidades"] = f"{quantidade} mensalidade(s) excluída(s)."
+                    _recarregar_listagem()
+        except Exception as e:  # noqa: BLE001
+            st.error(f"Erro na ação em lote: {e}")
+
+
+@fragmento
 def _render_associados_section():
     """Renderiza a seção de gestão de associados."""
     st.subheader("Associados")
 
-    # Controla quando o dialog foi solicitado nesta execução
-    st.session_state["associado_dialog_requested"] = False
-
     busca_nome = st.text_input(
-        "🔍 Procurar por nome",
-        placeholder="Digite o nome do associado...",
+        "🔍 Procurar por nome ou CPF",
+        placeholder="Digite o nome ou CPF do associado...",
         key="busca_nome_associado"
     )
+    busca_nome = (busca_nome or "").strip()
 
     try:
-        associados = listar_associados()
+        if busca_nome:
+            associados = buscar_associados(busca_nome, limite=_LIMITE_BUSCA)
+        else:
+            inicio, limite = _selecionar_pagina(contar_associados(), "pagina_associados")
+            associados = pagina_associados(inicio, limite)
     except Exception as e:  # noqa: BLE001
         st.error(f"Erro ao carregar associados: {e}")
         return
 
     if not associados:
-        st.info("Nenhum associado cadastrado.")
+        if busca_nome:
+            st.warning("Nenhum associado encontrado com esse nome ou CPF.")
+        else:
+            st.info("Nenhum associado cadastrado.")
         return
+    if busca_nome and len(associados) >= _LIMITE_BUSCA:
+        st.caption(f"Mostrando os {_LIMITE_BUSCA} associados mais relevantes. Refine a busca para ver outros.")
 
+    # A listagem traz id, CPF, nome e o resumo financeiro (pré-calculado em
+    # associado_financeiro); o registro completo (com foto) é lido ao abrir o diálogo
     df = pd.DataFrame(
-        [
-            {
-                "id": a["id"],
-                "login_id": a["login_id"],
-                "cpf": a["cpf"],
-                "nome_completo": a["nome_completo"],
-                "data_nascimento": a.get("data_nascimento"),
-                "email": a.get("email") or "",
-                "telefone": a.get("telefone") or "",
-                "endereco": a.get("endereco") or "",
-                "cidade": a.get("cidade") or "",
-                "estado_uf": a.get("estado_uf") or "",
-                "situacao_trabalho": a.get("situacao_trabalho") or "",
-                "tipo_sanguineo": a.get("tipo_sanguineo") or "",
-                "quantidade_filhos": a.get("quantidade_filhos") or 0,
-                "identidade": a.get("identidade") or "SURDO",
-                "data_inicio": pd.to_datetime(a.get("data_inicio")) if a.get("data_inicio") is not None else pd.NaT,
-                "data_desligamento": pd.to_datetime(a.get("data_desligamento")) if a.get("data_desligamento") is not None else pd.NaT,
-                "motivo_desligamento": a.get("motivo_desligamento") or "",
-                "situacao_associado": a.get("situacao_associado") or 1,
-                "tipo_associado": a.get("tipo_associado") or 2,
-                "ciclo_cobranca": a.get("ciclo_cobranca") or 1,
-            }
-            for a in associados
-        ]
+        associados,
+        columns=["id", "cpf", "nome_completo", "situacao_financeira", "total_em_aberto"],
     )
-
-    if busca_nome:
-        df = df[df["nome_completo"].str.contains(busca_nome, case=False, na=False)]
-        
-    if df.empty:
-        st.warning("Nenhum associado encontrado com esse nome.")
-        return
+    df["total_em_aberto"] = df["total_em_aberto"].astype(float)
 
     df["acao"] = "Editar"
 
     if _is_mobile_view():
         # Somente seletor no celular (sem grid)
-        filtered_ids = set(df["id"].tolist()) if "id" in df.columns else set()
-        assoc_by_id = {
-            a.get("id"): a
-            for a in associados
-            if a.get("id") is not None and (not filtered_ids or a.get("id") in filtered_ids)
-        }
+        assoc_by_id = {a["id"]: a for a in df.to_dict("records")}
         if assoc_by_id:
             def _label_assoc(_id):
                 a = assoc_by_id.get(_id, {})
                 nome = a.get("nome_completo", "")
                 cpf = a.get("cpf", "")
-                return f"{nome} - {cpf}".strip(" -")
+                situacao = a.get("situacao_financeira", "")
+                return " · ".join(p for p in (f"{nome} - {cpf}".strip(" -"), situacao) if p)
 
             selected_id = st.selectbox(
                 "Selecionar associado para editar",
@@ -598,65 +598,24 @@ def _render_associados_section():
                 if selected_id is None:
                     st.info("Selecione um associado para editar.")
                 else:
-                    st.session_state["associado_dialog_requested"] = True
-                    dialog_editar_associado(assoc_by_id[selected_id])
+                    _abrir_dialog_associado(selected_id)
         return
 
-    # Se o diálogo foi fechado, força re-render da grid para liberar a seleção
-    if not st.session_state.get("associado_dialog_active") and st.session_state.get("last_selected_associado_id") is not None:
-        st.session_state["grid_counter"] = st.session_state.get("grid_counter", 0) + 1
-        st.session_state.pop("last_selected_associado_id", None)
-
     gb = GridOptionsBuilder.from_dataframe(df)
+    gb.configure_column("id", hide=True)
     gb.configure_column("cpf", header_name="CPF", width=140)
     gb.configure_column("nome_completo", header_name="Nome", flex=1)
-
-    # Ocultar colunas
-    for col in [
-        "id", "cidade", "estado_uf", "telefone", "login_id", "data_nascimento",
-        "email", "endereco", "situacao_trabalho", "tipo_sanguineo",
-        "quantidade_filhos", "identidade", "data_inicio", "data_desligamento",
-        "motivo_desligamento", "situacao_associado", "tipo_associado", "ciclo_cobranca",
-    ]:
-        gb.configure_column(col, hide=True)
-
-    button_renderer = JsCode("""
-        class BtnCellRenderer {
-            init(params) {
-                this.eGui = document.createElement('button');
-                this.eGui.innerHTML = 'Editar';
-                this.eGui.style.cssText = 'padding:3px 8px; border:none; background-color:#2c7be5; color:white; border-radius:4px; cursor:pointer;';
-                this.eGui.addEventListener('click', (event) => {
-                    event.stopPropagation();
-                    if (params.api && params.api.deselectAll) {
-                        params.api.deselectAll();
-                    }
-                    // Forca disparo de selecao mesmo se a linha ja estava selecionada
-                    try {
-                        params.node.setSelected(false);
-                    } catch (e) {}
-                    params.node.setSelected(true);
-                });
-            }
-            getGui() {
-                return this.eGui;
-            }
-        }
-    """)
-
+    gb.configure_column("situacao_financeira", header_name="Situação financeira", width=170)
     gb.configure_column(
-        "acao",
-        header_name="Ação",
-        cellRenderer=button_renderer,
-        width=120,
-        suppressMenu=True,
+        "total_em_aberto",
+        header_name="Em aberto (R$)",
+        width=140,
+        type=["numericColumn", "customNumericFormat"],
+        precision=2,
     )
-
-    gb.configure_selection("single", use_checkbox=False, rowMultiSelectWithClick=False, suppressRowClickSelection=True)
+    configurar_grade_editavel(gb)
     grid_options = gb.build()
 
-    grid_counter = st.session_state.get("grid_counter", 0)
-    
     grid_response = AgGrid(
         df,
         gridOptions=grid_options,
@@ -664,51 +623,251 @@ def _render_associados_section():
         fit_columns_on_grid_load=True,
         height=400,
         allow_unsafe_jscode=True,
-        key=f"grid_associados_{grid_counter}",
+        key="grid_associados",
     )
 
-    selected_rows = grid_response["selected_rows"]
+    # Só abre o diálogo para um clique novo no botão Editar
+    row_id = clique_editar_na_grade(grid_response["selected_rows"], "clique_grade_associados")
+    if row_id is not None:
+        _abrir_dialog_associado(row_id)
 
-    # Se o diálogo não está ativo, libera a seleção para reabrir a mesma linha
-    if not st.session_state.get("associado_dialog_active"):
-        st.session_state.pop("last_selected_associado_id", None)
 
-    # Só abre o diálogo se houver uma NOVA seleção (ignora cliques em células de linhas já selecionadas)
-    if selected_rows is not None and len(selected_rows) > 0:
-        row_id = selected_rows.iloc[0].get("id")
-        last_selected_id = st.session_state.get("last_selected_associado_id")
+def _abrir_dialog_associado(associado_id: int) -> None:
+    """Lê o registro completo do associado e abre o diálogo de edição."""
+    try:
+        associado = obter_associado_por_id(int(associado_id))
+    except Exception as e:  # noqa: BLE001
+        st.error(f"Erro ao carregar associado: {e}")
+        return
+    if associado is None:
+        st.warning("Associado não encontrado. A lista pode estar desatualizada.")
+        return
+    dialog_editar_associado(associado)
 
-        # Só abre diálogo se for uma nova seleção diferente
-        dialog_active = st.session_state.get("associado_dialog_active")
-        if row_id != last_selected_id or not dialog_active:
-            st.session_state["last_selected_associado_id"] = row_id
-            # Recupera o registro original da lista 'associados' para preservar 'foto' (bytes)
-            original = None
-            try:
-                for a in associados:
-                    if int(a.get("id")) == int(row_id):
-                        original = a
-                        break
-            except Exception:
-                original = None
 
-            if original is not None:
-                st.session_state["associado_dialog_requested"] = True
-                dialog_editar_associado(original)
-            else:
-                # Fallback: usa os dados da grid se não encontrar o original
-                row = selected_rows.iloc[0].to_dict()
-                st.session_state["associado_dialog_requested"] = True
-                dialog_editar_associado(row)
+def _render_importacao_section():
+    """Importação em lote de associados a partir de planilha CSV/XLSX."""
+    import importacao
+
+    st.subheader("Importação de associados")
+    st.markdown(
+        "Envie uma planilha **CSV** ou **XLSX** com uma linha por associado. "
+        "Colunas obrigatórias: `cpf`, `nome_completo` e `identidade`. Opcionais: "
+        + ", ".join(f"`{c}`" for c in importacao.COLUNAS_OPCIONAIS)
+        + ". Linhas sem `senha` recebem uma senha temporária, listada ao final."
+    )
+    st.download_button(
+        "Baixar planilha modelo",
+        data=importacao.modelo_csv(),
+        file_name="modelo_importacao_associados.csv",
+        mime="text/csv",
+        key="importacao_modelo",
+    )
+
+    arquivo = st.file_uploader(
+        "Planilha", type=["csv", "xlsx"], key="importacao_arquivo"
+    )
+    if st.button("Validar e importar", type="primary", disabled=arquivo is None, key="importacao_executar"):
+        try:
+            with st.spinner("Validando e importando associados..."):
+                st.session_state["importacao_resultado"] = importacao.importar(
+                    arquivo.getvalue(), arquivo.name
+                )
+        except Exception as e:  # noqa: BLE001
+            st.session_state.pop("importacao_resultado", None)
+            st.error(f"Erro ao importar planilha: {e}")
+
+    resultado = st.session_state.get("importacao_resultado")
+    if not resultado:
+        return
+
+    if resultado["inseridos"]:
+        st.success(f"{resultado['inseridos']} de {resultado['total']} associados importados.")
     else:
-        # Limpa o ID quando não há seleção
-        st.session_state.pop("last_selected_associado_id", None)
+        st.warning(f"Nenhum associado importado ({resultado['total']} linhas na planilha).")
+
+    erros = resultado["erros"]
+    if not erros.empty:
+        st.markdown(f"#### Linhas com erro ({erros['linha'].nunique()})")
+        st.dataframe(erros, use_container_width=True, hide_index=True)
+        st.download_button(
+            "Baixar relatório de erros",
+            data=erros.to_csv(index=False, sep=";").encode("utf-8-sig"),
+            file_name="importacao_erros.csv",
+            mime="text/csv",
+            key="importacao_erros",
+        )
+
+    senhas = resultado["senhas_geradas"]
+    if not senhas.empty:
+        st.markdown("#### Senhas temporárias")
+        st.caption("Repasse a senha a cada associado; ela não será exibida novamente após sair desta tela.")
+        st.download_button(
+            "Baixar senhas temporárias",
+            data=senhas.to_csv(index=False, sep=";").encode("utf-8-sig"),
+            file_name="importacao_senhas_temporarias.csv",
+            mime="text/csv",
+            key="importacao_senhas",
+        )
+
+
+def _render_conciliacao_section():
+    """Conciliação de extrato bancário (CSV/OFX) com as mensalidades em aberto."""
+    import conciliacao
 
-    # Se o dialog foi fechado sem passar pelo Cancelar, limpa estado e força re-render
-    if st.session_state.get("associado_dialog_active") and not st.session_state.get("associado_dialog_requested"):
-        st.session_state["associado_dialog_active"] = False
-        st.session_state["grid_counter"] = st.session_state.get("grid_counter", 0) + 1
-        st.session_state.pop("last_selected_associado_id", None)
+    st.subheader("Conciliação bancária")
+    st.markdown(
+        "Envie o extrato em **OFX** ou **CSV** (colunas `data`, `valor` e, se houver, "
+        "`descricao`/`historico` e `cpf`). Cada crédito é comparado com as mensalidades em aberto "
+        f"pelo valor, pelo vencimento (até {conciliacao.JANELA_DIAS} dias de diferença) e pelo CPF "
+        "ou nome do associado na descrição. Confira as sugestões antes de registrar os pagamentos."
+    )
+
+    arquivo = st.file_uploader("Extrato", type=["ofx", "csv", "txt"], key="conciliacao_arquivo")
+    if st.button("Conciliar extrato", type="primary", disabled=arquivo is None, key="conciliacao_executar"):
+        try:
+            with st.spinner("Lendo extrato e procurando mensalidades..."):
+                st.session_state["conciliacao_resultado"] = conciliacao.conciliar(arquivo, arquivo.name)
+        except Exception as e:  # noqa: BLE001
+            st.session_state.pop("conciliacao_resultado", None)
+            st.error(f"Erro ao ler extrato: {e}")
+
+    resultado = st.session_state.get("conciliacao_resultado")
+    if not resultado:
+        return
+
+    sugestoes = resultado["sugestoes"]
+    st.info(
+        f"{resultado['creditos']} crédito(s) no extrato: {len(sugestoes)} com mensalidade sugerida, "
+        f"{len(resultado['sem_correspondencia'])} sem correspondência. "
+        f"{resultado['debitos']} débito(s) ignorado(s)."
+    )
+
+    if not sugestoes.empty:
+        st.markdown("#### Sugestões")
+        st.caption("Sugestões por CPF ou nome já vêm marcadas; as só por valor e data precisam ser conferidas.")
+        editado = st.data_editor(
+            sugestoes,
+            column_config={
+                "confirmar": st.column_config.CheckboxColumn("Confirmar"),
+                "linha": st.column_config.NumberColumn("Linha"),
+                "data": st.column_config.DateColumn("Data", format="DD/MM/YYYY"),
+                "valor": st.column_config.NumberColumn("Valor", format="R$ %.2f"),
+                "descricao": "Descrição",
+                "mensalidade_id": None,
+                "associado": "Associado",
+                "vencimento": st.column_config.DateColumn("Vencimento", format="DD/MM/YYYY"),
+                "criterio": "Critério",
+            },
+            disabled=[c for c in sugestoes.columns if c != "confirmar"],
+            hide_index=True,
+            use_container_width=True,
+            key="conciliacao_editor",
+        )
+        confirmadas = int(editado["confirmar"].sum())
+        if st.button(
+            f"Registrar {confirmadas} pagamento(s)",
+            type="primary",
+            disabled=confirmadas == 0,
+            key="conciliacao_registrar",
+        ):
+            try:
+                pagas = conciliacao.registrar(editado)
+            except Exception as e:  # noqa: BLE001
+                st.error(f"Erro ao registrar pagamentos: {e}")
+            else:
+                mensagem = f"{len(pagas)} pagamento(s) registrado(s) pela conciliação."
+                if len(pagas) < confirmadas:
+                    mensagem += f" {confirmadas - len(pagas)} mensalidade(s) já estavam pagas e foram ignoradas."
+                st.session_state["msg_sucesso"] = mensagem
+                st.session_state.pop("conciliacao_resultado", None)
+                st.rerun()
+
+    sem_correspondencia = resultado["sem_correspondencia"]
+    if not sem_correspondencia.empty:
+        with st.expander(f"Créditos sem mensalidade correspondente ({len(sem_correspondencia)})"):
+            st.dataframe(sem_correspondencia, use_container_width=True, hide_index=True)
+
+    erros = resultado["erros"]
+    if not erros.empty:
+        with st.expander(f"Linhas com erro ({len(erros)})"):
+            st.dataframe(erros, use_container_width=True, hide_index=True)
+
+
+def _download_sob_demanda() -> bool:
+    """Indica se `st.download_button` aceita uma função (arquivo gerado só no clique)."""
+    try:
+        from streamlit.proto.DownloadButton_pb2 import DownloadButton
+
+        return "deferred_file_id" in DownloadButton.DESCRIPTOR.fields_by_name
+    except ImportError:
+        return False
+
+
+def _render_exportacao_section():
+    """Exportação de associados e mensalidades em CSV/XLSX."""
+    import exportacao
+
+    st.subheader("Exportação")
+    st.caption("Os dados são lidos do banco em blocos e gravados em um arquivo temporário em disco.")
+
+    col_dados, col_formato = st.columns([2, 1])
+    with col_dados:
+        nome = st.radio(
+            "Dados",
+            list(exportacao.EXPORTACOES),
+            format_func=exportacao.EXPORTACOES.get,
+            horizontal=True,
+            key="exportacao_dados",
+        )
+    with col_formato:
+        formato = st.radio(
+            "Formato",
+            list(exportacao.FORMATOS),
+            format_func=str.upper,
+            horizontal=True,
+            key="exportacao_formato",
+        )
+
+    try:
+        total = exportacao.contar_linhas(nome)
+    except Exception as e:  # noqa: BLE001
+        st.error(f"Erro ao contar registros: {e}")
+        return
+    limite = exportacao.limite_linhas_interface()
+    if total > limite:
+        # O Streamlit guarda o download inteiro em memória; acima do limite, só pela linha de comando
+        st.warning(
+            f"{total} registros excedem o limite de {limite} da exportação pela interface "
+            "(EXPORTACAO_LIMITE_LINHAS). Gere o arquivo pela linha de comando:"
+        )
+        st.code(f"python exportacao.py {nome} --formato {formato}", language="bash")
+        return
+
+    rotulo = f"Baixar {exportacao.EXPORTACOES[nome].lower()} ({formato.upper()})"
+    parametros = dict(
+        file_name=exportacao.nome_arquivo(nome, formato),
+        mime=exportacao.FORMATOS[formato],
+        type="primary",
+        key="exportacao_download",
+    )
+    if _download_sob_demanda():
+        # O arquivo só é gerado quando o botão é clicado (não a cada rerun)
+        st.download_button(rotulo, data=lambda: exportacao.gerar_arquivo(nome, formato), **parametros)
+        return
+
+    # Streamlit sem download sob demanda: gera o arquivo em um clique e baixa no seguinte
+    chave = (nome, formato)
+    if st.button("Gerar arquivo", key="exportacao_gerar"):
+        try:
+            with st.spinner("Gerando arquivo..."):
+                with exportacao.gerar_arquivo(nome, formato) as arquivo:
+                    st.session_state["exportacao_arquivo"] = (chave, arquivo.read())
+        except Exception as e:  # noqa: BLE001
+            st.error(f"Erro ao exportar: {e}")
+    gerado = st.session_state.get("exportacao_arquivo")
+    if gerado and gerado[0] == chave:
+        st.download_button(rotulo, data=gerado[1], **parametros)
 
 
 def _render_developer_section():
@@ -755,3 +914,87 @@ def _render_developer_section():
             st.success("Conexão com o banco OK")
         except Exception as e:
             st.error(f"Erro conexão DB: {e}")
+
+    _render_status_automatico()
+    _render_tarefas_agendadas()
+
+
+def _render_status_automatico():
+    """Liga/desliga no banco (para todas as réplicas) o status automático das mensalidades."""
+    from db import definir_status_automatico, status_automatico_ativo
+
+    st.markdown("#### Status automático das mensalidades")
+    st.caption(
+        "Ligado, o banco calcula o status da mensalidade a cada pagamento gravado: "
+        "\"Pago\" com o valor integral -> Pago, \"Pago\" com valor menor -> Ainda Falta Pagar!, "
+        "demais -> Não Pago. Desligado, o admin confirma o status manualmente."
+    )
+    try:
+        ativo = status_automatico_ativo()
+    except Exception as e:  # noqa: BLE001
+        st.error(f"Erro ao consultar o status automático: {e}")
+        return
+    st.write("Situação atual: **ligado**" if ativo else "Situação atual: **desligado**")
+    rotulo = "Desligar status automático" if ativo else "Ligar status automático"
+    if st.button(rotulo, key="dev_status_automatico"):
+        try:
+            definir_status_automatico(not ativo)
+        except Exception as e:  # noqa: BLE001
+            st.error(f"Erro ao alterar o status automático: {e}")
+            return
+        st.rerun()
+
+
+def _render_tarefas_agendadas():
+    """Última execução (em qualquer réplica), próximo horário e execução manual das tarefas."""
+    import agendador
+    from db import listar_execucoes_agendadas
+
+    st.markdown("#### Tarefas agendadas")
+    tarefas = {t.nome: t for t in agendador.tarefas()}
+    if not tarefas:
+        st.caption("Agendador não iniciado neste processo (AGENDADOR_ATIVO=0).")
+    else:
+        col1, col2 = st.columns([2, 1], vertical_alignment="bottom")
+        nome = col1.selectbox(
+            "Tarefa",
+            list(tarefas),
+            format_func=lambda n: f"{n} - {tarefas[n].descricao}" if tarefas[n].descricao else n,
+            key="dev_tarefa_agendada",
+        )
+        if col2.button("Executar agora", key="dev_executar_tarefa"):
+            try:
+                with st.spinner(f"Executando {nome}..."):
+                    sucesso = agendador.executar(tarefas[nome])
+                if sucesso is None:
+                    st.info("Outra réplica está executando esta tarefa agora.")
+                elif sucesso:
+                    st.success(f"{nome} executada com sucesso.")
+                else:
+                    st.error(f"{nome} falhou; veja a mensagem na tabela.")
+            except Exception as e:  # noqa: BLE001
+                st.error(f"Erro ao executar {nome}: {e}")
+
+    try:
+        execucoes = {e["tarefa"]: e for e in listar_execucoes_agendadas()}
+    except Exception as e:  # noqa: BLE001
+        st.error(f"Erro ao consultar execuções: {e}")
+        return
+
+    proximas = agendador.proximas_execucoes()
+    linhas = []
+    for nome in sorted(set(tarefas) | set(execucoes)):
+        tarefa = tarefas.get(nome)
+        execucao = execucoes.get(nome)
+        linhas.append({
+            "Tarefa": nome,
+            "Agenda": tarefa.agenda.expressao if tarefa else "(não registrada)",
+            "Próxima": proximas[nome].strftime("%d/%m/%Y %H:%M") if nome in proximas else "",
+            "Última execução": execucao["inicio"].astimezone().strftime("%d/%m/%Y %H:%M:%S") if execucao else "",
+            "Duração (ms)": round(execucao["duracao_ms"], 1) if execucao else None,
+            "Resultado": ("Sucesso" if execucao["sucesso"] else "Falha") if execucao else "Nunca executada",
+            "Mensagem": (execucao["mensagem"] or "") if execucao else "",
+            "Réplica": (execucao["instancia"] or "") if execucao else "",
+        })
+    if linhas:
+        st.dataframe(pd.DataFrame(linhas), use_container_width=True, hide_index=True)
@@ -1,6 +1,5 @@
 """Área do associado - visualização e edição de dados pessoais."""
 
-import re
 from datetime import date
 from decimal import Decimal
 import pandas as pd
@@ -11,13 +10,20 @@ from io import BytesIO
 from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, JsCode
 
 from db import (
-    obter_login_id,
-    obter_associado_por_login_id,
+    obter_associado_por_username,
     listar_mensalidades,
+    obter_resumo_financeiro,
     atualizar_associado_completo,
 )
 from dialogs import dialog_editar_mensalidade
-from helpers import fechar_sidebar_ao_clicar_menu, solicitar_fechamento_sidebar
+from helpers import (
+    fechar_sidebar_ao_clicar_menu,
+    fragmento,
+    resolver_modo_mobile,
+    solicitar_fechamento_sidebar,
+)
+from grade import clique_editar_na_grade, configurar_grade_editavel
+import rotulos
 
 
 def _get_query_param(name: str):
@@ -51,30 +57,8 @@ def _set_query_param(name: str, value: str) -> None:
 
 
 def _is_mobile_view() -> bool:
-    """Detecta largura de tela para alternar layout no associado."""
-    mobile_param = _get_query_param("mobile")
-    if str(mobile_param).lower() in ("1", "true"):
-        return True
-    if str(mobile_param).lower() in ("0", "false"):
-        return False
-
-    components.html(
-        """
-        <script>
-        (function() {
-            const isMobile = window.innerWidth <= 768;
-            const url = new URL(window.location.href);
-            if (!url.searchParams.get('mobile')) {
-                url.searchParams.set('mobile', isMobile ? '1' : '0');
-                window.location.replace(url.toString());
-            }
-        })();
-        </script>
-        """,
-        height=0,
-        width=0,
-    )
-    return False
+    """Layout mobile do associado, resolvido uma vez por sessão (ver `resolver_modo_mobile`)."""
+    return resolver_modo_mobile()
 
 
 def _controlar_auto_refresh_mensalidades(ativo: bool, interval_ms: int = 15000) -> None:
@@ -151,6 +135,237 @@ def _controlar_auto_refresh_mensalidades(ativo: bool, interval_ms: int = 15000)
     components.html(html_script, height=0, width=0)
 
 
+def _render_resumo_financeiro(associado_id: int) -> None:
+    """Cartões com o total em aberto, as vencidas e o último pagamento do associado."""
+    try:
+        resumo = obter_resumo_financeiro(associado_id)
+    except Exception as e:  # noqa: BLE001
+        st.warning(f"Resumo financeiro indisponível: {e}")
+        return
+
+    ultimo = resumo.get("ultimo_pagamento")
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Total em aberto", f"R$ {float(resumo.get('total_em_aberto') or 0):.2f}")
+    col2.metric("Mensalidades vencidas", int(resumo.get("mensalidades_vencidas") or 0))
+    col3.metric("Último pagamento", ultimo.strftime("%d/%m/%Y") if ultimo else "—")
+
+
+@fragmento
+def _render_mensalidades_associado(associado_id: int) -> None:
+    """Lista as mensalidades do associado; interações na lista reexecutam só esta seção."""
+    try:
+        mensalidades = listar_mensalidades(associado_id=associado_id)
+    except Exception as e:  # noqa: BLE001
+        st.error(f"Erro ao carregar mensalidades: {e}")
+        return
+
+    _render_resumo_financeiro(associado_id)
+
+    if not mensalidades:
+        st.info("Você não possui mensalidades lançadas.")
+    else:
+        modo_mobile = _is_mobile_view()
+        if modo_mobile:
+            st.caption("Modo lista simples ativado (mobile).")
+        df_mens = pd.DataFrame(mensalidades)
+
+        # Normalizar dados (mesma lógica da área admin)
+        def _valor_to_float(v):
+            if v is None:
+                return 0.0
+            if isinstance(v, dict):
+                for chave in ("valor", "value", "amount", "numero", "quantia"):
+                    if chave in v and v[chave] is not None:
+                        try:
+                            return float(v[chave])
+                        except (TypeError, ValueError):
+                            continue
+                try:
+                    return float(str(v))
+                except (TypeError, ValueError):
+                    return 0.0
+            if isinstance(v, Decimal):
+                return float(v)
+            try:
+                return float(v)
+            except (TypeError, ValueError):
+                return 0.0
+
+        if "valor" in df_mens.columns:
+            df_mens["valor"] = df_mens["valor"].apply(_valor_to_float)
+
+        def _date_to_str(v):
+            if v is None:
+                return ""
+            try:
+                if pd.isna(v):
+                    return ""
+            except TypeError:
+                pass
+
+            if isinstance(v, str):
+                try:
+                    dt = pd.to_datetime(v, errors="coerce")
+                    if pd.isna(dt):
+                        return v
+                    return dt.strftime("%d/%m/%Y")
+                except Exception:
+                    return v
+
+            if hasattr(v, "strftime"):
+                try:
+                    return v.strftime("%d/%m/%Y")
+                except Exception:
+                    return str(v)
+
+            return str(v)
+
+        for col in ["data_emissao", "data_vencimento"]:
+            if col in df_mens.columns:
+                df_mens[col] = df_mens[col].apply(_date_to_str)
+
+        def _status_to_text(valor):
+            if valor is None:
+                return ""
+            if isinstance(valor, dict):
+                for chave in ("descricao", "descricao_status", "nome", "label", "status"):
+                    if chave in valor and valor[chave] is not None:
+                        return str(valor[chave])
+                return str(valor)
+            try:
+                if pd.isna(valor):
+                    return ""
+            except TypeError:
+                pass
+            return str(valor)
+
+        def _status_badge(texto):
+            texto_limpo = str(texto or "").strip()
+            cores = {
+                "pago": "#a9d8b8",
+                "não pago": "#f1b0b7",
+                "ainda falta pagar!": "#ffe08a",
+            }
+            cor = cores.get(texto_limpo.lower(), "#ced4da")
+            return (texto_limpo or "-", "", cor)
+
+        for col in ["status_mensalidade", "status_pagamento"]:
+            if col in df_mens.columns:
+                df_mens[col] = df_mens[col].apply(_status_to_text)
+
+        def _status_pago_style(valor):
+            texto = str(valor or "").strip().lower()
+            if texto == "pago":
+                return "color: #198754; font-weight: 700;"
+            return ""
+
+        df_mens["acao"] = "Editar"
+
+        if modo_mobile:
+            # Lista simples para celular (evita WebSocket pesado do AgGrid)
+            rows = df_mens.to_dict("records")
+            for row in rows:
+                with st.container(border=True):
+                    st.markdown(f"**Vencimento:** {row.get('data_vencimento', '-')}")
+                    if "valor" in row:
+                        try:
+                            st.markdown(f"**Valor:** R$ {float(row.get('valor') or 0):.2f}")
+                        except (TypeError, ValueError):
+                            st.markdown(f"**Valor:** {row.get('valor', '-')}")
+
+                    annotated_text(
+                        "Status Mensalidade:",
+                        _status_badge(row.get("status_mensalidade")),
+                    )
+                    annotated_text(
+                        "Status Pagamento:",
+                        _status_badge(row.get("status_pagamento")),
+                    )
+
+            row_by_id = {r.get("id"): r for r in rows if r.get("id") is not None}
+            if row_by_id:
+                def _label_mid(_id):
+                    r = row_by_id.get(_id, {})
+                    venc = r.get("data_vencimento", "")
+                    status = r.get("status_mensalidade", "")
+                    return f"{venc} - {status}".strip(" -")
+
+                selected_id = st.selectbox(
+                    "Selecionar mensalidade para editar",
+                    list(row_by_id.keys()),
+                    format_func=_label_mid,
+                    key="assoc_mensalidade_select",
+                )
+                if st.button("Editar mensalidade", type="primary"):
+                    dialog_editar_mensalidade(row_by_id[selected_id])
+            return
+
+        # A grade recebe só as colunas exibidas + id; a linha completa vem de linhas_por_id
+        linhas_por_id = {r.get("id"): r for r in df_mens.to_dict("records") if r.get("id") is not None}
+        colunas_grade = ["id", "data_vencimento", "status_mensalidade", "status_pagamento", "acao"]
+        df_grade = df_mens[[c for c in colunas_grade if c in df_mens.columns]]
+
+        # Configuração da grid AgGrid
+        gb_m = GridOptionsBuilder.from_dataframe(df_grade)
+        status_cell_style = JsCode("""
+            function(params) {
+                const value = String(params.value || '').trim().toLowerCase();
+                if (value === 'pago') {
+                    return {
+                        color: '#0f5132',
+                        backgroundColor: '#d1e7dd',
+                        borderRadius: '6px',
+                        paddingLeft: '6px',
+                        paddingRight: '6px',
+                        fontWeight: '700'
+                    };
+                }
+                if (value === 'não pago') {
+                    return {
+                        color: '#842029',
+                        backgroundColor: '#f8d7da',
+                        borderRadius: '6px',
+                        paddingLeft: '6px',
+                        paddingRight: '6px',
+                        fontWeight: '700'
+                    };
+                }
+                if (value === 'ainda falta pagar!') {
+                    return {
+                        color: '#664d03',
+                        backgroundColor: '#fff3cd',
+                        borderRadius: '6px',
+                        paddingLeft: '6px',
+                        paddingRight: '6px',
+                        fontWeight: '700'
+                    };
+                }
+                return null;
+            }
+        """)
+        gb_m.configure_column("id", hide=True)
+        gb_m.configure_column("data_vencimento", header_name="Vencimento", width=120, sort="asc")
+        gb_m.configure_column("status_mensalidade", header_name="Status Mensalidade", width=160, cellStyle=status_cell_style)
+        gb_m.configure_column("status_pagamento", header_name="Status Pagamento", width=150, cellStyle=status_cell_style)
+        configurar_grade_editavel(gb_m)
+        grid_options_m = gb_m.build()
+
+        grid_response_m = AgGrid(
+            df_grade,
+            gridOptions=grid_options_m,
+            update_mode=GridUpdateMode.SELECTION_CHANGED,
+            fit_columns_on_grid_load=True,
+            height=400,
+            allow_unsafe_jscode=True,
+            key="grid_mensalidades_assoc",
+        )
+
+        # Só abre o diálogo para um clique novo no botão Editar
+        row_m_id = clique_editar_na_grade(grid_response_m["selected_rows"], "clique_grade_mensalidades_assoc")
+        if row_m_id is not None and row_m_id in linhas_por_id:
+            dialog_editar_mensalidade(linhas_por_id[row_m_id])
+
+
 def area_associado(authenticator, username: str) -> None:
     """Área do associado: visualização/edição de dados pessoais."""
 
@@ -186,15 +401,7 @@ def area_associado(authenticator, username: str) -> None:
         st.success(st.session_state["msg_sucesso"])
         st.session_state.pop("msg_sucesso")
 
-    username_limpo = re.sub(r"\D", "", username or "")
-    username_busca = username_limpo if len(username_limpo) == 11 else username
-
-    login_id = obter_login_id(username_busca)
-    if login_id is None:
-        st.error("Não foi possível localizar o login do associado.")
-        return
-
-    associado = obter_associado_por_login_id(login_id)
+    associado = obter_associado_por_username(username)
     if not associado:
         st.warning("Nenhum cadastro de associado encontrado para este usuário.")
         return
@@ -203,274 +410,11 @@ def area_associado(authenticator, username: str) -> None:
         st.subheader("Minhas Mensalidades")
         st.caption("Atualização automática ativa a cada 15 segundos.")
         
-        try:
-            mensalidades = listar_mensalidades(associado_id=associado["id"])
-        except Exception as e:  # noqa: BLE001
-            st.error(f"Erro ao carregar mensalidades: {e}")
-            return
-        
-        if not mensalidades:
-            st.info("Você não possui mensalidades lançadas.")
-        else:
-            modo_mobile = _is_mobile_view()
-            if modo_mobile:
-                st.caption("Modo lista simples ativado (mobile).")
-            df_mens = pd.DataFrame(mensalidades)
-
-            # Normalizar dados (mesma lógica da área admin)
-            def _valor_to_float(v):
-                if v is None:
-                    return 0.0
-                if isinstance(v, dict):
-                    for chave in ("valor", "value", "amount", "numero", "quantia"):
-                        if chave in v and v[chave] is not None:
-                            try:
-                                return float(v[chave])
-                            except (TypeError, ValueError):
-                                continue
-                    try:
-                        return float(str(v))
-                    except (TypeError, ValueError):
-                        return 0.0
-                if isinstance(v, Decimal):
-                    return float(v)
-                try:
-                    return float(v)
-                except (TypeError, ValueError):
-                    return 0.0
-
-            if "valor" in df_mens.columns:
-                df_mens["valor"] = df_mens["valor"].apply(_valor_to_float)
-
-            def _date_to_str(v):
-                if v is None:
-                    return ""
-                try:
-                    if pd.isna(v):
-                        return ""
-                except TypeError:
-                    pass
-
-                if isinstance(v, str):
-                    try:
-                        dt = pd.to_datetime(v, errors="coerce")
-                        if pd.isna(dt):
-                            return v
-                        return dt.strftime("%d/%m/%Y")
-                    except Exception:
-                        return v
-
-                if hasattr(v, "strftime"):
-                    try:
-                        return v.strftime("%d/%m/%Y")
-                    except Exception:
-                        return str(v)
-
-                return str(v)
-
-            for col in ["data_emissao", "data_vencimento"]:
-                if col in df_mens.columns:
-                    df_mens[col] = df_mens[col].apply(_date_to_str)
-
-            def _status_to_text(valor):
-                if valor is None:
-                    return ""
-                if isinstance(valor, dict):
-                    for chave in ("descricao", "descricao_status", "nome", "label", "status"):
-                        if chave in valor and valor[chave] is not None:
-                            return str(valor[chave])
-                    return str(valor)
-                try:
-                    if pd.isna(valor):
-                        return ""
-                except TypeError:
-                    pass
-                return str(valor)
-
-            def _status_badge(texto):
-                texto_limpo = str(texto or "").strip()
-                cores = {
-                    "pago": "#a9d8b8",
-                    "não pago": "#f1b0b7",
-                    "ainda falta pagar!": "#ffe08a",
-                }
-                cor = cores.get(texto_limpo.lower(), "#ced4da")
-                return (texto_limpo or "-", "", cor)
-
-            for col in ["status_mensalidade", "status_pagamento"]:
-                if col in df_mens.columns:
-                    df_mens[col] = df_mens[col].apply(_status_to_text)
-
-            def _status_pago_style(valor):
-                texto = str(valor or "").strip().lower()
-                if texto == "pago":
-                    return "color: #198754; font-weight: 700;"
-                return ""
-
-            df_mens["acao"] = "Editar"
-
-            if modo_mobile:
-                # Lista simples para celular (evita WebSocket pesado do AgGrid)
-                rows = df_mens.to_dict("records")
-                for row in rows:
-                    with st.container(border=True):
-                        st.markdown(f"**Vencimento:** {row.get('data_vencimento', '-')}")
-                        if "valor" in row:
-                            try:
-                                st.markdown(f"**Valor:** R$ {float(row.get('valor') or 0):.2f}")
-                            except (TypeError, ValueError):
-                                st.markdown(f"**Valor:** {row.get('valor', '-')}")
-
-                        annotated_text(
-                            "Status Mensalidade:",
-                            _status_badge(row.get("status_mensalidade")),
-                        )
-                        annotated_text(
-                            "Status Pagamento:",
-                            _status_badge(row.get("status_pagamento")),
-                        )
-
-                row_by_id = {r.get("id"): r for r in rows if r.get("id") is not None}
-                if row_by_id:
-                    def _label_mid(_id):
-                        r = row_by_id.get(_id, {})
-                        venc = r.get("data_vencimento", "")
-                        status = r.get("status_mensalidade", "")
-                        return f"{venc} - {status}".strip(" -")
-
-                    selected_id = st.selectbox(
-                        "Selecionar mensalidade para editar",
-                        list(row_by_id.keys()),
-                        format_func=_label_mid,
-                        key="assoc_mensalidade_select",
-                    )
-                    if st.button("Editar mensalidade", type="primary"):
-                        dialog_editar_mensalidade(row_by_id[selected_id])
-                return
-
-            # Configuração da grid AgGrid
-            gb_m = GridOptionsBuilder.from_dataframe(df_mens)
-            status_cell_style = JsCode("""
-                function(params) {
-                    const value = String(params.value || '').trim().toLowerCase();
-                    if (value === 'pago') {
-                        return {
-                            color: '#0f5132',
-                            backgroundColor: '#d1e7dd',
-                            borderRadius: '6px',
-                            paddingLeft: '6px',
-                            paddingRight: '6px',
-                            fontWeight: '700'
-                        };
-                    }
-                    if (value === 'não pago') {
-                        return {
-                            color: '#842029',
-                            backgroundColor: '#f8d7da',
-                            borderRadius: '6px',
-                            paddingLeft: '6px',
-                            paddingRight: '6px',
-                            fontWeight: '700'
-                        };
-                    }
-                    if (value === 'ainda falta pagar!') {
-                        return {
-                            color: '#664d03',
-                            backgroundColor: '#fff3cd',
-                            borderRadius: '6px',
-                            paddingLeft: '6px',
-                            paddingRight: '6px',
-                            fontWeight: '700'
-                        };
-                    }
-                    return null;
-                }
-            """)
-            gb_m.configure_column("id", header_name="ID", width=80)
-            gb_m.configure_column("data_vencimento", header_name="Vencimento", width=120, sort="asc")
-            gb_m.configure_column("status_mensalidade", header_name="Status Mensalidade", width=160, cellStyle=status_cell_style)
-            gb_m.configure_column("status_pagamento", header_name="Status Pagamento", width=150, cellStyle=status_cell_style)
-
-            # Ocultar colunas não necessárias (não mostra nome do associado pois é ele mesmo)
-            for col in ["id", "valor", "data_emissao", "nome_completo", "associado_id", "status_mensalidade_id", "pagamento_id", "data_pagamento", "status_pagamento_id"]:
-                if col in df_mens.columns:
-                    gb_m.configure_column(col, hide=True)
-
-            # Botão Editar
-            button_mens_editar = JsCode("""
-                class BtnCellRenderer {
-                    init(params) {
-                        this.eGui = document.createElement('button');
-                        this.eGui.innerHTML = 'Editar';
-                        this.eGui.style.cssText = 'padding:3px 8px; border:none; background-color:#2c7be5; color:white; border-radius:4px; cursor:pointer;';
-                        this.eGui.addEventListener('click', (event) => {
-                            event.stopPropagation();
-                            if (params.api && params.api.deselectAll) {
-                                params.api.deselectAll();
-                            }
-                            params.node.setSelected(true);
-                        });
-                    }
-                    getGui() {
-                        return this.eGui;
-                    }
-                }
-            """)
-
-            gb_m.configure_column(
-                "acao",
-                header_name="Ação",
-                cellRenderer=button_mens_editar,
-                width=120,
-                suppressMenu=True,
-            )
-
-            gb_m.configure_selection(
-                "single",
-                use_checkbox=False,
-                rowMultiSelectWithClick=False,
-                suppressRowClickSelection=True,
-            )
-
-            grid_options_m = gb_m.build()
-            grid_mens_counter = st.session_state.get("grid_mens_counter", 0)
-
-            grid_response_m = AgGrid(
-                df_mens,
-                gridOptions=grid_options_m,
-                update_mode=GridUpdateMode.SELECTION_CHANGED,
-                fit_columns_on_grid_load=True,
-                height=400,
-                allow_unsafe_jscode=True,
-                key=f"grid_mensalidades_assoc_{grid_mens_counter}",
-            )
-
-            selected_rows_m = grid_response_m["selected_rows"]
-
-            # Só abre o diálogo se houver uma NOVA seleção (ignora cliques em células de linhas já selecionadas)
-            if selected_rows_m is not None and len(selected_rows_m) > 0:
-                row_m_id = selected_rows_m.iloc[0].get("id")
-                last_selected_id = st.session_state.get("last_selected_mensalidade_id")
-                
-                # Só abre diálogo se for uma nova seleção diferente
-                if row_m_id != last_selected_id:
-                    st.session_state["last_selected_mensalidade_id"] = row_m_id
-                    row_m = selected_rows_m.iloc[0].to_dict()
-                    dialog_editar_mensalidade(row_m)
-            else:
-                # Limpa o ID quando não há seleção
-                st.session_state.pop("last_selected_mensalidade_id", None)
+        _render_mensalidades_associado(associado["id"])
         return
 
     st.subheader("Dados pessoais")
 
-    identidade_map = {
-        "SURDO": "Surdo",
-        "SURDOCEGO": "Surdocego",
-        "DEFICIENCIA_AUDITIVA": "Deficiência Auditiva (DA)",
-        "OUVINTE": "Ouvinte",
-    }
-
     data_nasc_valor = associado.get("data_nascimento") or date(2000, 1, 1)
 
     with st.form("form_associado_dados"):
@@ -548,10 +492,10 @@ def area_associado(authenticator, username: str) -> None:
         )
         tipo_sanguineo = st.selectbox(
             "Tipo sanguíneo",
-            ["", "A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"],
+            rotulos.TIPOS_SANGUINEOS,
             index=max(
                 0,
-                ["", "A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"].index(
+                rotulos.TIPOS_SANGUINEOS.index(
                     associado.get("tipo_sanguineo") or ""
                 ),
             ),
@@ -559,12 +503,11 @@ def area_associado(authenticator, username: str) -> None:
         )
 
         identidade_codigo_atual = associado.get("identidade") or "SURDO"
-        identidade_label_atual = identidade_map.get(identidade_codigo_atual, "Surdo")
-        identidade_opcoes = list(identidade_map.values())
-        identidade_indice = identidade_opcoes.index(identidade_label_atual)
+        identidade_label_atual = rotulos.IDENTIDADE.get(identidade_codigo_atual, "Surdo")
+        identidade_indice = rotulos.IDENTIDADE_ROTULOS.index(identidade_label_atual)
         identidade_label_sel = st.selectbox(
             "Identidade",
-            identidade_opcoes,
+            rotulos.IDENTIDADE_ROTULOS,
             index=identidade_indice,
             key="assoc_identidade",
         )
@@ -581,11 +524,7 @@ def area_associado(authenticator, username: str) -> None:
 
         if submitted:
             try:
-                identidade_codigo = None
-                for codigo, label in identidade_map.items():
-                    if label == identidade_label_sel:
-                        identidade_codigo = codigo
-                        break
+                identidade_codigo = rotulos.IDENTIDADE_POR_ROTULO.get(identidade_label_sel)
                 if identidade_codigo is None:
                     raise ValueError("Identidade inválida selecionada.")
 
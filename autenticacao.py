@@ -0,0 +1,269 @@
+"""Autenticação por consulta pontual ao banco, com cookie de reautenticação.
+
+O `stauth.Authenticate` recebe o dicionário com todos os usuários e hashes
+(`usernames -> {name, password}`), montado a cada rerun. Aqui cada tentativa de
+login busca só o username digitado (`db.obter_login_ativo`, índice único de
+`login.username`), então memória e custo de inicialização não dependem do
+número de associados.
+
+Sessão:
+- o cookie `gestao_associado_cookie` mantém o formato do streamlit-authenticator
+  (JWT HS256 com `username` e `exp_date`, assinado com `GESTAO_SECRET_KEY`), de
+  modo que cookies já emitidos continuam válidos; os novos trazem também `iat`;
+- o token verificado fica em `st.session_state` e num cache do processo chaveado
+  pela assinatura do JWT. Enquanto a entrada vale (`AUTH_CACHE_TTL_SECONDS`,
+  default 60), cada rerun confirma a sessão sem decodificar o token nem ir ao
+  banco; abrir o app em outra aba com o mesmo cookie também aproveita a entrada.
+  Vencida a entrada, a sessão que já conferiu a assinatura só reconsulta o banco
+  (login ativo e `sessoes_revogadas_em`), sem decodificar o JWT de novo;
+- `db.atualizar_senha_usuario` e `db.redefinir_senha_com_token` invalidam o
+  cache (`cache.invalidar("login")`) e, no banco, trocar a senha ou desativar o
+  login grava `sessoes_revogadas_em`: tokens emitidos antes disso são recusados
+  e a sessão é encerrada no rerun seguinte à nova verificação.
+
+As chaves de `st.session_state` (`name`, `username`, `authentication_status`,
+`logout`) são as mesmas do streamlit-authenticator, e a interface
+`login(...)` / `logout(...)` é a usada pelas telas.
+"""
+
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+import extra_streamlit_components as stx
+import jwt
+import streamlit as st
+from streamlit_authenticator.utilities import Hasher
+
+import cache
+import db
+import limitador
+import metricas
+
+TTL_PADRAO = 60.0
+_CHAVES_SESSAO = ("name", "username", "authentication_status", "logout")
+_CHAVE_TOKEN = "_token_sessao"
+_CHAVE_TOKEN_RECUSADO = "_token_recusado"
+# (token, username, exp_date, emitido_em) do token com assinatura já conferida na sessão
+_CHAVE_TOKEN_VERIFICADO = "_token_verificado"
+
+# Assinatura do JWT -> (válido até [monotonic], geração de "login", username, nome)
+_sessoes: Dict[str, Tuple[float, Tuple[int, ...], str, str]] = {}
+_sessoes_lock = threading.Lock()
+_ttl: Optional[float] = None
+# Sem GESTAO_SECRET_KEY: uma chave por processo (não a cada rerun)
+_chave_temporaria = secrets.token_urlsafe(48)
+
+
+def chave_assinatura() -> Tuple[str, bool]:
+    """(chave de assinatura dos cookies, se veio de `GESTAO_SECRET_KEY`)."""
+    chave = os.environ.get("GESTAO_SECRET_KEY")
+    if chave:
+        return chave, True
+    return _chave_temporaria, False
+
+
+def _ttl_configurado() -> float:
+    global _ttl
+    if _ttl is None:
+        try:
+            _ttl = max(0.0, float(os.getenv("AUTH_CACHE_TTL_SECONDS", TTL_PADRAO)))
+        except ValueError:
+            _ttl = TTL_PADRAO
+    return _ttl
+
+
+def _assinatura(token: str) -> str:
+    return token.rpartition(".")[2]
+
+
+def _guardar_sessao(
+    token: str, username: str, nome: str, exp_date: float, geracao: Tuple[int, ...]
+) -> None:
+    ttl = _ttl_configurado()
+    if ttl <= 0:
+        return
+    agora = time.monotonic()
+    # A entrada nunca vale além da expiração do próprio token
+    valido_ate = agora + min(ttl, exp_date - time.time())
+    with _sessoes_lock:
+        obsoletas = [k for k, e in _sessoes.items() if e[0] <= agora or e[1] != geracao]
+        for k in obsoletas:
+            del _sessoes[k]
+        _sessoes[_assinatura(token)] = (valido_ate, geracao, username, nome)
+
+
+class Autenticador:
+    """Formulário de login, logout e reautenticação por cookie."""
+
+    def __init__(self, cookie_name: str, cookie_key: str, cookie_expiry_days: float = 30.0) -> None:
+        self.cookie_name = cookie_name
+        self.cookie_key = cookie_key
+        self.cookie_expiry_days = cookie_expiry_days
+        self._cookies = stx.CookieManager()
+        for chave in _CHAVES_SESSAO:
+            st.session_state.setdefault(chave, None)
+        self._conferir_sessao()
+
+    # --- Sessão ------------------------------------------------------------------
+    def _conferir_sessao(self) -> None:
+        """Confirma a sessão a cada rerun pelo token da sessão ou, sem ele, pelo cookie."""
+        token = st.session_state.get(_CHAVE_TOKEN)
+        if token is None:
+            if st.session_state.get("logout"):
+                return
+            token = st.context.cookies.get(self.cookie_name)
+            if not isinstance(token, str) or token == st.session_state.get(_CHAVE_TOKEN_RECUSADO):
+                return
+
+        login = self._validar_token(token)
+        if login is not None:
+            self._iniciar_sessao(token, *login)
+            return
+
+        st.session_state[_CHAVE_TOKEN_RECUSADO] = token
+        if st.session_state.get(_CHAVE_TOKEN) is not None:
+            # Senha trocada ou login desativado depois da emissão do token
+            self._encerrar_sessao()
+
+    def _validar_token(self, token: str) -> Optional[Tuple[str, str]]:
+        """(username, nome) do token, pelo cache do processo ou conferindo JWT e banco."""
+        agora = time.monotonic()
+        geracao = cache.geracao("login")
+        with _sessoes_lock:
+            entrada = _sessoes.get(_assinatura(token))
+        if entrada is not None and entrada[0] > agora and entrada[1] == geracao:
+            metricas.CACHE_CONSULTAS.inc(cache="sessao", resultado="hit")
+            return entrada[2], entrada[3]
+
+        metricas.CACHE_CONSULTAS.inc(cache="sessao", resultado="miss")
+        dados = self._dados_token(token)
+        if dados is None:
+            return None
+        username, exp_date, emitido_em = dados
+        if exp_date <= time.time():
+            return None
+
+        login = db.obter_login_ativo(username)
+        if not login:
+            return None
+        revogadas_em = login.get("sessoes_revogadas_em")
+        if revogadas_em is not None and emitido_em <= revogadas_em.timestamp():
+            return None
+
+        st.session_state[_CHAVE_TOKEN_VERIFICADO] = (token, username, exp_date, emitido_em)
+        _guardar_sessao(token, login["username"], login["nome"], exp_date, geracao)
+        return login["username"], login["nome"]
+
+    def _dados_token(self, token: str) -> Optional[Tuple[str, float, float]]:
+        """(username, exp_date, emitido_em) já conferidos nesta sessão ou do JWT decodificado.
+
+        A assinatura é conferida uma vez por sessão: sem `GESTAO_SECRET_KEY`, a
+        chave temporária não vale em outro processo, e decodificar de novo a cada
+        vencimento do cache derrubaria sessões válidas.
+        """
+        verificado = st.session_state.get(_CHAVE_TOKEN_VERIFICADO)
+        if verificado is not None and verificado[0] == token:
+            return verificado[1], verificado[2], verificado[3]
+        try:
+            dados = jwt.decode(token, self.cookie_key, algorithms=["HS256"])
+        except jwt.InvalidTokenError:
+            return None
+        username = dados.get("username")
+        exp_date = dados.get("exp_date")
+        if not username or not isinstance(exp_date, (int, float)):
+            return None
+        # Cookies do streamlit-authenticator não têm `iat`: emissão = expiração - validade
+        emitido_em = dados.get("iat", exp_date - self.cookie_expiry_days * 86400)
+        return username, exp_date, emitido_em
+
+    @staticmethod
+    def _iniciar_sessao(token: str, username: str, nome: str) -> None:
+        st.session_state["name"] = nome
+        st.session_state["username"] = username
+        st.session_state["authentication_status"] = True
+        st.session_state[_CHAVE_TOKEN] = token
+
+    def _encerrar_sessao(self) -> None:
+        for chave in ("name", "username", "authentication_status"):
+            st.session_state[chave] = None
+        st.session_state.pop(_CHAVE_TOKEN, None)
+        st.session_state.pop(_CHAVE_TOKEN_VERIFICADO, None)
+        # Impede que o cookie (ainda presente nesta conexão) reautentique a sessão
+        st.session_state["logout"] = True
+        try:
+            self._cookies.delete(self.cookie_name)
+        except KeyError:
+            pass
+
+    def _emitir_token(self, username: str) -> Tuple[str, float]:
+        agora = datetime.now()
+        expira_em = agora + timedelta(days=self.cookie_expiry_days)
+        token = jwt.encode(
+            {"username": username, "exp_date": expira_em.timestamp(), "iat": agora.timestamp()},
+            self.cookie_key,
+            algorithm="HS256",
+        )
+        st.session_state[_CHAVE_TOKEN_VERIFICADO] = (token, username, expira_em.timestamp(), agora.timestamp())
+        self._cookies.set(self.cookie_name, token, expires_at=expira_em)
+        return token, expira_em.timestamp()
+
+    # --- Telas -------------------------------------------------------------------
+    def verificar_credenciais(self, username: str, senha: str) -> Optional[Dict[str, str]]:
+        """Retorna o login se a senha conferir com o hash do banco; senão `None`."""
+        if not username or not senha:
+            return None
+        login = db.obter_login_ativo(username)
+        if not login or not login.get("senha_hash"):
+            return None
+        try:
+            if Hasher.check_pw(senha.strip(), login["senha_hash"]):
+                return login
+        except (TypeError, ValueError):
+            # Hash em formato inválido no banco: trata como senha incorreta
+            pass
+        return None
+
+    def login(self, location: str = "main", fields: Optional[Dict[str, str]] = None, key: str = "Login") -> None:
+        """Renderiza o formulário de login (se a sessão ainda não estiver autenticada).
+
+        O resultado fica em `st.session_state["authentication_status"]` (True, False ou None).
+        Levanta ValueError, antes de consultar o banco ou verificar a senha, se o
+        limitador de taxa recusar a tentativa (por IP ou por usuário).
+        """
+        if st.session_state.get("authentication_status"):
+            return
+
+        fields = fields or {}
+        container = st.sidebar if location == "sidebar" else st
+        form = container.form(key=key)
+        form.subheader(fields.get("Form name", "Login"))
+        username = form.text_input(fields.get("Username", "Username"), autocomplete="off")
+        senha = form.text_input(fields.get("Password", "Password"), type="password", autocomplete="off")
+        if not form.form_submit_button(fields.get("Login", "Login")):
+            return
+
+        digitos = db.normalizar_cpf(username)
+        usuario = digitos if len(digitos) == 11 else (username or "").strip().lower()
+        limitador.exigir(
+            ("login_ip", limitador.ip_cliente()),
+            ("login_usuario", usuario),
+            mensagem="Muitas tentativas de login. Aguarde alguns minutos e tente novamente.",
+        )
+        login = self.verificar_credenciais(username, senha)
+        if login is None:
+            st.session_state["authentication_status"] = False
+            return
+        token, exp_date = self._emitir_token(login["username"])
+        _guardar_sessao(token, login["username"], login["nome"], exp_date, cache.geracao("login"))
+        self._iniciar_sessao(token, login["username"], login["nome"])
+        st.session_state["logout"] = False
+
+    def logout(self, button_name: str = "Sair", location: str = "main", key: str = "Logout") -> None:
+        """Renderiza o botão de sair; ao clicar, limpa a sessão e apaga o cookie."""
+        container = st.sidebar if location == "sidebar" else st
+        if container.button(button_name, key=key):
+            self._encerrar_sessao()
@@ -0,0 +1,136 @@
+"""Mede o custo de importação da tela de login com `python -X importtime`.
+
+Importa `app` (sem executar o `main()`) em processos novos e reporta:
+- tempo cumulativo de importação do `app` (mediana das execuções)
+- os módulos de primeiro nível mais pesados
+- RSS máximo dos processos de medição
+
+Também funciona como guarda: termina com código 1 se algum módulo das áreas
+autenticadas (pandas, st_aggrid, diálogos, áreas) for carregado pelo caminho de
+login, ou se a mediana passar de `--limite-ms`. Exemplo:
+
+    python bench_importtime.py --repeticoes 5 --limite-ms 900
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+# Módulos que só devem ser importados depois do login
+MODULOS_PROIBIDOS = (
+    "pandas",
+    "st_aggrid",
+    "annotated_text",
+    "area_admin",
+    "area_associado",
+    "dialogs",
+    "grade",
+)
+
+_LINHA = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def _medir_uma_vez(modulo: str, diretorio: str) -> Dict[str, object]:
+    processo = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=diretorio,
+        capture_output=True,
+        text=True,
+    )
+    if processo.returncode != 0:
+        raise RuntimeError(f"Falha ao importar {modulo}:\n{processo.stderr[-2000:]}")
+
+    carregados = set()
+    primeiro_nivel: Dict[str, int] = {}
+    total_us = 0
+    for linha in processo.stderr.splitlines():
+        m = _LINHA.match(linha)
+        if not m:
+            continue
+        cumulativo, recuo, nome = int(m.group(2)), len(m.group(3)), m.group(4)
+        carregados.add(nome)
+        if nome == modulo and recuo == 1:
+            total_us = cumulativo
+        elif recuo == 3:
+            # Importações feitas diretamente pelo módulo medido
+            primeiro_nivel[nome] = cumulativo
+    return {"total_us": total_us, "carregados": carregados, "primeiro_nivel": primeiro_nivel}
+
+
+def _rss_maximo_filhos_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # Linux informa em KB, macOS em bytes
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(maxrss / divisor, 1)
+
+
+def executar(modulo: str, repeticoes: int, diretorio: str) -> dict:
+    medicoes = [_medir_uma_vez(modulo, diretorio) for _ in range(max(1, repeticoes))]
+    totais_ms = [m["total_us"] / 1000 for m in medicoes]
+    ultima = medicoes[-1]
+    proibidos = sorted(
+        {nome.split(".")[0] for m in medicoes for nome in m["carregados"]} & set(MODULOS_PROIBIDOS)
+    )
+    mais_pesados = sorted(ultima["primeiro_nivel"].items(), key=lambda kv: kv[1], reverse=True)[:10]
+    return {
+        "modulo": modulo,
+        "repeticoes": len(medicoes),
+        "mediana_ms": round(statistics.median(totais_ms), 1),
+        "min_ms": round(min(totais_ms), 1),
+        "max_ms": round(max(totais_ms), 1),
+        "rss_maximo_mb": _rss_maximo_filhos_mb(),
+        "mais_pesados": [{"modulo": n, "cumulativo_ms": round(us / 1000, 1)} for n, us in mais_pesados],
+        "modulos_proibidos_carregados": proibidos,
+    }
+
+
+def _imprimir(relatorio: dict) -> None:
+    print(
+        f"import {relatorio['modulo']}: mediana {relatorio['mediana_ms']} ms "
+        f"(min {relatorio['min_ms']}, max {relatorio['max_ms']}, n={relatorio['repeticoes']})"
+    )
+    if relatorio["rss_maximo_mb"] is not None:
+        print(f"RSS máximo: {relatorio['rss_maximo_mb']} MB")
+    print(f"\n{'módulo importado diretamente':<40}{'cumulativo ms':>14}")
+    for item in relatorio["mais_pesados"]:
+        print(f"{item['modulo']:<40}{item['cumulativo_ms']:>14}")
+    if relatorio["modulos_proibidos_carregados"]:
+        print("\nMódulos das áreas autenticadas carregados no login: "
+              + ", ".join(relatorio["modulos_proibidos_carregados"]))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modulo", default="app", help="módulo a importar (default: app)")
+    parser.add_argument("--repeticoes", type=int, default=5, help="processos medidos")
+    parser.add_argument("--limite-ms", type=float, default=None,
+                        help="falha se a mediana passar deste valor")
+    parser.add_argument("--json", metavar="ARQUIVO", help="grava o relatório em JSON")
+    args = parser.parse_args(argv)
+
+    diretorio = os.path.dirname(os.path.abspath(__file__))
+    relatorio = executar(args.modulo, args.repeticoes, diretorio)
+    _imprimir(relatorio)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+
+    if relatorio["modulos_proibidos_carregados"]:
+        return 1
+    if args.limite_ms is not None and relatorio["mediana_ms"] > args.limite_ms:
+        print(f"\nMediana acima do limite de {args.limite_ms} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Cache de consultas por sessão, com TTL e invalidação explícita após escritas.
+
+Cada sessão Streamlit guarda em `st.session_state` os resultados das listagens
+decoradas com `em_cache`, chaveados por função + parâmetros. Assim, reruns
+provocados apenas pela interface (digitar na busca, abrir/fechar um diálogo)
+não voltam ao banco.
+
+A invalidação é por namespace ("associados", "mensalidades"): as funções de
+escrita de `db.py` chamam `invalidar(...)` após o commit, o que incrementa um
+contador de geração compartilhado pelo processo. Entradas gravadas em outra
+geração são descartadas na próxima leitura, inclusive nas demais sessões.
+O TTL (`CACHE_TTL_SECONDS`, default 60; 0 desliga) limita o tempo em que
+alterações feitas por outro processo podem ficar invisíveis.
+
+Fora de uma sessão Streamlit (scripts, teste de carga) o cache é ignorado.
+"""
+
+import functools
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import metricas
+
+_CHAVE_SESSAO = "_cache_consultas"
+TTL_PADRAO = 60.0
+
+_geracoes: Dict[str, int] = {}
+_geracoes_lock = threading.Lock()
+_ttl: Optional[float] = None
+
+
+def _ttl_configurado() -> float:
+    global _ttl
+    if _ttl is None:
+        try:
+            _ttl = max(0.0, float(os.getenv("CACHE_TTL_SECONDS", TTL_PADRAO)))
+        except ValueError:
+            _ttl = TTL_PADRAO
+    return _ttl
+
+
+def _armazenamento() -> Optional[Dict[Tuple, Tuple[float, Tuple[int, ...], Any]]]:
+    """Dicionário de entradas da sessão atual, ou None fora de uma sessão."""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        if get_script_run_ctx() is None:
+            return None
+        import streamlit as st
+
+        return st.session_state.setdefault(_CHAVE_SESSAO, {})
+    except Exception:
+        return None
+
+
+def _geracao(namespaces: Tuple[str, ...]) -> Tuple[int, ...]:
+    with _geracoes_lock:
+        return tuple(_geracoes.get(ns, 0) for ns in namespaces)
+
+
+def geracao(*namespaces: str) -> Tuple[int, ...]:
+    """Geração atual dos namespaces, para caches do processo mantidos fora deste módulo."""
+    return _geracao(namespaces)
+
+
+def invalidar(*namespaces: str) -> None:
+    """Invalida, em todas as sessões do processo, as entradas dos namespaces informados."""
+    with _geracoes_lock:
+        for ns in namespaces:
+            _geracoes[ns] = _geracoes.get(ns, 0) + 1
+
+
+def _copiar(valor: Any) -> Any:
+    # Devolve cópias rasas das linhas para que alterações feitas pela interface
+    # não contaminem o resultado guardado.
+    if isinstance(valor, list):
+        return [dict(item) if isinstance(item, dict) else item for item in valor]
+    if isinstance(valor, dict):
+        return dict(valor)
+    return valor
+
+
+def em_cache(*namespaces: str) -> Callable:
+    """Decora uma função de leitura de `db.py`, cacheando o resultado por parâmetros."""
+
+    def decorador(func: Callable) -> Callable:
+        nome = func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            ttl = _ttl_configurado()
+            entradas = _armazenamento() if ttl > 0 else None
+            if entradas is None:
+                return func(*args, **kwargs)
+
+            chave = (nome, args, tuple(sorted(kwargs.items())))
+            agora = time.monotonic()
+            geracao = _geracao(namespaces)
+            entrada = entradas.get(chave)
+            if entrada is not None and entrada[0] > agora and entrada[1] == geracao:
+                metricas.CACHE_CONSULTAS.inc(cache=nome, resultado="hit")
+                return _copiar(entrada[2])
+
+            metricas.CACHE_CONSULTAS.inc(cache=nome, resultado="miss")
+            valor = func(*args, **kwargs)
+            # Remove entradas vencidas e as desta função gravadas em outra geração
+            obsoletas = [
+                k for k, e in entradas.items()
+                if e[0] <= agora or (k[0] == nome and e[1] != geracao)
+            ]
+            for k in obsoletas:
+                entradas.pop(k, None)
+            entradas[chave] = (agora + ttl, geracao, valor)
+            return _copiar(valor)
+
+        return wrapper
+
+    return decorador
@@ -0,0 +1,319 @@
+"""Conciliação de extrato bancário (CSV ou OFX) com as mensalidades em aberto.
+
+Fluxo de `conciliar()`:
+1. `ler_extrato` percorre o arquivo uma única vez, linha a linha (sem DataFrame),
+   e guarda só os créditos (PIX, depósitos); débitos são contados e descartados;
+2. `db.mensalidades_em_aberto` traz, em uma consulta, as mensalidades não pagas
+   com vencimento na janela coberta pelo extrato; elas vão para um índice em
+   memória (dicionário valor em centavos -> mensalidades);
+3. cada crédito consulta o índice pelo valor exato e fica com a mensalidade de
+   vencimento mais próximo dentro de `JANELA_DIAS`, preferindo as em que o CPF
+   (completo ou mascarado, `***.456.789-**`) ou o nome do associado aparecem na
+   descrição. Cada mensalidade é sugerida para um único crédito.
+
+As sugestões por CPF ou nome já vêm marcadas para confirmação; as só por valor e
+data, não. `registrar()` grava os pagamentos confirmados em uma única transação
+(`db.conciliar_pagamentos`).
+
+CSV: cabeçalho com `data`, `valor` e, opcionalmente, `descricao`/`historico` e
+`documento`/`cpf` (separador detectado automaticamente). OFX 1.x (SGML) e 2.x (XML):
+blocos `<STMTTRN>` com `DTPOSTED`, `TRNAMT`, `NAME`/`MEMO` e `FITID`.
+"""
+
+import csv
+import io
+import re
+import unicodedata
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+import pandas as pd
+
+import db
+
+# Distância máxima, em dias, entre o crédito e o vencimento da mensalidade
+JANELA_DIAS = 40
+
+# Nomes alternativos aceitos no cabeçalho do CSV (após remover acentos e pontuação)
+_SINONIMOS = {
+    "data_lancamento": "data",
+    "data_do_lancamento": "data",
+    "data_movimento": "data",
+    "valor_r": "valor",
+    "valor_rs": "valor",
+    "credito": "valor",
+    "descricao": "descricao",
+    "historico": "descricao",
+    "lancamento": "descricao",
+    "memo": "descricao",
+    "pagador": "descricao",
+    "cpf": "documento",
+    "cpf_cnpj": "documento",
+    "documento": "documento",
+}
+
+# Partículas ignoradas na comparação de nomes
+_PARTICULAS = {"DA", "DAS", "DE", "DO", "DOS", "E"}
+
+_CPF = re.compile(r"(?<!\d)(\d{3})\.?(\d{3})\.?(\d{3})-?(\d{2})(?!\d)")
+_CPF_MASCARADO = re.compile(r"\*{3}\.?(\d{3})\.?(\d{3})-?\*{2}")
+_TAG_OFX = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+_FORMATOS_DATA = (
+    (re.compile(r"\d{2}/\d{2}/\d{4}"), "%d/%m/%Y"),
+    (re.compile(r"\d{2}/\d{2}/\d{2}(?!\d)"), "%d/%m/%y"),
+    (re.compile(r"\d{4}-\d{2}-\d{2}"), "%Y-%m-%d"),
+    (re.compile(r"\d{8}"), "%Y%m%d"),
+)
+
+_COLUNAS_SUGESTOES = [
+    "confirmar", "linha", "data", "valor", "descricao",
+    "mensalidade_id", "associado", "vencimento", "criterio",
+]
+
+
+class Lancamento(NamedTuple):
+    linha: int
+    data: date
+    valor: Decimal
+    descricao: str
+    documento: str
+
+
+def _sem_acentos(texto: str) -> str:
+    return unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode()
+
+
+def _normalizar_coluna(nome: str) -> str:
+    texto = re.sub(r"[^a-z0-9]+", "_", _sem_acentos(str(nome)).lower()).strip("_")
+    return _SINONIMOS.get(texto, texto)
+
+
+def _converter_valor(texto: str) -> Optional[Decimal]:
+    """Aceita '1.234,56', '1234.56', 'R$ 50,00' e '-50,00'."""
+    texto = (texto or "").replace("R$", "").replace(" ", "").strip()
+    if not texto:
+        return None
+    if "," in texto and "." in texto:
+        # O último separador é o decimal
+        if texto.rfind(",") > texto.rfind("."):
+            texto = texto.replace(".", "").replace(",", ".")
+        else:
+            texto = texto.replace(",", "")
+    elif "," in texto:
+        texto = texto.replace(",", ".")
+    try:
+        return Decimal(texto)
+    except InvalidOperation:
+        return None
+
+
+def _converter_data(texto: str) -> Optional[date]:
+    """Aceita 'dd/mm/aaaa', 'dd/mm/aa', 'aaaa-mm-dd' e 'aaaammdd[hhmmss...]' (OFX)."""
+    texto = (texto or "").strip()
+    for padrao, formato in _FORMATOS_DATA:
+        encontrado = padrao.match(texto)
+        if encontrado:
+            try:
+                return datetime.strptime(encontrado.group(0), formato).date()
+            except ValueError:
+                return None
+    return None
+
+
+def _abrir_texto(arquivo: BinaryIO) -> io.TextIOWrapper:
+    """Texto do arquivo sem lê-lo inteiro: UTF-8 se o início for válido, senão cp1252."""
+    inicio = arquivo.read(4096)
+    arquivo.seek(0)
+    try:
+        inicio.decode("utf-8")
+        codificacao = "utf-8-sig"
+    except UnicodeDecodeError as e:
+        # Caractere multibyte cortado no fim da amostra não conta como erro
+        codificacao = "utf-8-sig" if e.start >= len(inicio) - 3 else "cp1252"
+    return io.TextIOWrapper(arquivo, encoding=codificacao, errors="replace", newline="")
+
+
+def _ler_csv(texto: io.TextIOWrapper) -> Iterator[Tuple[int, str, str, str, str]]:
+    amostra = texto.read(4096)
+    texto.seek(0)
+    try:
+        dialeto = csv.Sniffer().sniff(amostra, delimiters=";,\t")
+    except csv.Error:
+        dialeto = csv.excel
+    leitor = csv.reader(texto, dialeto)
+    cabecalho = [_normalizar_coluna(c) for c in next(leitor, [])]
+    faltando = [c for c in ("data", "valor") if c not in cabecalho]
+    if faltando:
+        raise ValueError(f"Colunas obrigatórias ausentes no extrato: {', '.join(faltando)}")
+    posicao = {coluna: cabecalho.index(coluna) for coluna in ("data", "valor", "descricao", "documento") if coluna in cabecalho}
+
+    def campo(linha: List[str], coluna: str) -> str:
+        i = posicao.get(coluna)
+        return linha[i].strip() if i is not None and i < len(linha) else ""
+
+    for numero, linha in enumerate(leitor, start=2):
+        if not any(c.strip() for c in linha):
+            continue
+        yield numero, campo(linha, "data"), campo(linha, "valor"), campo(linha, "descricao"), campo(linha, "documento")
+
+
+def _ler_ofx(texto: io.TextIOWrapper) -> Iterator[Tuple[int, str, str, str, str]]:
+    transacao: Optional[Dict[str, str]] = None
+    inicio = 0
+    for numero, linha in enumerate(texto, start=1):
+        for fechamento, tag, valor in _TAG_OFX.findall(linha):
+            tag = tag.upper()
+            if tag == "STMTTRN":
+                if fechamento and transacao is not None:
+                    descricao = " ".join(v for v in (transacao.get("NAME"), transacao.get("MEMO")) if v)
+                    yield inicio, transacao.get("DTPOSTED", ""), transacao.get("TRNAMT", ""), descricao, ""
+                    transacao = None
+                elif not fechamento:
+                    transacao, inicio = {}, numero
+            elif transacao is not None and not fechamento and valor.strip():
+                transacao[tag] = valor.strip()
+
+
+def ler_extrato(arquivo: BinaryIO, nome_arquivo: str) -> Dict[str, object]:
+    """Lê o extrato em uma única passada e separa os créditos.
+
+    Retorna {"creditos": [Lancamento, ...], "debitos": int, "erros": [(linha, erro), ...]}.
+    """
+    erros: List[Tuple[int, str]] = []
+    creditos: List[Lancamento] = []
+    debitos = 0
+    texto = _abrir_texto(arquivo)
+    try:
+        ofx = nome_arquivo.lower().endswith((".ofx", ".qfx"))
+        for numero, data_texto, valor_texto, descricao, documento in (_ler_ofx(texto) if ofx else _ler_csv(texto)):
+            data = _converter_data(data_texto)
+            valor = _converter_valor(valor_texto)
+            if data is None:
+                erros.append((numero, f"Data inválida: '{data_texto}'."))
+            elif valor is None:
+                erros.append((numero, f"Valor inválido: '{valor_texto}'."))
+            elif valor <= 0:
+                debitos += 1
+            else:
+                creditos.append(Lancamento(numero, data, valor.quantize(Decimal("0.01")), descricao, documento))
+    finally:
+        # Devolve o arquivo aberto a quem chamou (o wrapper o fecharia ao ser coletado)
+        texto.detach()
+    return {"creditos": creditos, "debitos": debitos, "erros": erros}
+
+
+def _tokens_nome(texto: str) -> Set[str]:
+    return {t for t in re.split(r"[^A-Z]+", _sem_acentos(texto).upper()) if len(t) > 1 and t not in _PARTICULAS}
+
+
+def _cpfs_no_texto(texto: str) -> Tuple[Set[str], Set[str]]:
+    """CPFs completos e trechos centrais (6 dígitos) de CPFs mascarados citados no texto."""
+    completos = {"".join(m) for m in _CPF.findall(texto)}
+    mascarados = {"".join(m) for m in _CPF_MASCARADO.findall(texto)}
+    return completos, mascarados
+
+
+def _criterio(lancamento: Lancamento, mensalidade: Dict[str, object]) -> str:
+    """'cpf', 'nome' ou 'valor e data' (só valor e janela de vencimento)."""
+    cpf = mensalidade.get("cpf_digitos") or ""
+    completos, mascarados = _cpfs_no_texto(f"{lancamento.documento} {lancamento.descricao}")
+    if cpf and (cpf in completos or cpf[3:9] in mascarados):
+        return "cpf"
+    # Primeiro e último nome do associado presentes na descrição (bancos abreviam o meio)
+    partes = str(mensalidade.get("nome_completo") or "").split()
+    if len(partes) >= 2:
+        nome = _tokens_nome(partes[0]) | _tokens_nome(partes[-1])
+        if len(nome) >= 2 and nome <= _tokens_nome(lancamento.descricao):
+            return "nome"
+    return "valor e data"
+
+
+_PRIORIDADE = {"cpf": 0, "nome": 1, "valor e data": 2}
+
+
+def _indexar(mensalidades: List[Dict[str, object]]) -> Dict[int, List[Dict[str, object]]]:
+    indice: Dict[int, List[Dict[str, object]]] = defaultdict(list)
+    for mensalidade in mensalidades:
+        indice[int(Decimal(mensalidade["valor"]) * 100)].append(mensalidade)
+    return indice
+
+
+def conciliar(arquivo: BinaryIO, nome_arquivo: str, janela_dias: int = JANELA_DIAS) -> Dict[str, object]:
+    """Lê o extrato e sugere uma mensalidade em aberto para cada crédito.
+
+    Retorna {"creditos", "debitos", "sugestoes" (DataFrame com a coluna
+    `confirmar`), "sem_correspondencia" (DataFrame) e "erros" (DataFrame linha/erro)}.
+    """
+    extrato = ler_extrato(arquivo, nome_arquivo)
+    creditos: List[Lancamento] = extrato["creditos"]
+    erros = pd.DataFrame(extrato["erros"], columns=["linha", "erro"])
+
+    sugestoes: List[Dict[str, object]] = []
+    sem_correspondencia: List[Dict[str, object]] = []
+    if creditos:
+        janela = timedelta(days=janela_dias)
+        indice = _indexar(
+            db.mensalidades_em_aberto(
+                min(c.data for c in creditos) - janela, max(c.data for c in creditos) + janela
+            )
+        )
+        # Candidatos de cada crédito: (prioridade do critério, dias até o vencimento, id, critério, mensalidade)
+        por_credito = []
+        for credito in creditos:
+            candidatos = []
+            for m in indice.get(int(credito.valor * 100), []):
+                distancia = abs((m["data_vencimento"] - credito.data).days)
+                if distancia <= janela_dias:
+                    criterio = _criterio(credito, m)
+                    candidatos.append((_PRIORIDADE[criterio], distancia, m["id"], criterio, m))
+            candidatos.sort(key=lambda c: c[:3])
+            por_credito.append((candidatos[0][:2] if candidatos else (len(_PRIORIDADE), 0), credito, candidatos))
+
+        # Créditos com CPF/nome reconhecido (e mais perto do vencimento) escolhem primeiro
+        usadas: Set[int] = set()
+        for _, credito, candidatos in sorted(por_credito, key=lambda c: (c[0], c[1].linha)):
+            escolha = next((c for c in candidatos if c[2] not in usadas), None)
+            registro = {
+                "linha": credito.linha,
+                "data": credito.data,
+                "valor": float(credito.valor),
+                "descricao": credito.descricao,
+            }
+            if escolha is None:
+                sem_correspondencia.append(registro)
+                continue
+            _, _, mensalidade_id, criterio, mensalidade = escolha
+            usadas.add(mensalidade_id)
+            sugestoes.append({
+                **registro,
+                "confirmar": criterio != "valor e data",
+                "mensalidade_id": mensalidade_id,
+                "associado": mensalidade["nome_completo"],
+                "vencimento": mensalidade["data_vencimento"],
+                "criterio": criterio,
+            })
+
+    sugestoes_df = pd.DataFrame(sugestoes, columns=_COLUNAS_SUGESTOES).sort_values("linha", kind="stable")
+    return {
+        "creditos": len(creditos),
+        "debitos": extrato["debitos"],
+        "sugestoes": sugestoes_df.reset_index(drop=True),
+        "sem_correspondencia": pd.DataFrame(sem_correspondencia, columns=["linha", "data", "valor", "descricao"]),
+        "erros": erros,
+    }
+
+
+def registrar(sugestoes: pd.DataFrame) -> List[int]:
+    """Registra os pagamentos das sugestões com `confirmar` marcado (uma transação).
+
+    Usa a data e o valor do extrato. Retorna os ids das mensalidades pagas; as que
+    foram pagas por outro caminho desde a conciliação ficam de fora.
+    """
+    confirmadas = sugestoes[sugestoes["confirmar"].fillna(False).astype(bool)]
+    itens = [
+        (int(row.mensalidade_id), row.data, Decimal(str(row.valor)))
+        for row in confirmadas.itertuples(index=False)
+    ]
+    return db.conciliar_pagamentos(itens)
@@ -1,13 +1,30 @@
+import csv
+import hashlib
+import hmac
+import io
+import logging
 import os
 import re
-from typing import Any, Dict, List, Optional
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
 
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.errors
+import psycopg2.extensions
+from psycopg2.extras import NamedTupleCursor, RealDictCursor
 from psycopg2 import sql
-import random
 from datetime import datetime, timedelta, timezone
 
+import cache
+import metricas
+import rotulos
+
+_logger_consultas_lentas = logging.getLogger(__name__ + ".consultas_lentas")
+
 
 def _read_secret_var(var_name: str, default: Optional[str] = None) -> Optional[str]:
     """Tenta obter variáveis de ambiente ou valores definidos em st.secrets."""
@@ -49,6 +66,208 @@ def _read_secret_var(var_name: str, default: Optional[str] = None) -> Optional[s
     return default
 
 
+def _nome_consulta() -> str:
+    """Nome da função de db.py que disparou a consulta (usado como rótulo de métrica)."""
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_globals.get("__name__") != __name__:
+        frame = frame.f_back
+    return frame.f_code.co_name if frame is not None else "desconhecida"
+
+
+class _CursorInstrumentado(RealDictCursor):
+    """RealDictCursor que registra a duração de cada execute() em `metricas`.
+
+    Com `DB_SLOW_QUERY_MS` definido, consultas acima do limite também vão para
+    o log de consultas lentas (ver `_registrar_consulta_lenta`).
+    """
+
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            duracao = time.perf_counter() - inicio
+            nome = _nome_consulta()
+            metricas.DB_CONSULTA_DURACAO.observe(duracao, consulta=nome)
+            limite = _limite_consulta_lenta()
+            if limite is not None and duracao * 1000 >= limite:
+                _registrar_consulta_lenta(self.connection, nome, query, vars, duracao)
+
+
+# --- Log de consultas lentas (opt-in) -----------------------------------------------
+# DB_SLOW_QUERY_MS: limite em milissegundos; sem valor, o log fica desligado.
+# DB_SLOW_QUERY_EXPLAIN: "0" desliga a captura do plano; "1" (default) usa EXPLAIN
+# simples, que não executa a consulta; "analyze" usa EXPLAIN (ANALYZE, BUFFERS).
+_config_consulta_lenta: Optional[Dict[str, Any]] = None
+# Limita a uma captura de EXPLAIN simultânea para não sobrecarregar o banco
+_explain_em_andamento = threading.Semaphore(1)
+_COMANDOS_EXPLICAVEIS = ("select", "with", "insert", "update", "delete", "values", "table")
+_COMANDOS_ESCRITA = re.compile(r"\b(insert|update|delete|merge)\b", re.IGNORECASE)
+
+
+def _modo_explain(valor: str) -> Optional[str]:
+    """Converte DB_SLOW_QUERY_EXPLAIN em None (sem plano), "simples" ou "analyze"."""
+    valor = valor.strip().lower()
+    if valor in ("0", "false", "no"):
+        return None
+    return "analyze" if valor == "analyze" else "simples"
+
+
+def _limite_consulta_lenta() -> Optional[float]:
+    """Lê (uma vez por processo) o limite configurado em DB_SLOW_QUERY_MS."""
+    global _config_consulta_lenta
+    if _config_consulta_lenta is None:
+        limite = None
+        valor = os.getenv("DB_SLOW_QUERY_MS")
+        if valor not in (None, ""):
+            try:
+                limite = float(valor)
+            except ValueError:
+                limite = None
+        _config_consulta_lenta = {
+            "limite_ms": limite,
+            "explain": _modo_explain(os.getenv("DB_SLOW_QUERY_EXPLAIN", "1")),
+        }
+    return _config_consulta_lenta["limite_ms"]
+
+
+def _redigir_parametro(valor: Any) -> str:
+    if valor is None:
+        return "NULL"
+    if isinstance(valor, (bytes, bytearray, memoryview)):
+        return f"<bytes len={len(valor)}>"
+    if isinstance(valor, (list, tuple)):
+        return f"<{type(valor).__name__} len={len(valor)}>"
+    return f"<{type(valor).__name__}>"
+
+
+def _redigir_parametros(vars: Any) -> str:
+    """Substitui os valores dos parâmetros pelo tipo (nunca registra dados pessoais)."""
+    if vars is None:
+        return "()"
+    if isinstance(vars, dict):
+        return "{" + ", ".join(f"{k!r}: {_redigir_parametro(v)}" for k, v in vars.items()) + "}"
+    try:
+        return "(" + ", ".join(_redigir_parametro(v) for v in vars) + ")"
+    except TypeError:
+        return _redigir_parametro(vars)
+
+
+def _texto_consulta(conn, query) -> str:
+    if isinstance(query, sql.Composable):
+        return query.as_string(conn)
+    if isinstance(query, bytes):
+        return query.decode("utf-8", errors="replace")
+    return str(query)
+
+
+def _capturar_plano(texto: str, vars: Any, analisar: bool = False) -> str:
+    """Executa EXPLAIN em uma conexão separada, sempre com rollback.
+
+    Por padrão o EXPLAIN é simples: só planeja, sem executar a consulta. Com
+    `analisar` (DB_SLOW_QUERY_EXPLAIN=analyze), leituras usam EXPLAIN (ANALYZE,
+    BUFFERS), que executa a consulta de novo; um SELECT que chama função com
+    efeitos (p.ex. `associado_financeiro_atualizar`, `pg_try_advisory_lock`)
+    repete esses efeitos até o rollback. Comandos de escrita sempre usam EXPLAIN
+    simples.
+    """
+    if analisar and not _COMANDOS_ESCRITA.search(texto):
+        opcoes = "(ANALYZE, BUFFERS, FORMAT TEXT)"
+    else:
+        opcoes = "(FORMAT TEXT)"
+    conn = psycopg2.connect(**_parametros_conexao())
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL statement_timeout = '10s'")
+            cur.execute("SET LOCAL lock_timeout = '1s'")
+            cur.execute(f"EXPLAIN {opcoes} {texto}", vars)
+            return "\n".join(linha[0] for linha in cur.fetchall())
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def _registrar_consulta_lenta(conn, nome: str, query, vars: Any, duracao: float) -> None:
+    """Registra a consulta lenta (parâmetros redigidos) e, se ligado, o plano."""
+    metricas.DB_CONSULTAS_LENTAS.inc(consulta=nome)
+    try:
+        texto = _texto_consulta(conn, query)
+    except Exception:  # noqa: BLE001
+        texto = repr(query)
+    resumo = " ".join(texto.split())
+    parametros = _redigir_parametros(vars)
+
+    comando = texto.lstrip().split(None, 1)[0].lower() if texto.strip() else ""
+    explicavel = _config_consulta_lenta["explain"] and comando in _COMANDOS_EXPLICAVEIS
+    if not explicavel or not _explain_em_andamento.acquire(blocking=False):
+        _logger_consultas_lentas.warning(
+            "Consulta lenta em %s (%.1f ms): %s | parâmetros: %s",
+            nome, duracao * 1000, resumo, parametros,
+        )
+        return
+
+    def _explicar() -> None:
+        try:
+            plano = _capturar_plano(texto, vars, _config_consulta_lenta["explain"] == "analyze")
+        except Exception as e:  # noqa: BLE001
+            plano = f"(falha ao capturar plano: {e})"
+        finally:
+            _explain_em_andamento.release()
+        _logger_consultas_lentas.warning(
+            "Consulta lenta em %s (%.1f ms): %s | parâmetros: %s\nPlano:\n%s",
+            nome, duracao * 1000, resumo, parametros, plano,
+        )
+
+    # Captura em segundo plano para não dobrar o tempo da requisição original
+    threading.Thread(target=_explicar, name="explain-consulta-lenta", daemon=True).start()
+
+
+class _ConexaoInstrumentada(psycopg2.extensions.connection):
+    """Conexão que mantém o medidor de conexões ativas e fecha ao sair do `with`.
+
+    O `with conn` do psycopg2 apenas faz commit/rollback; aqui a conexão também é
+    fechada, para que a contagem de conexões ativas reflita o uso real.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        metricas.DB_CONEXOES_ABERTAS.inc()
+        metricas.DB_CONEXOES_ATIVAS.inc()
+        self._contabilizada = True
+
+    def _descontar(self) -> None:
+        # Uma vez por conexão: `closed` não serve de guarda, pois o psycopg2 marca
+        # a conexão como fechada sozinho quando o servidor cai (closed == 2)
+        if getattr(self, "_contabilizada", False):
+            self._contabilizada = False
+            metricas.DB_CONEXOES_ATIVAS.dec()
+
+    def close(self):
+        self._descontar()
+        super().close()
+
+    def __del__(self):
+        # Conexão descartada sem close() (p.ex. exceção antes do `with`)
+        self._descontar()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            return super().__exit__(exc_type, exc_value, traceback)
+        finally:
+            self.close()
+
+
+def _parametros_conexao() -> Dict[str, Any]:
+    """Parâmetros de conexão lidos de variáveis de ambiente ou st.secrets."""
+    return {
+        "host": _read_secret_var("DB_HOST", "localhost"),
+        "port": int(_read_secret_var("DB_PORT", "5432")),
+        "dbname": _read_secret_var("DB_NAME", "gestao_associado_novo"),
+        "user": _read_secret_var("DB_USER", "postgres"),
+        "password": _read_secret_var("DB_PASSWORD", "postgres"),
+    }
+
+
 def get_connection():
     """Retorna uma conexão com o PostgreSQL usando variáveis de ambiente.
 
@@ -60,52 +279,59 @@ def get_connection():
     - DB_PASSWORD (default: postgres)
     """
 
-    host = _read_secret_var("DB_HOST", "localhost")
-    port = int(_read_secret_var("DB_PORT", "5432"))
-    dbname = _read_secret_var("DB_NAME", "gestao_associado_novo")
-    user = _read_secret_var("DB_USER", "postgres")
-    password = _read_secret_var("DB_PASSWORD", "postgres")
+    try:
+        return psycopg2.connect(
+            **_parametros_conexao(),
+            connection_factory=_ConexaoInstrumentada,
+            cursor_factory=_CursorInstrumentado,
+        )
+    except psycopg2.OperationalError:
+        metricas.DB_CONEXOES_FALHAS.inc()
+        raise
 
-    return psycopg2.connect(
-        host=host,
-        port=port,
-        dbname=dbname,
-        user=user,
-        password=password,
-        cursor_factory=RealDictCursor,
-    )
 
+def normalizar_cpf(cpf: Optional[str]) -> str:
+    """Retorna apenas os dígitos do CPF (forma usada em `login.username` e `associado.cpf_digitos`)."""
+    return re.sub(r"\D", "", cpf or "")
 
-def carregar_credenciais() -> Dict[str, Dict[str, Dict[str, str]]]:
-    """Carrega usuários ativos da tabela `login` e monta o dict de credenciais
-    esperado pelo streamlit-authenticator.
-    Estrutura retornada:
-    {
-        "usernames": {
-            "admin": {"name": "Administrador", "password": "<hash>"},
-            ...
-        }
-    }
+
+def formatar_cpf(cpf: Optional[str]) -> str:
+    """Formata o CPF como 000.000.000-00; valores sem 11 dígitos voltam sem alteração."""
+    digitos = normalizar_cpf(cpf)
+    if len(digitos) != 11:
+        return cpf or ""
+    return f"{digitos[:3]}.{digitos[3:6]}.{digitos[6:9]}-{digitos[9:]}"
+
+
+def obter_login_ativo(username: str) -> Optional[Dict[str, Any]]:
+    """Busca pontual do login ativo usado na autenticação.
+
+    Retorna id, username, nome, senha_hash e sessoes_revogadas_em.
+
+    Aceita o username como gravado em `login.username` ou o CPF formatado do
+    associado (mesmos dígitos do username). Consulta só as linhas candidatas,
+    pelo índice único de `login.username`; devolve `None` se não houver login ativo.
     """
-    credentials: Dict[str, Dict[str, Dict[str, str]]] = {"usernames": {}}
+    username = (username or "").strip().lower()
+    if not username:
+        return None
+    digitos = normalizar_cpf(username)
+    alternativo = digitos if len(digitos) == 11 else username
     with get_connection() as conn:
         with conn.cursor() as cur:
+            # O username exato tem precedência sobre o CPF convertido em dígitos
             cur.execute(
-                "SELECT username, nome, senha_hash, ativo FROM login WHERE ativo = TRUE"
+                """
+                SELECT id, username, nome, senha_hash, sessoes_revogadas_em
+                FROM login
+                WHERE ativo = TRUE AND username IN (%(username)s, %(alternativo)s)
+                ORDER BY username = %(username)s DESC
+                LIMIT 1
+                """,
+                {"username": username, "alternativo": alternativo},
             )
-            for row in cur.fetchall():
-                username = row["username"]
-                nome = row["nome"]
-                senha_hash = row["senha_hash"]
-                base_entry = {"name": nome, "password": senha_hash}
-                credentials["usernames"][username] = base_entry
-                if re.fullmatch(r"\d{11}", username):
-                    cpf_formatado = (
-                        f"{username[:3]}.{username[3:6]}.{username[6:9]}-"
-                        f"{username[9:]}"
-                    )
-                    credentials["usernames"].setdefault(cpf_formatado, base_entry)
-    return credentials
+            row = cur.fetchone()
+    return dict(row) if row else None
 
 
 def inserir_usuario(username: str, nome: str, senha_hash: str) -> None:
@@ -150,47 +376,223 @@ def obter_login_por_email(email: str) -> Optional[dict]:
             return row if row else None
 
 
+def _chave_tokens() -> Optional[bytes]:
+    chave = os.environ.get("GESTAO_SECRET_KEY")
+    return chave.encode("utf-8") if chave else None
+
+
+def _hash_token(login_id: int, codigo: str) -> str:
+    """HMAC-SHA256 do código de redefinição, gravado no lugar do código.
+
+    Com só 10^8 códigos possíveis, um hash sem chave seria revertido por força
+    bruta; a chave é a `GESTAO_SECRET_KEY`, obrigatória: uma chave aleatória por
+    processo invalidaria os códigos em outra réplica ou após um reinício.
+    """
+    chave = _chave_tokens()
+    if chave is None:
+        raise ValueError(
+            "Redefinição de senha indisponível: defina a variável de ambiente GESTAO_SECRET_KEY."
+        )
+    mensagem = f"{login_id}:{(codigo or '').strip()}".encode("utf-8")
+    return hmac.new(chave, mensagem, hashlib.sha256).hexdigest()
+
+
 def inserir_token_redefinicao(login_id: int, codigo: str = None) -> dict:
-    """Insere um token de redefinição para o `login_id` e retorna dict com token e expiração."""
+    """Insere um token de redefinição para o `login_id` e retorna dict com token e expiração.
+
+    O banco guarda só o HMAC do código (`token_hash`); o código em claro é
+    devolvido uma única vez, para o envio por e-mail.
+    """
     if codigo is None:
-        codigo = str(random.randint(10**7, 10**8 - 1))  # 8 dígitos
+        codigo = str(10**7 + secrets.randbelow(9 * 10**7))  # 8 dígitos
     agora = datetime.now(timezone.utc)
     expira = agora + timedelta(minutes=15)
     with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
-                "INSERT INTO password_reset_tokens (login_id, token, expira_em) VALUES (%s, %s, %s) RETURNING id",
-                (login_id, codigo, expira),
+                "INSERT INTO password_reset_tokens (login_id, token_hash, expira_em) VALUES (%s, %s, %s) RETURNING id",
+                (login_id, _hash_token(login_id, codigo), expira),
             )
             row = cur.fetchone()
             conn.commit()
             return {"id": row["id"], "token": codigo, "expira_em": expira}
 
 
-def obter_token_ativo(login_id: int, token: str) -> Optional[dict]:
-    """Retorna a linha do token se existir, não usado e não expirado."""
-    agora = datetime.now(timezone.utc)
+def redefinir_senha_com_token(login_id: int, codigo: str, nova_senha_hash: str) -> Optional[str]:
+    """Consome o código de redefinição e troca a senha em um único comando.
+
+    O UPDATE do token só casa com código válido, não usado e não expirado; a
+    troca de senha usa o que ele retornou. Duas requisições simultâneas com o
+    mesmo código não conseguem usá-lo duas vezes: a segunda espera o bloqueio
+    da linha e deixa de casar com `usado = FALSE`.
+
+    Retorna o username cuja senha foi alterada, ou `None` se o código for
+    inválido, expirado ou já utilizado.
+    """
     with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
-                "SELECT id, login_id, token, usado, criado_em, expira_em FROM password_reset_tokens WHERE login_id = %s AND token = %s AND usado = FALSE AND expira_em > %s",
-                (login_id, token, agora),
+                """
+                WITH token AS (
+                    UPDATE password_reset_tokens
+                    SET usado = TRUE, usado_em = now()
+                    WHERE login_id = %(login_id)s
+                      AND token_hash = %(token_hash)s
+                      AND usado = FALSE
+                      AND expira_em > now()
+                    RETURNING login_id
+                )
+                UPDATE login l
+                SET senha_hash = %(senha_hash)s
+                FROM (SELECT DISTINCT login_id FROM token) t
+                WHERE l.id = t.login_id
+                RETURNING l.username
+                """,
+                {
+                    "login_id": login_id,
+                    "token_hash": _hash_token(login_id, codigo),
+                    "senha_hash": nova_senha_hash,
+                },
             )
             row = cur.fetchone()
-            return row if row else None
+    if row is None:
+        return None
+    cache.invalidar("login")
+    return row["username"]
 
 
-def consumir_token(login_id: int, token: str) -> None:
-    """Marca o token como usado (used=true) e registra `usado_em`."""
-    agora = datetime.now(timezone.utc)
+def remover_tokens_expirados(corte: datetime, lote: int = 1000) -> int:
+    """Remove um lote de códigos de redefinição que expiraram antes de `corte`.
+
+    Códigos usados também saem por aqui (expiram 15 minutos após a emissão).
+    Cada chamada é uma transação curta; retorna quantas linhas foram removidas.
+    """
     with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
-                "UPDATE password_reset_tokens SET usado = TRUE, usado_em = %s WHERE login_id = %s AND token = %s",
-                (agora, login_id, token),
+                """
+                DELETE FROM password_reset_tokens
+                WHERE id IN (
+                    SELECT id
+                    FROM password_reset_tokens
+                    WHERE expira_em < %s
+                    ORDER BY expira_em
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                """,
+                (corte, lote),
             )
-            conn.commit()
-    
+            return cur.rowcount
+
+
+def consumir_limite_taxa(chave: str, capacidade: float, recarga_por_segundo: float) -> bool:
+    """Consome uma ficha do balde `chave` em `limite_taxa`; False se estiver vazio.
+
+    Recarga e consumo acontecem no mesmo UPSERT, atômico entre processos. Balde
+    vazio não é alterado (o WHERE do DO UPDATE falha e nada é retornado).
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO limite_taxa AS l (chave, tokens, atualizado_em)
+                VALUES (%(chave)s, %(capacidade)s - 1, now())
+                ON CONFLICT (chave) DO UPDATE
+                SET tokens = LEAST(
+                        %(capacidade)s,
+                        l.tokens + EXTRACT(EPOCH FROM now() - l.atualizado_em) * %(recarga)s
+                    ) - 1,
+                    atualizado_em = now()
+                WHERE LEAST(
+                        %(capacidade)s,
+                        l.tokens + EXTRACT(EPOCH FROM now() - l.atualizado_em) * %(recarga)s
+                    ) >= 1
+                RETURNING tokens
+                """,
+                {"chave": chave, "capacidade": capacidade, "recarga": recarga_por_segundo},
+            )
+            return cur.fetchone() is not None
+
+
+def remover_limites_taxa_ociosos(corte: datetime) -> int:
+    """Remove baldes sem uso desde `corte` (já estariam cheios de novo)."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM limite_taxa WHERE atualizado_em < %s", (corte,))
+            return cur.rowcount
+
+
+@contextmanager
+def trava_consultiva(chave: str) -> Iterator[bool]:
+    """Tenta obter, sem esperar, a trava consultiva (`pg_try_advisory_lock`) da chave.
+
+    Entrega True se a trava foi obtida; ela vale até a saída do `with` (a conexão
+    dedicada é fechada ao final, o que também a libera se o processo cair). Usada
+    pelo agendador para que só uma réplica execute cada tarefa.
+    """
+    with get_connection() as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(hashtext(%s)) AS obtida", (chave,))
+            obtida = cur.fetchone()["obtida"]
+            try:
+                yield obtida
+            finally:
+                if obtida and not conn.closed:
+                    cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (chave,))
+
+
+def ultima_execucao_agendada(tarefa: str) -> Optional[datetime]:
+    """Horário agendado da última execução registrada da tarefa (ou None)."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT agendada_para FROM agendador_execucao WHERE tarefa = %s", (tarefa,))
+            row = cur.fetchone()
+            return row["agendada_para"] if row else None
+
+
+def registrar_execucao_agendada(
+    tarefa: str,
+    agendada_para: datetime,
+    inicio: datetime,
+    duracao_ms: float,
+    sucesso: bool,
+    mensagem: Optional[str],
+    instancia: str,
+) -> None:
+    """Grava (substituindo a anterior) a última execução da tarefa."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO agendador_execucao
+                    (tarefa, agendada_para, inicio, duracao_ms, sucesso, mensagem, instancia)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (tarefa) DO UPDATE
+                SET agendada_para = EXCLUDED.agendada_para,
+                    inicio = EXCLUDED.inicio,
+                    duracao_ms = EXCLUDED.duracao_ms,
+                    sucesso = EXCLUDED.sucesso,
+                    mensagem = EXCLUDED.mensagem,
+                    instancia = EXCLUDED.instancia
+                """,
+                (tarefa, agendada_para, inicio, duracao_ms, sucesso, mensagem, instancia),
+            )
+
+
+def listar_execucoes_agendadas() -> List[Dict[str, Any]]:
+    """Última execução de cada tarefa do agendador (qualquer réplica)."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT tarefa, agendada_para, inicio, duracao_ms, sucesso, mensagem, instancia
+                FROM agendador_execucao
+                ORDER BY tarefa
+                """
+            )
+            return cur.fetchall()
 
 
 def obter_login_id(username: str) -> Optional[int]:
@@ -241,6 +643,8 @@ def atualizar_senha_usuario(username: str, nova_senha_hash: str) -> None:
                 (nova_senha_hash, username)
             )
             conn.commit()
+    # Sessões verificadas em cache (autenticacao.py) voltam a ser conferidas no banco
+    cache.invalidar("login")
 
 
 def inserir_associado(
@@ -261,54 +665,77 @@ def inserir_associado(
 ) -> None:
     """Insere um novo associado vinculado a um login existente.
 
-    Valida duplicidade de CPF.
+    O CPF é gravado formatado; a duplicidade é verificada pelo índice único de
+    `cpf_digitos`, independente da formatação digitada.
     """
 
     with get_connection() as conn:
         with conn.cursor() as cur:
-            # Verifica se já existe associado com esse CPF
-            cur.execute("SELECT 1 FROM associado WHERE cpf = %s", (cpf,))
-            if cur.fetchone():
+            try:
+                cur.execute(
+                    """
+                    INSERT INTO associado (
+                        login_id,
+                        cpf,
+                        foto,
+                        nome_completo,
+                        data_nascimento,
+                        email,
+                        telefone,
+                        endereco,
+                        cidade,
+                        estado_uf,
+                        situacao_trabalho,
+                        tipo_sanguineo,
+                        quantidade_filhos,
+                        identidade
+                    )
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """,
+                    (
+                        login_id,
+                        formatar_cpf(cpf),
+                        foto_bytes,
+                        nome_completo,
+                        data_nascimento,
+                        email,
+                        telefone,
+                        endereco,
+                        cidade,
+                        estado_uf,
+                        situacao_trabalho,
+                        tipo_sanguineo,
+                        quantidade_filhos,
+                        identidade,
+                    ),
+                )
+            except psycopg2.errors.UniqueViolation:
                 raise ValueError("CPF já cadastrado")
+    cache.invalidar("associados")
 
-            cur.execute(
-                """
-                INSERT INTO associado (
-                    login_id,
-                    cpf,
-                    foto,
-                    nome_completo,
-                    data_nascimento,
-                    email,
-                    telefone,
-                    endereco,
-                    cidade,
-                    estado_uf,
-                    situacao_trabalho,
-                    tipo_sanguineo,
-                    quantidade_filhos,
-                    identidade
+
+def obter_associado_por_username(username: str) -> Optional[Dict[str, Any]]:
+    """Retorna o associado do usuário logado, ou None.
+
+    Ponto único de busca por CPF: aceita o CPF com ou sem formatação (casado com
+    `cpf_digitos`) e, para logins que não são CPF, o username da tabela `login`.
+    """
+    digitos = normalizar_cpf(username)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            if len(digitos) == 11:
+                cur.execute("SELECT * FROM associado WHERE cpf_digitos = %s", (digitos,))
+            else:
+                cur.execute(
+                    """
+                    SELECT a.*
+                    FROM associado a
+                    JOIN login l ON l.id = a.login_id
+                    WHERE l.username = %s
+                    """,
+                    (username,),
                 )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """,
-                (
-                    login_id,
-                    cpf,
-                    foto_bytes,
-                    nome_completo,
-                    data_nascimento,
-                    email,
-                    telefone,
-                    endereco,
-                    cidade,
-                    estado_uf,
-                    situacao_trabalho,
-                    tipo_sanguineo,
-                    quantidade_filhos,
-                    identidade,
-                ),
-            )
-    
+            return cur.fetchone()
 
 
 def obter_associado_por_login_id(login_id: int) -> Optional[Dict[str, Any]]:
@@ -321,8 +748,8 @@ def obter_associado_por_login_id(login_id: int) -> Optional[Dict[str, Any]]:
             return row
 
 
-def listar_associados() -> List[Dict[str, Any]]:
-    """Retorna a lista de associados com informações básicas e dados de login."""
+def obter_associado_por_id(associado_id: int) -> Optional[Dict[str, Any]]:
+    """Retorna o registro completo do associado (com foto e dados de login), ou None."""
 
     with get_connection() as conn:
         with conn.cursor() as cur:
@@ -354,10 +781,11 @@ def listar_associados() -> List[Dict[str, Any]]:
                     l.nome AS nome_login
                 FROM associado a
                 JOIN login l ON a.login_id = l.id
-                ORDER BY a.nome_completo
-                """
+                WHERE a.id = %s
+                """,
+                (associado_id,),
             )
-            return cur.fetchall()
+            return cur.fetchone()
 
 
 def atualizar_associado_completo(
@@ -385,94 +813,358 @@ def atualizar_associado_completo(
 ) -> None:
     """Atualiza todos os dados do associado e mantém username (login) consistente com o CPF.
 
-    - Garante unicidade de CPF na tabela associado.
+    - Garante unicidade de CPF (índice único de `associado.cpf_digitos` e de `login.username`).
     - Atualiza o username na tabela login para os dígitos do CPF informado.
     """
 
+    cpf_digitos = normalizar_cpf(cpf)
+    if len(cpf_digitos) != 11:
+        raise ValueError("CPF deve conter 11 dígitos.")
+
     with get_connection() as conn:
         with conn.cursor() as cur:
-            # Verifica duplicidade de CPF em outros associados
-            cur.execute(
-                "SELECT id FROM associado WHERE cpf = %s AND id <> %s",
-                (cpf, associado_id),
-            )
-            if cur.fetchone():
+            try:
+                # Atualiza dados do associado (CPF sempre gravado formatado)
+                cur.execute(
+                    """
+                    UPDATE associado
+                    SET
+                        cpf = %s,
+                        nome_completo = %s,
+                        foto = %s,
+                        data_nascimento = %s,
+                        email = %s,
+                        telefone = %s,
+                        endereco = %s,
+                        cidade = %s,
+                        estado_uf = %s,
+                        situacao_trabalho = %s,
+                        tipo_sanguineo = %s,
+                        quantidade_filhos = %s,
+                        identidade = %s,
+                        data_inicio = %s,
+                        data_desligamento = %s,
+                        motivo_desligamento = %s,
+                        situacao_associado = %s,
+                        tipo_associado = %s,
+                        ciclo_cobranca = %s
+                    WHERE id = %s
+                    """,
+                    (
+                        formatar_cpf(cpf_digitos),
+                        nome_completo,
+                        foto_bytes,
+                        data_nascimento,
+                        email,
+                        telefone,
+                        endereco,
+                        cidade,
+                        estado_uf,
+                        situacao_trabalho,
+                        tipo_sanguineo,
+                        quantidade_filhos,
+                        identidade,
+                        data_inicio,
+                        data_desligamento,
+                        motivo_desligamento,
+                        situacao_associado,
+                        tipo_associado,
+                        ciclo_cobranca,
+                        associado_id,
+                    ),
+                )
+
+                # Atualiza username e nome na tabela login, mantendo CPF (somente dígitos)
+                cur.execute(
+                    """
+                    UPDATE login
+                    SET username = %s,
+                        nome = %s
+                    WHERE id = %s
+                    """,
+                    (cpf_digitos, nome_completo, login_id),
+                )
+            except psycopg2.errors.UniqueViolation:
                 raise ValueError("CPF já cadastrado")
 
-            # Atualiza dados do associado
-            cur.execute(
-                """
-                UPDATE associado
-                SET
-                    cpf = %s,
-                    nome_completo = %s,
-                    foto = %s,
-                    data_nascimento = %s,
-                    email = %s,
-                    telefone = %s,
-                    endereco = %s,
-                    cidade = %s,
-                    estado_uf = %s,
-                    situacao_trabalho = %s,
-                    tipo_sanguineo = %s,
-                    quantidade_filhos = %s,
-                    identidade = %s,
-                    data_inicio = %s,
-                    data_desligamento = %s,
-                    motivo_desligamento = %s,
-                    situacao_associado = %s,
-                    tipo_associado = %s,
-                    ciclo_cobranca = %s
-                WHERE id = %s
+            conn.commit()
+            cache.invalidar("associados", "mensalidades")
+
+
+# --- Importação em lote ------------------------------------------------------------
+# Colunas da tabela temporária usada por importar_associados_em_lote, na ordem do COPY
+COLUNAS_IMPORTACAO = (
+    "linha",
+    "username",
+    "senha_hash",
+    "cpf",
+    "nome_completo",
+    "data_nascimento",
+    "email",
+    "telefone",
+    "endereco",
+    "cidade",
+    "estado_uf",
+    "situacao_trabalho",
+    "tipo_sanguineo",
+    "quantidade_filhos",
+    "identidade",
+)
+
+
+def cpfs_cadastrados(cpfs_digitos: List[str]) -> set:
+    """Dentre os CPFs (somente dígitos) informados, retorna os que já têm login ou associado."""
+    if not cpfs_digitos:
+        return set()
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT username AS cpf FROM login WHERE username = ANY(%(cpfs)s)
+                UNION
+                SELECT cpf_digitos FROM associado WHERE cpf_digitos = ANY(%(cpfs)s)
                 """,
-                (
-                    cpf,
-                    nome_completo,
-                    foto_bytes,
-                    data_nascimento,
-                    email,
-                    telefone,
-                    endereco,
-                    cidade,
-                    estado_uf,
-                    situacao_trabalho,
-                    tipo_sanguineo,
-                    quantidade_filhos,
-                    identidade,
-                    data_inicio,
-                    data_desligamento,
-                    motivo_desligamento,
-                    situacao_associado,
-                    tipo_associado,
-                    ciclo_cobranca,
-                    associado_id,
-                ),
+                {"cpfs": list(cpfs_digitos)},
             )
+            return {row["cpf"] for row in cur.fetchall()}
+
+
+def importar_associados_em_lote(registros: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Cria logins e associados em lote, em uma única transação.
+
+    Os registros (chaves de `COLUNAS_IMPORTACAO`, senha já hasheada) vão por COPY
+    para uma tabela temporária; dali, um único INSERT ... SELECT cria os logins e
+    os associados. Linhas cujo CPF passou a existir no banco depois da validação
+    são descartadas e devolvidas em `conflitos` (número da linha na planilha).
+
+    Retorna {"inseridos": int, "conflitos": [linha, ...]}.
+    """
+    if not registros:
+        return {"inseridos": 0, "conflitos": []}
+
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    for registro in registros:
+        escritor.writerow([registro.get(coluna) for coluna in COLUNAS_IMPORTACAO])
+    buffer.seek(0)
 
-            # Atualiza username e nome na tabela login, mantendo CPF (somente dígitos)
-            cpf_digits = re.sub(r"\D", "", cpf or "")
-            if len(cpf_digits) != 11:
-                raise ValueError("CPF deve conter 11 dígitos.")
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                CREATE TEMP TABLE importacao_associado (
+                    linha INTEGER NOT NULL,
+                    username VARCHAR(50) NOT NULL,
+                    senha_hash VARCHAR(255) NOT NULL,
+                    cpf VARCHAR(14) NOT NULL,
+                    nome_completo VARCHAR(150) NOT NULL,
+                    data_nascimento DATE,
+                    email VARCHAR(150),
+                    telefone VARCHAR(20),
+                    endereco TEXT,
+                    cidade VARCHAR(100),
+                    estado_uf VARCHAR(10),
+                    situacao_trabalho VARCHAR(100),
+                    tipo_sanguineo VARCHAR(3),
+                    quantidade_filhos INTEGER,
+                    identidade VARCHAR(30) NOT NULL
+                ) ON COMMIT DROP
+                """
+            )
+            cur.copy_expert(
+                sql.SQL("COPY importacao_associado ({}) FROM STDIN WITH (FORMAT csv)").format(
+                    sql.SQL(", ").join(map(sql.Identifier, COLUNAS_IMPORTACAO))
+                ),
+                buffer,
+            )
 
             cur.execute(
                 """
-                UPDATE login
-                SET username = %s,
-                    nome = %s
-                WHERE id = %s
-                """,
-                (cpf_digits, nome_completo, login_id),
+                DELETE FROM importacao_associado s
+                WHERE EXISTS (SELECT 1 FROM login l WHERE l.username = s.username)
+                   OR EXISTS (SELECT 1 FROM associado a WHERE a.cpf_digitos = s.username)
+                RETURNING s.linha
+                """
             )
+            conflitos = sorted(row["linha"] for row in cur.fetchall())
+
+            try:
+                cur.execute(
+                    """
+                    WITH novos_logins AS (
+                        INSERT INTO login (username, nome, senha_hash, ativo)
+                        SELECT username, left(nome_completo, 100), senha_hash, TRUE
+                        FROM importacao_associado
+                        ORDER BY linha
+                        RETURNING id, username
+                    )
+                    INSERT INTO associado (
+                        login_id,
+                        cpf,
+                        nome_completo,
+                        data_nascimento,
+                        email,
+                        telefone,
+                        endereco,
+                        cidade,
+                        estado_uf,
+                        situacao_trabalho,
+                        tipo_sanguineo,
+                        quantidade_filhos,
+                        identidade
+                    )
+                    SELECT
+                        n.id,
+                        s.cpf,
+                        s.nome_completo,
+                        s.data_nascimento,
+                        s.email,
+                        s.telefone,
+                        s.endereco,
+                        s.cidade,
+                        s.estado_uf,
+                        s.situacao_trabalho,
+                        s.tipo_sanguineo,
+                        s.quantidade_filhos,
+                        s.identidade
+                    FROM importacao_associado s
+                    JOIN novos_logins n ON n.username = s.username
+                    """
+                )
+            except psycopg2.errors.UniqueViolation:
+                raise ValueError(
+                    "Outro cadastro com CPF da planilha foi criado durante a importação. Tente novamente."
+                )
+            inseridos = cur.rowcount
 
             conn.commit()
+    cache.invalidar("associados")
+    return {"inseridos": inseridos, "conflitos": conflitos}
+
+
+# --- Exportação ---------------------------------------------------------------------
+def _sql_rotulo(coluna: str, rotulos_por_codigo: Mapping[Any, str]) -> sql.Composable:
+    """CASE que traduz o código da coluna para o rótulo exibido na interface."""
+    return sql.SQL("CASE {} {} END").format(
+        sql.SQL(coluna),
+        sql.SQL(" ").join(
+            sql.SQL("WHEN {} THEN {}").format(sql.Literal(codigo), sql.Literal(rotulo))
+            for codigo, rotulo in rotulos_por_codigo.items()
+        ),
+    )
+
+
+def _consulta_exportacao(nome: str) -> sql.Composable:
+    """SELECT de cada exportação, já com os rótulos resolvidos no banco (sem foto/comprovante)."""
+    if nome == "associados":
+        return sql.SQL(
+            """
+            SELECT
+                a.cpf AS "CPF",
+                a.nome_completo AS "Nome completo",
+                {identidade} AS "Identidade",
+                a.data_nascimento AS "Data de nascimento",
+                a.email AS "E-mail",
+                a.telefone AS "Telefone",
+                a.endereco AS "Endereço",
+                a.cidade AS "Cidade",
+                a.estado_uf AS "UF",
+                a.situacao_trabalho AS "Situação de trabalho",
+                a.tipo_sanguineo AS "Tipo sanguíneo",
+                a.quantidade_filhos AS "Quantidade de filhos",
+                {tipo} AS "Tipo",
+                {situacao} AS "Situação",
+                {ciclo} AS "Ciclo de cobrança",
+                a.data_inicio AS "Data de início",
+                a.data_desligamento AS "Data de desligamento",
+                a.motivo_desligamento AS "Motivo do desligamento"
+            FROM associado a
+            ORDER BY a.nome_completo, a.id
+            """
+        ).format(
+            identidade=_sql_rotulo("a.identidade", rotulos.IDENTIDADE),
+            tipo=_sql_rotulo("a.tipo_associado", rotulos.TIPO_ASSOCIADO),
+            situacao=_sql_rotulo("a.situacao_associado", rotulos.SITUACAO_ASSOCIADO),
+            ciclo=_sql_rotulo("a.ciclo_cobranca", rotulos.CICLO_COBRANCA),
+        )
+    if nome == "mensalidades":
+        return sql.SQL(
+            """
+            SELECT
+                a.cpf AS "CPF",
+                a.nome_completo AS "Associado",
+                m.valor AS "Valor",
+                m.data_emissao AS "Emissão",
+                m.data_vencimento AS "Vencimento",
+                sm.descricao AS "Status da mensalidade",
+                p.valor_pagamento AS "Valor pago",
+                p.data_pagamento AS "Data do pagamento",
+                sp.descricao AS "Status do pagamento"
+            FROM mensalidade m
+            JOIN associado a ON a.id = m.associado_id
+            JOIN status_mensalidade sm ON sm.id = m.status_mensalidade_id
+            LEFT JOIN pagamento p ON p.id = m.pagamento_id
+            LEFT JOIN status_pagamento sp ON sp.id = p.status_pagamento_id
+            ORDER BY m.data_vencimento DESC, a.nome_completo, m.id
+            """
+        )
+    raise ValueError(f"Exportação desconhecida: {nome}")
+
+
+def copiar_exportacao_csv(nome: str, destino: BinaryIO) -> None:
+    """Grava a exportação em CSV (';', com cabeçalho) direto do servidor via COPY TO STDOUT.
+
+    Os dados passam em blocos do socket para `destino`, sem montar linhas em Python.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            consulta = _consulta_exportacao(nome).as_string(conn)
+            cur.copy_expert(
+                f"COPY ({consulta}) TO STDOUT WITH (FORMAT csv, HEADER true, DELIMITER ';')",
+                destino,
+            )
+
+
+def iterar_exportacao(nome: str, tamanho_lote: int = 2000) -> Iterator[Tuple[Any, ...]]:
+    """Itera a exportação em tuplas: primeiro o cabeçalho, depois as linhas.
+
+    Usa um cursor nomeado (do lado do servidor), buscando `tamanho_lote` linhas por
+    vez; a memória usada não depende do tamanho da tabela.
+    """
+    with get_connection() as conn:
+        with conn.cursor(name=f"exportacao_{nome}", cursor_factory=psycopg2.extensions.cursor) as cur:
+            cur.itersize = tamanho_lote
+            cur.execute(_consulta_exportacao(nome))
+            lote = cur.fetchmany(tamanho_lote)
+            yield tuple(coluna.name for coluna in cur.description)
+            while lote:
+                yield from lote
+                lote = cur.fetchmany(tamanho_lote)
+
+
+_init_db_lock = threading.Lock()
+_banco_inicializado = False
+# None até init_db (ou a primeira busca) verificar se pg_trgm está instalado
+_trigrama_disponivel: Optional[bool] = None
 
 
 def init_db() -> None:
     """Garante que o banco gestao_associado_novo e a tabela login existam.
 
-    Executa apenas comandos idempotentes (CREATE IF NOT EXISTS / ON CONFLICT DO NOTHING).
+    Executa apenas comandos idempotentes (CREATE IF NOT EXISTS / ON CONFLICT DO NOTHING),
+    uma única vez por processo: os reruns seguintes do Streamlit não repetem o DDL.
     """
+    global _banco_inicializado
+    if _banco_inicializado:
+        return
+    with _init_db_lock:
+        if not _banco_inicializado:
+            _executar_init_db()
+            _banco_inicializado = True
+
 
+def _executar_init_db() -> None:
+    """Cria/migra o schema; chamada uma vez por processo por `init_db`."""
     host = os.getenv("DB_HOST", "localhost")
     port = int(os.getenv("DB_PORT", "5432"))
     dbname = os.getenv("DB_NAME", "gestao_associado_novo")
@@ -510,6 +1202,11 @@ def init_db() -> None:
                 )
                 """
             )
+            # Troca de senha ou desativação invalida os cookies emitidos antes dela
+            cur.execute(
+                "ALTER TABLE login ADD COLUMN IF NOT EXISTS sessoes_revogadas_em TIMESTAMPTZ"
+            )
+            _criar_gatilho_revogacao_sessoes(cur)
 
             cur.execute(
                 """
@@ -564,6 +1261,16 @@ def init_db() -> None:
                 "ALTER TABLE associado ADD COLUMN IF NOT EXISTS ciclo_cobranca INTEGER DEFAULT 1"
             )
 
+            # CPF somente dígitos, mantido pelo banco: junções com login.username e
+            # checagem de duplicidade sem reformatar o CPF em Python ou SQL
+            cur.execute(
+                """
+                ALTER TABLE associado ADD COLUMN IF NOT EXISTS cpf_digitos VARCHAR(14)
+                    GENERATED ALWAYS AS (regexp_replace(cpf, '\\D', '', 'g')) STORED
+                """
+            )
+            _criar_indice_unico_cpf_digitos(cur)
+
             # Tabelas auxiliares de status
             cur.execute(
                 """
@@ -646,7 +1353,8 @@ def init_db() -> None:
                 CREATE TABLE IF NOT EXISTS password_reset_tokens (
                     id SERIAL PRIMARY KEY,
                     login_id INTEGER NOT NULL REFERENCES login(id) ON DELETE CASCADE,
-                    token VARCHAR(16) NOT NULL,
+                    token VARCHAR(16),
+                    token_hash CHAR(64),
                     usado BOOLEAN NOT NULL DEFAULT FALSE,
                     criado_em TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
                     expira_em TIMESTAMP WITH TIME ZONE NOT NULL,
@@ -654,6 +1362,61 @@ def init_db() -> None:
                 )
                 """
             )
+            # Códigos passam a ser gravados só como HMAC (token_hash)
+            cur.execute(
+                "ALTER TABLE password_reset_tokens ADD COLUMN IF NOT EXISTS token_hash CHAR(64)"
+            )
+            cur.execute("ALTER TABLE password_reset_tokens ALTER COLUMN token DROP NOT NULL")
+            if _chave_tokens() is not None:
+                cur.execute(
+                    "SELECT id, login_id, token FROM password_reset_tokens WHERE token IS NOT NULL"
+                )
+                for row in cur.fetchall():
+                    cur.execute(
+                        "UPDATE password_reset_tokens SET token_hash = %s, token = NULL WHERE id = %s",
+                        (_hash_token(row["login_id"], row["token"]), row["id"]),
+                    )
+            else:
+                # Sem a chave, os códigos antigos ficam como estão até a próxima inicialização
+                logging.getLogger(__name__).warning(
+                    "GESTAO_SECRET_KEY não definida: códigos de redefinição em texto não migrados"
+                )
+            # Baldes do limitador de taxa compartilhados entre processos (limitador.py)
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS limite_taxa (
+                    chave         TEXT PRIMARY KEY,
+                    tokens        DOUBLE PRECISION NOT NULL,
+                    atualizado_em TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+                )
+                """
+            )
+
+            # Última execução de cada tarefa do agendador (agendador.py)
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS agendador_execucao (
+                    tarefa        TEXT PRIMARY KEY,
+                    agendada_para TIMESTAMP WITH TIME ZONE NOT NULL,
+                    inicio        TIMESTAMP WITH TIME ZONE NOT NULL,
+                    duracao_ms    DOUBLE PRECISION NOT NULL,
+                    sucesso       BOOLEAN NOT NULL,
+                    mensagem      TEXT,
+                    instancia     TEXT
+                )
+                """
+            )
+
+            # Busca do código ativo (só linhas não usadas) e limpeza por expiração
+            cur.execute("DROP INDEX IF EXISTS password_reset_tokens_token_hash_idx")
+            cur.execute(
+                "CREATE INDEX IF NOT EXISTS password_reset_tokens_ativos_idx "
+                "ON password_reset_tokens (login_id, token_hash) WHERE usado = FALSE"
+            )
+            cur.execute(
+                "CREATE INDEX IF NOT EXISTS password_reset_tokens_expira_em_idx "
+                "ON password_reset_tokens (expira_em)"
+            )
 
             # Garante que a coluna id de associado tenha default baseado em sequence
             cur.execute(
@@ -663,6 +1426,32 @@ def init_db() -> None:
                 "ALTER TABLE associado ALTER COLUMN id SET DEFAULT nextval('associado_id_seq')"
             )
 
+            # Índices das buscas do admin (buscar_associados / buscar_mensalidades)
+            # e das listagens paginadas (iterar_associados / iterar_mensalidades)
+            cur.execute(
+                "CREATE INDEX IF NOT EXISTS associado_nome_completo_idx "
+                "ON associado (nome_completo, id)"
+            )
+            cur.execute(
+                "CREATE INDEX IF NOT EXISTS mensalidade_data_vencimento_idx "
+                "ON mensalidade (data_vencimento)"
+            )
+            _criar_indices_trigrama(cur)
+
+            # Mensalidade -> pagamento (registrar_pagamento e gatilhos de status)
+            cur.execute(
+                "CREATE INDEX IF NOT EXISTS mensalidade_pagamento_id_idx "
+                "ON mensalidade (pagamento_id)"
+            )
+            _configurar_status_automatico(cur)
+
+            # Resumo financeiro por associado, mantido por gatilhos
+            cur.execute(
+                "CREATE INDEX IF NOT EXISTS mensalidade_associado_id_idx "
+                "ON mensalidade (associado_id)"
+            )
+            _criar_resumo_financeiro(cur)
+
             # Usuário admin padrão (senha: 1234) - só insere se não existir
             cur.execute(
                 """
@@ -695,6 +1484,548 @@ def init_db() -> None:
             conn.commit()
 
 
+def _criar_gatilho_revogacao_sessoes(cur) -> None:
+    """Grava `login.sessoes_revogadas_em` quando a senha muda ou o login é desativado.
+
+    Vale para qualquer UPDATE (inclusive feito fora do aplicativo); a autenticação
+    recusa cookies emitidos antes desse instante.
+    """
+    cur.execute(
+        """
+        CREATE OR REPLACE FUNCTION login_revogar_sessoes() RETURNS trigger AS $$
+        BEGIN
+            NEW.sessoes_revogadas_em := now();
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    cur.execute("SELECT 1 FROM pg_trigger WHERE tgname = 'login_revogar_sessoes'")
+    if cur.fetchone() is None:
+        cur.execute(
+            """
+            CREATE TRIGGER login_revogar_sessoes
+            BEFORE UPDATE OF senha_hash, ativo ON login
+            FOR EACH ROW
+            WHEN (NEW.senha_hash IS DISTINCT FROM OLD.senha_hash OR (OLD.ativo AND NOT NEW.ativo))
+            EXECUTE PROCEDURE login_revogar_sessoes()
+            """
+        )
+
+
+_GATILHOS_STATUS_AUTOMATICO = ("pagamento_status_mensalidade", "mensalidade_status_pagamento")
+
+
+def _configurar_status_automatico(cur) -> None:
+    """Atualiza as funções dos gatilhos que derivam `status_mensalidade_id` do pagamento.
+
+    Os gatilhos em si só são criados ou removidos por `definir_status_automatico`
+    (página Developer): a configuração fica no banco, e a inicialização de uma
+    réplica nunca liga nem desliga o comportamento. Sem eles o status continua
+    sendo confirmado manualmente pelo admin. Regra (`status_mensalidade_do_pagamento`):
+    pagamento "Pago" com valor >= mensalidade -> 3 (Pago); "Pago" com valor menor
+    -> 2 (Ainda Falta Pagar!); demais casos -> 1 (Não Pago).
+
+    - `pagamento_status_mensalidade`: após gravar o pagamento, atualiza a
+      mensalidade vinculada;
+    - `mensalidade_status_pagamento`: ao vincular o pagamento ou mudar o valor da
+      mensalidade, recalcula antes de gravar. Mudanças só de status (ajuste manual
+      do admin) não disparam o recálculo.
+    """
+    cur.execute(
+        """
+        CREATE OR REPLACE FUNCTION status_mensalidade_do_pagamento(
+            valor_mensalidade NUMERIC, status_pagamento_id INTEGER, valor_pagamento NUMERIC
+        ) RETURNS INTEGER AS $$
+            SELECT CASE
+                WHEN status_pagamento_id = 1 AND COALESCE(valor_pagamento, 0) >= valor_mensalidade THEN 3
+                WHEN status_pagamento_id = 1 AND COALESCE(valor_pagamento, 0) > 0 THEN 2
+                ELSE 1
+            END
+        $$ LANGUAGE sql IMMUTABLE
+        """
+    )
+    cur.execute(
+        """
+        CREATE OR REPLACE FUNCTION pagamento_status_mensalidade() RETURNS trigger AS $$
+        BEGIN
+            UPDATE mensalidade m
+            SET status_mensalidade_id = status_mensalidade_do_pagamento(
+                    m.valor, NEW.status_pagamento_id, NEW.valor_pagamento)
+            WHERE m.pagamento_id = NEW.id
+              AND m.status_mensalidade_id IS DISTINCT FROM status_mensalidade_do_pagamento(
+                    m.valor, NEW.status_pagamento_id, NEW.valor_pagamento);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    cur.execute(
+        """
+        CREATE OR REPLACE FUNCTION mensalidade_status_pagamento() RETURNS trigger AS $$
+        BEGIN
+            SELECT status_mensalidade_do_pagamento(NEW.valor, p.status_pagamento_id, p.valor_pagamento)
+            INTO NEW.status_mensalidade_id
+            FROM pagamento p
+            WHERE p.id = NEW.pagamento_id;
+            IF NOT FOUND THEN
+                NEW.status_mensalidade_id := 1;
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+
+
+def _gatilhos_status_automatico(cur) -> set:
+    cur.execute(
+        "SELECT tgname FROM pg_trigger WHERE tgname = ANY(%s)",
+        (list(_GATILHOS_STATUS_AUTOMATICO),),
+    )
+    return {row["tgname"] for row in cur.fetchall()}
+
+
+def _criar_gatilhos_status_automatico(cur, existentes: set) -> None:
+    if "pagamento_status_mensalidade" not in existentes:
+        cur.execute(
+            """
+            CREATE TRIGGER pagamento_status_mensalidade
+            AFTER INSERT OR UPDATE OF status_pagamento_id, valor_pagamento ON pagamento
+            FOR EACH ROW EXECUTE PROCEDURE pagamento_status_mensalidade()
+            """
+        )
+    if "mensalidade_status_pagamento" not in existentes:
+        cur.execute(
+            """
+            CREATE TRIGGER mensalidade_status_pagamento
+            BEFORE UPDATE OF pagamento_id, valor ON mensalidade
+            FOR EACH ROW
+            WHEN (NEW.pagamento_id IS DISTINCT FROM OLD.pagamento_id OR NEW.valor IS DISTINCT FROM OLD.valor)
+            EXECUTE PROCEDURE mensalidade_status_pagamento()
+            """
+        )
+        # Alinha as mensalidades já existentes à regra
+        cur.execute(
+            """
+            UPDATE mensalidade m
+            SET status_mensalidade_id = status_mensalidade_do_pagamento(
+                    m.valor, p.status_pagamento_id, p.valor_pagamento)
+            FROM pagamento p
+            WHERE p.id = m.pagamento_id
+              AND m.status_mensalidade_id IS DISTINCT FROM status_mensalidade_do_pagamento(
+                    m.valor, p.status_pagamento_id, p.valor_pagamento)
+            """
+        )
+
+
+def status_automatico_ativo() -> bool:
+    """Indica se os gatilhos de status automático das mensalidades estão no banco."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            return bool(_gatilhos_status_automatico(cur))
+
+
+def definir_status_automatico(ativo: bool) -> None:
+    """Liga ou desliga, para todas as réplicas, o status automático das mensalidades.
+
+    Ao ligar, cria os gatilhos e alinha as mensalidades existentes à regra; ao
+    desligar, remove os gatilhos (os status gravados ficam como estão).
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            _configurar_status_automatico(cur)
+            existentes = _gatilhos_status_automatico(cur)
+            if ativo:
+                _criar_gatilhos_status_automatico(cur, existentes)
+            else:
+                if "pagamento_status_mensalidade" in existentes:
+                    cur.execute("DROP TRIGGER pagamento_status_mensalidade ON pagamento")
+                if "mensalidade_status_pagamento" in existentes:
+                    cur.execute("DROP TRIGGER mensalidade_status_pagamento ON mensalidade")
+    cache.invalidar("mensalidades")
+
+
+def _criar_resumo_financeiro(cur) -> None:
+    """Cria a tabela `associado_financeiro` e os gatilhos que a mantêm.
+
+    Uma linha por associado com o que falta pagar (mensalidades não pagas menos o
+    já pago nas parciais), quantas ainda têm saldo e quantas dessas venceram, e a
+    data do último pagamento "Pago". `associado_financeiro_atualizar(ids)`
+    recalcula só os associados informados (NULL = todos); os gatilhos são por
+    comando, com tabelas de transição, então uma alteração em lote recalcula cada
+    associado uma vez.
+    Transações simultâneas sobre o mesmo associado são serializadas por uma trava
+    consultiva por associado (`pg_advisory_xact_lock`), senão a última a confirmar
+    gravaria um total calculado sem as linhas ainda não confirmadas da outra.
+    O número de vencidas depende da data: o agendador recalcula todos diariamente
+    (`atualizar_resumo_financeiro`).
+    """
+    cur.execute("SELECT to_regclass('associado_financeiro') IS NULL AS criar")
+    criar = cur.fetchone()["criar"]
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS associado_financeiro (
+            associado_id           INTEGER PRIMARY KEY REFERENCES associado(id) ON DELETE CASCADE,
+            total_em_aberto        NUMERIC(12, 2) NOT NULL DEFAULT 0,
+            mensalidades_em_aberto INTEGER NOT NULL DEFAULT 0,
+            mensalidades_vencidas  INTEGER NOT NULL DEFAULT 0,
+            ultimo_pagamento       DATE,
+            atualizado_em          TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE OR REPLACE FUNCTION associado_financeiro_atualizar(ids INTEGER[]) RETURNS INTEGER AS $$
+        DECLARE
+            alvo RECORD;
+            total INTEGER;
+        BEGIN
+            -- Uma transação por associado de cada vez (trava até o commit, em ordem
+            -- de id): o cálculo abaixo, com snapshot novo, já vê as alterações
+            -- confirmadas por quem segurava a trava
+            FOR alvo IN SELECT id FROM associado WHERE ids IS NULL OR id = ANY(ids) ORDER BY id LOOP
+                PERFORM pg_advisory_xact_lock('associado_financeiro'::regclass::oid::integer, alvo.id);
+            END LOOP;
+
+            WITH resumo AS (
+                INSERT INTO associado_financeiro AS f (
+                    associado_id, total_em_aberto, mensalidades_em_aberto,
+                    mensalidades_vencidas, ultimo_pagamento, atualizado_em
+                )
+                SELECT
+                    a.id,
+                    COALESCE(SUM(x.restante), 0),
+                    COUNT(*) FILTER (WHERE x.restante > 0),
+                    COUNT(*) FILTER (WHERE x.restante > 0 AND m.data_vencimento < CURRENT_DATE),
+                    MAX(p.data_pagamento) FILTER (WHERE p.status_pagamento_id = 1),
+                    now()
+                FROM associado a
+                LEFT JOIN mensalidade m ON m.associado_id = a.id
+                LEFT JOIN pagamento p ON p.id = m.pagamento_id
+                -- Quanto falta: nada se paga; senão o valor menos o pagamento "Pago" (parcial)
+                CROSS JOIN LATERAL (
+                    SELECT CASE
+                        WHEN m.id IS NULL OR m.status_mensalidade_id = 3 THEN 0
+                        WHEN p.status_pagamento_id = 1 THEN GREATEST(m.valor - COALESCE(p.valor_pagamento, 0), 0)
+                        ELSE m.valor
+                    END AS restante
+                ) x
+                WHERE ids IS NULL OR a.id = ANY(ids)
+                GROUP BY a.id
+                ON CONFLICT (associado_id) DO UPDATE
+                SET total_em_aberto = EXCLUDED.total_em_aberto,
+                    mensalidades_em_aberto = EXCLUDED.mensalidades_em_aberto,
+                    mensalidades_vencidas = EXCLUDED.mensalidades_vencidas,
+                    ultimo_pagamento = EXCLUDED.ultimo_pagamento,
+                    atualizado_em = EXCLUDED.atualizado_em
+                RETURNING 1
+            )
+            SELECT count(*)::INTEGER INTO total FROM resumo;
+            RETURN total;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    cur.execute(
+        """
+        CREATE OR REPLACE FUNCTION mensalidade_financeiro() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM associado_financeiro_atualizar(ARRAY(SELECT DISTINCT associado_id FROM novas));
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM associado_financeiro_atualizar(ARRAY(SELECT DISTINCT associado_id FROM antigas));
+            ELSE
+                PERFORM associado_financeiro_atualizar(ARRAY(
+                    SELECT associado_id FROM novas UNION SELECT associado_id FROM antigas
+                ));
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    cur.execute(
+        """
+        CREATE OR REPLACE FUNCTION pagamento_financeiro() RETURNS trigger AS $$
+        BEGIN
+            PERFORM associado_financeiro_atualizar(ARRAY(
+                SELECT DISTINCT m.associado_id
+                FROM novos p
+                JOIN mensalidade m ON m.pagamento_id = p.id
+            ));
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    cur.execute(
+        "SELECT tgname FROM pg_trigger WHERE tgname LIKE 'mensalidade_financeiro_%' "
+        "OR tgname = 'pagamento_financeiro_upd'"
+    )
+    existentes = {row["tgname"] for row in cur.fetchall()}
+    # Tabelas de transição exigem um gatilho por evento
+    gatilhos = {
+        "mensalidade_financeiro_ins": "AFTER INSERT ON mensalidade REFERENCING NEW TABLE AS novas",
+        "mensalidade_financeiro_upd": "AFTER UPDATE ON mensalidade REFERENCING NEW TABLE AS novas OLD TABLE AS antigas",
+        "mensalidade_financeiro_del": "AFTER DELETE ON mensalidade REFERENCING OLD TABLE AS antigas",
+    }
+    for nome, definicao in gatilhos.items():
+        if nome not in existentes:
+            cur.execute(
+                f"CREATE TRIGGER {nome} {definicao} "
+                "FOR EACH STATEMENT EXECUTE PROCEDURE mensalidade_financeiro()"
+            )
+    if "pagamento_financeiro_upd" not in existentes:
+        cur.execute(
+            "CREATE TRIGGER pagamento_financeiro_upd AFTER UPDATE ON pagamento "
+            "REFERENCING NEW TABLE AS novos "
+            "FOR EACH STATEMENT EXECUTE PROCEDURE pagamento_financeiro()"
+        )
+    if criar:
+        cur.execute("SELECT associado_financeiro_atualizar(NULL)")
+
+
+def _criar_indice_unico_cpf_digitos(cur) -> None:
+    """Cria o índice único de `associado.cpf_digitos`.
+
+    Bancos antigos podem ter o mesmo CPF gravado com formatações diferentes; nesse
+    caso o índice é criado sem unicidade (a busca continua indexada) e os CPFs
+    repetidos são registrados no log para correção manual.
+    """
+    cur.execute("SAVEPOINT indice_cpf_digitos")
+    try:
+        cur.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS associado_cpf_digitos_key ON associado (cpf_digitos)"
+        )
+        cur.execute("RELEASE SAVEPOINT indice_cpf_digitos")
+    except psycopg2.errors.UniqueViolation:
+        cur.execute("ROLLBACK TO SAVEPOINT indice_cpf_digitos")
+        cur.execute(
+            "SELECT cpf_digitos FROM associado GROUP BY cpf_digitos HAVING count(*) > 1"
+        )
+        repetidos = [row["cpf_digitos"] for row in cur.fetchall()]
+        logging.getLogger(__name__).warning(
+            "CPFs repetidos em associado (com formatações diferentes): %s", ", ".join(repetidos)
+        )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS associado_cpf_digitos_idx ON associado (cpf_digitos)"
+        )
+
+
+def _criar_indices_trigrama(cur) -> None:
+    """Cria a extensão pg_trgm e os índices GIN de nome e CPF (somente dígitos).
+
+    Roda dentro de um SAVEPOINT: se a extensão não estiver instalada no servidor
+    (ou faltar permissão), a inicialização segue e as buscas usam ILIKE sem índice.
+    """
+    global _trigrama_disponivel
+    cur.execute("SAVEPOINT indices_trigrama")
+    try:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS associado_nome_trgm_idx "
+            "ON associado USING gin (nome_completo gin_trgm_ops)"
+        )
+        cur.execute("DROP INDEX IF EXISTS associado_cpf_digitos_trgm_idx")
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS associado_cpf_digitos_gin_idx "
+            "ON associado USING gin (cpf_digitos gin_trgm_ops)"
+        )
+        cur.execute("RELEASE SAVEPOINT indices_trigrama")
+        _trigrama_disponivel = True
+    except psycopg2.Error as e:
+        cur.execute("ROLLBACK TO SAVEPOINT indices_trigrama")
+        _trigrama_disponivel = False
+        logging.getLogger(__name__).warning(
+            "pg_trgm indisponível; buscas por nome/CPF sem índice: %s", str(e).strip()
+        )
+
+
+def _busca_trigrama() -> bool:
+    """Indica se pg_trgm está instalado no banco (consultado uma vez por processo)."""
+    global _trigrama_disponivel
+    if _trigrama_disponivel is None:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                _trigrama_disponivel = cur.fetchone() is not None
+    return _trigrama_disponivel
+
+
+def _padrao_like(texto: str) -> str:
+    """Monta o padrão `%texto%` escapando os curingas do LIKE."""
+    escapado = texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escapado}%"
+
+
+# Trecho de CPF digitado na busca: só dígitos e a pontuação do CPF
+_FRAGMENTO_CPF = re.compile(r"[\d.\-\s]+")
+
+
+# Colunas do resumo financeiro lidas de `associado_financeiro` (alias f)
+_SQL_RESUMO_FINANCEIRO = sql.SQL(
+    """
+    CASE
+        WHEN COALESCE(f.mensalidades_vencidas, 0) > 0
+            THEN 'Em atraso (' || f.mensalidades_vencidas || ')'
+        WHEN COALESCE(f.mensalidades_em_aberto, 0) > 0 THEN 'Em aberto'
+        ELSE 'Em dia'
+    END AS situacao_financeira,
+    COALESCE(f.total_em_aberto, 0) AS total_em_aberto
+    """
+)
+
+
+@cache.em_cache("associados", "mensalidades")
+def buscar_associados(
+    termo: str,
+    limite: int = 100,
+    somente_contribuintes_habilitados: bool = False,
+) -> List[Dict[str, Any]]:
+    """Busca associados por trecho do nome ou do CPF, ordenados por relevância.
+
+    O CPF só é consultado quando o termo é um trecho de CPF (apenas dígitos e
+    pontuação, com ao menos 3 dígitos); os demais termos buscam só no nome.
+    Retorna as colunas de `iterar_associados` (id, cpf, nome_completo e o resumo
+    financeiro). Nomes que começam com o termo vêm primeiro, seguidos pela similaridade de
+    trigramas (quando pg_trgm está disponível) e pela ordem alfabética.
+    """
+    termo = (termo or "").strip()
+    if not termo:
+        return []
+    digitos = normalizar_cpf(termo)
+
+    condicoes = [sql.SQL("nome_completo ILIKE %(padrao)s")]
+    # Só busca no CPF se o termo for um trecho de CPF: "Ana 2" ou "Rua 10"
+    # casariam com quase todos os CPFs e impediriam o uso do índice do nome
+    if _FRAGMENTO_CPF.fullmatch(termo) and len(digitos) >= 3:
+        condicoes.append(
+            sql.SQL("cpf_digitos LIKE %(padrao_digitos)s")
+        )
+    filtro = sql.SQL("({})").format(sql.SQL(" OR ").join(condicoes))
+    if somente_contribuintes_habilitados:
+        filtro = sql.SQL("{} AND tipo_associado = 2 AND situacao_associado = 1").format(filtro)
+    similaridade = (
+        sql.SQL("similarity(nome_completo, %(termo)s) DESC,")
+        if _busca_trigrama()
+        else sql.SQL("")
+    )
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL(
+                    """
+                    SELECT a.id, a.cpf, a.nome_completo, {financeiro}
+                    FROM associado a
+                    LEFT JOIN associado_financeiro f ON f.associado_id = a.id
+                    WHERE {filtro}
+                    ORDER BY nome_completo ILIKE %(prefixo)s DESC, {similaridade} nome_completo
+                    LIMIT %(limite)s
+                    """
+                ).format(
+                    filtro=filtro, similaridade=similaridade, financeiro=_SQL_RESUMO_FINANCEIRO
+                ),
+                {
+                    "termo": termo,
+                    "padrao": _padrao_like(termo),
+                    "padrao_digitos": _padrao_like(digitos),
+                    "prefixo": _padrao_like(termo)[1:],
+                    "limite": limite,
+                },
+            )
+            return cur.fetchall()
+
+
+def _intervalo_vencimento(termo: str):
+    """Converte 'dd/mm/aaaa', 'mm/aaaa' ou 'aaaa' em um intervalo [inicio, fim) de datas."""
+    partes = termo.split("/")
+    if not all(p.isdigit() for p in partes):
+        return None
+    try:
+        if len(partes) == 3 and len(partes[2]) == 4:
+            inicio = datetime(int(partes[2]), int(partes[1]), int(partes[0])).date()
+            return inicio, inicio + timedelta(days=1)
+        if len(partes) == 2 and len(partes[1]) == 4:
+            ano, mes = int(partes[1]), int(partes[0])
+            inicio = datetime(ano, mes, 1).date()
+            fim = datetime(ano + mes // 12, mes % 12 + 1, 1).date()
+            return inicio, fim
+        if len(partes) == 1 and len(partes[0]) == 4:
+            ano = int(partes[0])
+            return datetime(ano, 1, 1).date(), datetime(ano + 1, 1, 1).date()
+    except ValueError:
+        return None
+    return None
+
+
+@cache.em_cache("mensalidades")
+def buscar_mensalidades(termo: str, limite: int = 500) -> List[Dict[str, Any]]:
+    """Busca mensalidades pelo vencimento (dd/mm/aaaa, mm/aaaa ou aaaa) ou pelo nome do associado.
+
+    Datas viram um intervalo em `data_vencimento` (índice B-tree); os demais termos
+    buscam trecho do nome (índice de trigramas). Retorna as colunas de `listar_mensalidades`.
+    """
+    termo = (termo or "").strip()
+    if not termo:
+        return []
+
+    intervalo = _intervalo_vencimento(termo)
+    if intervalo is not None:
+        filtro = sql.SQL("m.data_vencimento >= %(inicio)s AND m.data_vencimento < %(fim)s")
+        ordem = sql.SQL("m.data_vencimento DESC, a.nome_completo")
+    else:
+        filtro = sql.SQL("a.nome_completo ILIKE %(padrao)s")
+        ordem = (
+            sql.SQL("similarity(a.nome_completo, %(termo)s) DESC, m.data_vencimento DESC")
+            if _busca_trigrama()
+            else sql.SQL("a.nome_completo, m.data_vencimento DESC")
+        )
+    inicio, fim = intervalo or (None, None)
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL(
+                    """
+                    SELECT
+                        m.id,
+                        m.associado_id,
+                        a.nome_completo,
+                        m.valor,
+                        m.data_emissao,
+                        m.data_vencimento,
+                        m.status_mensalidade_id,
+                        m.pagamento_id,
+                        p.data_pagamento,
+                        p.status_pagamento_id
+                    FROM mensalidade m
+                    JOIN associado a ON m.associado_id = a.id
+                    LEFT JOIN pagamento p ON m.pagamento_id = p.id
+                    WHERE {filtro}
+                    ORDER BY {ordem}
+                    LIMIT %(limite)s
+                    """
+                ).format(filtro=filtro, ordem=ordem),
+                {
+                    "termo": termo,
+                    "padrao": _padrao_like(termo),
+                    "inicio": inicio,
+                    "fim": fim,
+                    "limite": limite,
+                },
+            )
+            mensalidades = cur.fetchall()
+
+    for row in mensalidades:
+        row["status_mensalidade"] = rotulos.descricao_status_mensalidade(row["status_mensalidade_id"])
+        row["status_pagamento"] = rotulos.descricao_status_pagamento(row["status_pagamento_id"])
+    return mensalidades
+
+
+@cache.em_cache("associados")
 def listar_associados_contribuintes_habilitados() -> List[Dict[str, Any]]:
     """Retorna lista de associados que são CONTRIBUINTES e estão HABILITADOS."""
     with get_connection() as conn:
@@ -753,11 +2084,38 @@ def inserir_mensalidade(
             )
             mensalidade_id = cur.fetchone()["id"]
             conn.commit()
+            cache.invalidar("mensalidades")
             return mensalidade_id
 
 
+def carregar_tabelas_status() -> None:
+    """Lê `status_mensalidade` e `status_pagamento` para o cache de processo em `rotulos`.
+
+    As tabelas são sementes estáticas do `init_db`; basta uma leitura por processo.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT 'mensalidade' AS tabela, id, descricao FROM status_mensalidade
+                UNION ALL
+                SELECT 'pagamento' AS tabela, id, descricao FROM status_pagamento
+                """
+            )
+            status_mensalidade: Dict[int, str] = {}
+            status_pagamento: Dict[int, str] = {}
+            for row in cur.fetchall():
+                destino = status_mensalidade if row["tabela"] == "mensalidade" else status_pagamento
+                destino[row["id"]] = row["descricao"]
+    rotulos.definir_status(status_mensalidade, status_pagamento)
+
+
+@cache.em_cache("mensalidades")
 def listar_mensalidades(associado_id: int = None) -> List[Dict[str, Any]]:
-    """Retorna lista de mensalidades, opcionalmente filtrada por associado."""
+    """Retorna lista de mensalidades, opcionalmente filtrada por associado.
+
+    As descrições de status vêm do cache `rotulos` (sem JOIN com as tabelas de status).
+    """
     with get_connection() as conn:
         with conn.cursor() as cur:
             if associado_id:
@@ -771,16 +2129,12 @@ def listar_mensalidades(associado_id: int = None) -> List[Dict[str, Any]]:
                         m.data_emissao,
                         m.data_vencimento,
                         m.status_mensalidade_id,
-                        sm.descricao as status_mensalidade,
                         m.pagamento_id,
                         p.data_pagamento,
-                        p.status_pagamento_id,
-                        sp.descricao as status_pagamento
+                        p.status_pagamento_id
                     FROM mensalidade m
                     JOIN associado a ON m.associado_id = a.id
-                    JOIN status_mensalidade sm ON m.status_mensalidade_id = sm.id
                     LEFT JOIN pagamento p ON m.pagamento_id = p.id
-                    LEFT JOIN status_pagamento sp ON p.status_pagamento_id = sp.id
                     WHERE m.associado_id = %s
                     ORDER BY m.data_vencimento DESC
                     """,
@@ -797,60 +2151,276 @@ def listar_mensalidades(associado_id: int = None) -> List[Dict[str, Any]]:
                         m.data_emissao,
                         m.data_vencimento,
                         m.status_mensalidade_id,
-                        sm.descricao as status_mensalidade,
                         m.pagamento_id,
                         p.data_pagamento,
-                        p.status_pagamento_id,
-                        sp.descricao as status_pagamento
+                        p.status_pagamento_id
                     FROM mensalidade m
                     JOIN associado a ON m.associado_id = a.id
-                    JOIN status_mensalidade sm ON m.status_mensalidade_id = sm.id
                     LEFT JOIN pagamento p ON m.pagamento_id = p.id
-                    LEFT JOIN status_pagamento sp ON p.status_pagamento_id = sp.id
                     ORDER BY m.data_vencimento DESC
                     """
                 )
-            return cur.fetchall()
+            mensalidades = cur.fetchall()
 
+    for row in mensalidades:
+        row["status_mensalidade"] = rotulos.descricao_status_mensalidade(row["status_mensalidade_id"])
+        row["status_pagamento"] = rotulos.descricao_status_pagamento(row["status_pagamento_id"])
+    return mensalidades
 
-def inserir_pagamento(
-    data_pagamento,
-    status_pagamento_id: int,
-    mensalidade_id: int,
-    valor_pagamento: Optional[float] = None,
-    comprovante_bytes: Optional[bytes] = None,
-) -> int:
-    """Insere um pagamento e vincula à mensalidade."""
+
+# --- Iteração em lotes (cursores nomeados) ------------------------------------------
+def _iterar_consulta(
+    nome_cursor: str, consulta, parametros: Any = None, tamanho_lote: int = 1000
+) -> Iterator[Tuple[Any, ...]]:
+    """Executa a consulta em um cursor nomeado (do lado do servidor) e itera as linhas.
+
+    As linhas chegam em lotes de `tamanho_lote` como namedtuples (sem repetir as
+    chaves em cada linha, como no RealDictCursor); só um lote fica em memória.
+    """
+    with get_connection() as conn:
+        with conn.cursor(name=nome_cursor, cursor_factory=NamedTupleCursor) as cur:
+            cur.itersize = tamanho_lote
+            cur.execute(consulta, parametros)
+            while True:
+                lote = cur.fetchmany(tamanho_lote)
+                if not lote:
+                    break
+                yield from lote
+
+
+def iterar_associados(
+    inicio: int = 0, limite: Optional[int] = None, tamanho_lote: int = 1000
+) -> Iterator[Tuple[Any, ...]]:
+    """Itera associados em ordem de nome, opcionalmente uma página.
+
+    Colunas: id, cpf, nome_completo, situacao_financeira e total_em_aberto (do
+    resumo `associado_financeiro`, sem agregar mensalidades).
+    """
+    return _iterar_consulta(
+        "iterar_associados",
+        sql.SQL(
+            """
+            SELECT a.id, a.cpf, a.nome_completo, {financeiro}
+            FROM associado a
+            LEFT JOIN associado_financeiro f ON f.associado_id = a.id
+            ORDER BY a.nome_completo, a.id
+            OFFSET %s LIMIT %s
+            """
+        ).format(financeiro=_SQL_RESUMO_FINANCEIRO),
+        (inicio, limite),
+        tamanho_lote,
+    )
+
+
+def iterar_mensalidades(
+    associado_id: Optional[int] = None,
+    inicio: int = 0,
+    limite: Optional[int] = None,
+    tamanho_lote: int = 1000,
+) -> Iterator[Tuple[Any, ...]]:
+    """Itera mensalidades com as colunas de `listar_mensalidades`, opcionalmente uma página.
+
+    As descrições de status vêm de `rotulos`, resolvidas no próprio SELECT.
+    """
+    consulta = sql.SQL(
+        """
+        SELECT
+            m.id,
+            m.associado_id,
+            a.nome_completo,
+            m.valor,
+            m.data_emissao,
+            m.data_vencimento,
+            m.status_mensalidade_id,
+            m.pagamento_id,
+            p.data_pagamento,
+            p.status_pagamento_id,
+            {status_mensalidade} AS status_mensalidade,
+            {status_pagamento} AS status_pagamento
+        FROM mensalidade m
+        JOIN associado a ON m.associado_id = a.id
+        LEFT JOIN pagamento p ON m.pagamento_id = p.id
+        WHERE %(associado_id)s IS NULL OR m.associado_id = %(associado_id)s
+        ORDER BY m.data_vencimento DESC, m.id DESC
+        OFFSET %(inicio)s LIMIT %(limite)s
+        """
+    ).format(
+        status_mensalidade=_sql_rotulo("m.status_mensalidade_id", rotulos.status_mensalidade()),
+        status_pagamento=_sql_rotulo("p.status_pagamento_id", rotulos.status_pagamento()),
+    )
+    return _iterar_consulta(
+        "iterar_mensalidades",
+        consulta,
+        {"associado_id": associado_id, "inicio": inicio, "limite": limite},
+        tamanho_lote,
+    )
+
+
+@cache.em_cache("associados", "mensalidades")
+def pagina_associados(inicio: int, limite: int) -> List[Dict[str, Any]]:
+    """Uma página de `iterar_associados` como lista, em cache por (inicio, limite)."""
+    return [a._asdict() for a in iterar_associados(inicio=inicio, limite=limite)]
+
+
+@cache.em_cache("associados", "mensalidades")
+def pagina_mensalidades(inicio: int, limite: int) -> List[Dict[str, Any]]:
+    """Uma página de `iterar_mensalidades` como lista, em cache por (inicio, limite)."""
+    return [m._asdict() for m in iterar_mensalidades(inicio=inicio, limite=limite)]
+
+
+@cache.em_cache("associados")
+def contar_associados() -> int:
+    """Total de associados cadastrados."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*) AS total FROM associado")
+            return cur.fetchone()["total"]
+
+
+@cache.em_cache("mensalidades")
+def contar_mensalidades(associado_id: Optional[int] = None) -> int:
+    """Total de mensalidades lançadas (de um associado, se informado)."""
     with get_connection() as conn:
         with conn.cursor() as cur:
-            # Insere pagamento
             cur.execute(
                 """
-                INSERT INTO pagamento (
-                    valor_pagamento,
-                    data_pagamento,
-                    status_pagamento_id,
-                    comprovante
-                )
-                VALUES (%s, %s, %s, %s)
-                RETURNING id
+                SELECT count(*) AS total
+                FROM mensalidade
+                WHERE %(associado_id)s IS NULL OR associado_id = %(associado_id)s
                 """,
-                (valor_pagamento, data_pagamento, status_pagamento_id, comprovante_bytes),
+                {"associado_id": associado_id},
             )
-            pagamento_id = cur.fetchone()["id"]
-            
-            # Vincula pagamento à mensalidade (sem alterar status)
+            return cur.fetchone()["total"]
+
+
+def atualizar_resumo_financeiro(completo: bool = False) -> int:
+    """Recalcula `associado_financeiro` e retorna quantos associados foram atualizados.
+
+    Os gatilhos mantêm o resumo a cada escrita; só a contagem de vencidas muda
+    com a passagem do dia. Sem `completo`, recalcula apenas quem tem mensalidade
+    em aberto; `completo=True` (rotina diária) recalcula todos os associados.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            if completo:
+                cur.execute("SELECT associado_financeiro_atualizar(NULL) AS total")
+            else:
+                cur.execute(
+                    """
+                    SELECT associado_financeiro_atualizar(ARRAY(
+                        SELECT DISTINCT associado_id FROM mensalidade
+                        WHERE status_mensalidade_id <> 3
+                    )) AS total
+                    """
+                )
+            total = cur.fetchone()["total"]
+    cache.invalidar("mensalidades")
+    return total
+
+
+@cache.em_cache("mensalidades")
+def obter_resumo_financeiro(associado_id: int) -> Dict[str, Any]:
+    """Resumo financeiro do associado (total_em_aberto, mensalidades_em_aberto,
+    mensalidades_vencidas, ultimo_pagamento), lido de `associado_financeiro`."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
             cur.execute(
                 """
-                UPDATE mensalidade
-                SET pagamento_id = %s
-                WHERE id = %s
+                SELECT total_em_aberto, mensalidades_em_aberto,
+                       mensalidades_vencidas, ultimo_pagamento
+                FROM associado_financeiro
+                WHERE associado_id = %s
                 """,
-                (pagamento_id, mensalidade_id),
+                (associado_id,),
             )
-            
-            conn.commit()
-            return pagamento_id
+            row = cur.fetchone()
+    if row is None:
+        return {
+            "total_em_aberto": 0,
+            "mensalidades_em_aberto": 0,
+            "mensalidades_vencidas": 0,
+            "ultimo_pagamento": None,
+        }
+    return dict(row)
+
+
+_SQL_REGISTRAR_PAGAMENTO = """
+    WITH m AS (
+        SELECT id, pagamento_id
+        FROM mensalidade
+        WHERE id = %(mensalidade_id)s
+        FOR UPDATE
+    ),
+    atualizado AS (
+        UPDATE pagamento p
+        SET data_pagamento = %(data_pagamento)s,
+            valor_pagamento = %(valor_pagamento)s,
+            status_pagamento_id = %(status_pagamento_id)s,
+            comprovante = COALESCE(%(comprovante)s, p.comprovante)
+        FROM m
+        WHERE p.id = m.pagamento_id
+        RETURNING p.id
+    ),
+    inserido AS (
+        INSERT INTO pagamento (valor_pagamento, data_pagamento, status_pagamento_id, comprovante)
+        SELECT %(valor_pagamento)s, %(data_pagamento)s, %(status_pagamento_id)s, %(comprovante)s
+        FROM m
+        WHERE m.pagamento_id IS NULL
+        RETURNING id
+    ),
+    vinculo AS (
+        UPDATE mensalidade
+        SET pagamento_id = inserido.id
+        FROM inserido
+        WHERE mensalidade.id = %(mensalidade_id)s
+    )
+    SELECT id FROM atualizado
+    UNION ALL
+    SELECT id FROM inserido
+"""
+
+
+def registrar_pagamento(
+    mensalidade_id: int,
+    data_pagamento,
+    status_pagamento_id: int,
+    valor_pagamento: Optional[float] = None,
+    comprovante_bytes: Optional[bytes] = None,
+) -> int:
+    """Grava o pagamento de uma mensalidade em um único comando (em geral uma ida ao banco).
+
+    Atualiza o pagamento já vinculado à mensalidade ou, se não houver, insere um
+    novo e o vincula (INSERT ... RETURNING alimentando o UPDATE da mensalidade).
+    A linha da mensalidade fica bloqueada até o fim da transação, então dois
+    salvamentos simultâneos não criam dois pagamentos. `comprovante_bytes=None`
+    mantém o comprovante atual.
+
+    O comando todo usa o snapshot tirado antes de esperar a trava: o segundo de
+    dois salvamentos simultâneos relê a mensalidade já vinculada pelo primeiro,
+    mas não enxerga o pagamento recém-criado e não devolve nada. Nesse caso o
+    comando é repetido uma vez (novo snapshot, trava já obtida).
+
+    O status da mensalidade só muda aqui se os gatilhos de status automático
+    estiverem ligados (`definir_status_automatico`). Retorna o id do pagamento.
+    """
+    parametros = {
+        "mensalidade_id": mensalidade_id,
+        "data_pagamento": data_pagamento,
+        "valor_pagamento": valor_pagamento,
+        "status_pagamento_id": status_pagamento_id,
+        "comprovante": psycopg2.Binary(comprovante_bytes) if comprovante_bytes is not None else None,
+    }
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            for _tentativa in range(2):
+                cur.execute(_SQL_REGISTRAR_PAGAMENTO, parametros)
+                row = cur.fetchone()
+                if row is not None:
+                    break
+            else:
+                raise ValueError("Mensalidade não encontrada.")
+    cache.invalidar("mensalidades")
+    return row["id"]
 
 
 def atualizar_status_mensalidade(mensalidade_id: int, status_mensalidade_id: int) -> None:
@@ -866,6 +2436,7 @@ def atualizar_status_mensalidade(mensalidade_id: int, status_mensalidade_id: int
                 (status_mensalidade_id, mensalidade_id),
             )
             conn.commit()
+            cache.invalidar("mensalidades")
 
 
 def inserir_pagamento_inicial(mensalidade_id: int, valor_pagamento: float) -> int:
@@ -899,6 +2470,7 @@ def inserir_pagamento_inicial(mensalidade_id: int, valor_pagamento: float) -> in
             )
             
             conn.commit()
+            cache.invalidar("mensalidades")
             return pagamento_id
 
 
@@ -934,6 +2506,7 @@ def atualizar_mensalidade(
                     (valor, data_vencimento, status_mensalidade_id, mensalidade_id),
                 )
             conn.commit()
+            cache.invalidar("mensalidades")
 
 
 def excluir_mensalidade(mensalidade_id: int) -> None:
@@ -950,47 +2523,170 @@ def excluir_mensalidade(mensalidade_id: int) -> None:
                 (mensalidade_id,),
             )
             conn.commit()
+            cache.invalidar("mensalidades")
+
+
+# Marca mensalidades como pagas (status 3) com um pagamento "Pago" cada. A entrada
+# vem em arrays paralelos (id, data, valor; valor nulo = valor da mensalidade). O
+# pagamento já vinculado é atualizado (comprovante mantido) e, onde não há, um novo é
+# inserido e vinculado; os ids novos são reservados na sequência antes do INSERT para
+# ligar cada pagamento à sua mensalidade. Com `somente_em_aberto`, mensalidades já
+# pagas (status 3) ficam de fora.
+_SQL_PAGAR_MENSALIDADES = """
+    WITH entrada AS (
+        SELECT DISTINCT ON (mensalidade_id) mensalidade_id, data_pagamento, valor_pagamento
+        FROM unnest(%(ids)s::int[], %(datas)s::date[], %(valores)s::numeric[])
+            AS e(mensalidade_id, data_pagamento, valor_pagamento)
+        ORDER BY mensalidade_id
+    ),
+    m AS (
+        SELECT mensalidade.id, mensalidade.pagamento_id, e.data_pagamento,
+               COALESCE(e.valor_pagamento, mensalidade.valor) AS valor_pagamento
+        FROM mensalidade
+        JOIN entrada e ON e.mensalidade_id = mensalidade.id
+        WHERE NOT %(somente_em_aberto)s OR mensalidade.status_mensalidade_id <> 3
+        ORDER BY mensalidade.id
+        FOR UPDATE OF mensalidade
+    ),
+    novos AS (
+        SELECT m.id AS mensalidade_id,
+               nextval(pg_get_serial_sequence('pagamento', 'id')) AS pagamento_id,
+               m.data_pagamento,
+               m.valor_pagamento
+        FROM m
+        WHERE m.pagamento_id IS NULL
+    ),
+    inserido AS (
+        INSERT INTO pagamento (id, valor_pagamento, data_pagamento, status_pagamento_id)
+        SELECT pagamento_id, valor_pagamento, data_pagamento, 1 FROM novos
+    ),
+    atualizado AS (
+        UPDATE pagamento p
+        SET data_pagamento = m.data_pagamento,
+            valor_pagamento = m.valor_pagamento,
+            status_pagamento_id = 1
+        FROM m
+        WHERE p.id = m.pagamento_id
+    )
+    UPDATE mensalidade
+    SET pagamento_id = COALESCE(novos.pagamento_id, m.pagamento_id),
+        status_mensalidade_id = 3
+    FROM m
+    LEFT JOIN novos ON novos.mensalidade_id = m.id
+    WHERE mensalidade.id = m.id
+    RETURNING mensalidade.id
+"""
+
+
+def _pagar_mensalidades(
+    ids: Sequence[int],
+    datas: Sequence[Any],
+    valores: Sequence[Optional[Any]],
+    somente_em_aberto: bool = False,
+) -> List[int]:
+    if not ids:
+        return []
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                _SQL_PAGAR_MENSALIDADES,
+                {
+                    "ids": list(ids),
+                    "datas": list(datas),
+                    "valores": list(valores),
+                    "somente_em_aberto": somente_em_aberto,
+                },
+            )
+            pagas = sorted(row["id"] for row in cur.fetchall())
+    cache.invalidar("mensalidades")
+    return pagas
 
 
-def atualizar_pagamento(
-    pagamento_id: int,
-    mensalidade_id: int,
-    data_pagamento,
-    status_pagamento_id: int,
-    valor_pagamento: Optional[float] = None,
-    comprovante_bytes: Optional[bytes] = None,
-) -> None:
-    """Atualiza um registro de pagamento e garante vínculo com a mensalidade.
-    
-    Atualiza apenas a tabela de pagamento, sem alterar o status da mensalidade.
+def marcar_mensalidades_pagas(mensalidade_ids: Sequence[int], data_pagamento) -> int:
+    """Marca várias mensalidades como pagas em um único comando.
+
+    Cada mensalidade recebe status 3 (Pago) e um pagamento "Pago" com o valor
+    integral na data informada: o pagamento já vinculado é atualizado (o
+    comprovante é mantido) e, onde não há, um novo é inserido e vinculado.
+    Retorna quantas mensalidades foram marcadas.
     """
+    ids = sorted({int(i) for i in mensalidade_ids})
+    return len(_pagar_mensalidades(ids, [data_pagamento] * len(ids), [None] * len(ids)))
+
 
+def mensalidades_em_aberto(vencimento_de, vencimento_ate) -> List[Dict[str, Any]]:
+    """Mensalidades ainda não pagas (status diferente de 3) com vencimento no intervalo.
+
+    Traz também nome e CPF (dígitos) do associado, para a conciliação bancária.
+    """
     with get_connection() as conn:
         with conn.cursor() as cur:
-            # Atualiza a tabela pagamento
             cur.execute(
                 """
-                UPDATE pagamento
-                SET data_pagamento = %s,
-                    valor_pagamento = %s,
-                    status_pagamento_id = %s,
-                    comprovante = %s
-                WHERE id = %s
+                SELECT m.id, m.valor, m.data_vencimento, a.nome_completo, a.cpf_digitos
+                FROM mensalidade m
+                JOIN associado a ON a.id = m.associado_id
+                WHERE m.status_mensalidade_id <> 3
+                  AND m.data_vencimento BETWEEN %s AND %s
+                ORDER BY m.data_vencimento, m.id
                 """,
-                (data_pagamento, valor_pagamento, status_pagamento_id, comprovante_bytes, pagamento_id),
+                (vencimento_de, vencimento_ate),
             )
+            return cur.fetchall()
 
-            # Garante que a mensalidade aponte para este pagamento (sem alterar status)
+
+def conciliar_pagamentos(itens: Sequence[Tuple[int, Any, Any]]) -> List[int]:
+    """Registra, em uma única transação, os pagamentos confirmados na conciliação.
+
+    `itens` traz (mensalidade_id, data_pagamento, valor_pagamento). Cada mensalidade
+    ainda em aberto passa a "Pago" com um pagamento "Pago" na data e valor do
+    extrato; as que foram pagas nesse meio-tempo são ignoradas. Retorna os ids das
+    mensalidades efetivamente registradas.
+    """
+    return _pagar_mensalidades(
+        [int(i[0]) for i in itens],
+        [i[1] for i in itens],
+        [i[2] for i in itens],
+        somente_em_aberto=True,
+    )
+
+
+def alterar_status_mensalidades(mensalidade_ids: Sequence[int], status_mensalidade_id: int) -> int:
+    """Define o mesmo status para várias mensalidades; retorna quantas mudaram."""
+    ids = sorted({int(i) for i in mensalidade_ids})
+    if not ids:
+        return 0
+    with get_connection() as conn:
+        with conn.cursor() as cur:
             cur.execute(
                 """
                 UPDATE mensalidade
-                SET pagamento_id = COALESCE(pagamento_id, %s)
-                WHERE id = %s
+                SET status_mensalidade_id = %s
+                WHERE id = ANY(%s)
+                  AND status_mensalidade_id IS DISTINCT FROM %s
                 """,
-                (pagamento_id, mensalidade_id),
+                (status_mensalidade_id, ids, status_mensalidade_id),
             )
+            quantidade = cur.rowcount
+    cache.invalidar("mensalidades")
+    return quantidade
 
-            conn.commit()
+
+def excluir_mensalidades(mensalidade_ids: Sequence[int]) -> int:
+    """Exclui várias mensalidades em um único comando; retorna quantas saíram.
+
+    Como em `excluir_mensalidade()`, as restrições de integridade do banco
+    decidem se a exclusão é permitida (se uma falhar, nenhuma é excluída).
+    """
+    ids = sorted({int(i) for i in mensalidade_ids})
+    if not ids:
+        return 0
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM mensalidade WHERE id = ANY(%s)", (ids,))
+            quantidade = cur.rowcount
+    cache.invalidar("mensalidades")
+    return quantidade
 
 
 def buscar_comprovante_pagamento(pagamento_id: int) -> Optional[bytes]:
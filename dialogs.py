@@ -3,18 +3,18 @@
 from datetime import date, datetime
 from io import BytesIO
 
-import pandas as pd
 import streamlit as st
 import streamlit.components.v1 as components
 
 from db import (
     atualizar_mensalidade,
     excluir_mensalidade,
-    inserir_pagamento,
-    atualizar_pagamento,
+    registrar_pagamento,
     atualizar_associado_completo,
     buscar_comprovante_pagamento,
 )
+from helpers import valor_ausente
+import rotulos
 
 
 @st.dialog("✅ Sucesso!")
@@ -175,12 +175,8 @@ def dialog_editar_mensalidade(row) -> None:
             )
 
             status_mens_id_atual = int(row.get("status_mensalidade_id") or 1)
-            status_mens_opcoes = [1, 2, 3]
-            status_mens_labels = {
-                1: "Não Pago",
-                2: "Ainda Falta Pagar!",
-                3: "Pago",
-            }
+            status_mens_labels = rotulos.status_mensalidade()
+            status_mens_opcoes = list(status_mens_labels)
             status_mensalidade_sel = st.selectbox(
                 "Status da Mensalidade",
                 status_mens_opcoes,
@@ -222,9 +218,6 @@ def dialog_editar_mensalidade(row) -> None:
                     )
 
                     st.session_state["msg_sucesso"] = f"Mensalidade atualizada com sucesso."
-                    st.session_state["grid_mens_counter"] = st.session_state.get("grid_mens_counter", 0) + 1
-                    st.session_state.pop("last_selected_mensalidade_id", None)
-                    st.session_state.pop("last_selected_mensalidade_admin_id", None)
                     if hasattr(st, "rerun"):
                         st.rerun()
                     else:
@@ -238,9 +231,6 @@ def dialog_editar_mensalidade(row) -> None:
                     st.error(f"Erro ao atualizar mensalidade: {e}")
             
             if cancelar:
-                st.session_state["grid_mens_counter"] = st.session_state.get("grid_mens_counter", 0) + 1
-                st.session_state.pop("last_selected_mensalidade_id", None)
-                st.session_state.pop("last_selected_mensalidade_admin_id", None)
                 if hasattr(st, "rerun"):
                     st.rerun()
                 else:
@@ -260,9 +250,6 @@ def dialog_editar_mensalidade(row) -> None:
                     try:
                         excluir_mensalidade(int(row["id"]))
                         st.session_state["msg_sucesso"] = "Mensalidade excluída com sucesso."
-                        st.session_state["grid_mens_counter"] = st.session_state.get("grid_mens_counter", 0) + 1
-                        st.session_state.pop("last_selected_mensalidade_id", None)
-                        st.session_state.pop("last_selected_mensalidade_admin_id", None)
                         if hasattr(st, "rerun"):
                             st.rerun()
                         else:
@@ -362,11 +349,15 @@ def dialog_editar_mensalidade(row) -> None:
             disabled=desabilitar_valor_data,
         )
 
+        status_pag_labels = rotulos.status_pagamento()
+        status_pag_opcoes = list(status_pag_labels)
         status_pagamento_id = st.selectbox(
             "Status do Pagamento",
-            [1, 2],
-            format_func=lambda x: "Pago" if x == 1 else "Não Pago",
-            index=0 if status_inicial_id == 1 else 1,
+            status_pag_opcoes,
+            format_func=lambda x: status_pag_labels.get(x, str(x)),
+            index=status_pag_opcoes.index(status_inicial_id)
+            if status_inicial_id in status_pag_opcoes
+            else 0,
             key=f"edit_pag_status_{row['id']}",
             disabled=desabilitar_status,
         )
@@ -415,39 +406,22 @@ def dialog_editar_mensalidade(row) -> None:
                             f"Valor do pagamento deve ser igual ao valor da mensalidade (R$ {valor_mensalidade_base:.2f})."
                         )
                         st.session_state["mostrar_dialog_erro_pagamento"] = True
-                        st.session_state["grid_mens_counter"] = st.session_state.get("grid_mens_counter", 0) + 1
-                        st.session_state.pop("last_selected_mensalidade_id", None)
-                        st.session_state.pop("last_selected_mensalidade_admin_id", None)
                         if hasattr(st, "rerun"):
                             st.rerun()
                         else:
                             st.experimental_rerun()
                         return
 
-                    # Processar comprovante: usar novo upload ou manter existente
-                    if comprovante_file is not None:
-                        comprovante_bytes = comprovante_file.getvalue()
-                    else:
-                        # Se não há upload novo, manter o existente (se houver)
-                        comprovante_bytes = comprovante_existente
-
-                    if pagamento_id:
-                        atualizar_pagamento(
-                            pagamento_id=int(pagamento_id),
-                            mensalidade_id=int(row["id"]),
-                            data_pagamento=data_pagamento,
-                            valor_pagamento=float(valor_pagamento),
-                            status_pagamento_id=int(status_pagamento_id),
-                            comprovante_bytes=comprovante_bytes,
-                        )
-                    else:
-                        inserir_pagamento(
-                            data_pagamento=data_pagamento,
-                            status_pagamento_id=int(status_pagamento_id),
-                            mensalidade_id=int(row["id"]),
-                            valor_pagamento=float(valor_pagamento),
-                            comprovante_bytes=comprovante_bytes,
-                        )
+                    # Sem upload novo (None), o banco mantém o comprovante existente
+                    comprovante_bytes = comprovante_file.getvalue() if comprovante_file is not None else None
+
+                    registrar_pagamento(
+                        mensalidade_id=int(row["id"]),
+                        data_pagamento=data_pagamento,
+                        status_pagamento_id=int(status_pagamento_id),
+                        valor_pagamento=float(valor_pagamento),
+                        comprovante_bytes=comprovante_bytes,
+                    )
 
                     competencia_str = ""
                     data_venc = row.get("data_vencimento")
@@ -481,9 +455,6 @@ def dialog_editar_mensalidade(row) -> None:
                         msg_sucesso = f"Pagamento da mensalidade do {nome_associado} salvo com sucesso."
 
                     st.session_state["msg_sucesso"] = msg_sucesso
-                    st.session_state["grid_mens_counter"] = st.session_state.get("grid_mens_counter", 0) + 1
-                    st.session_state.pop("last_selected_mensalidade_id", None)
-                    st.session_state.pop("last_selected_mensalidade_admin_id", None)
                     if hasattr(st, "rerun"):
                         st.rerun()
                     else:
@@ -494,9 +465,6 @@ def dialog_editar_mensalidade(row) -> None:
                     st.error(f"Erro ao salvar pagamento: {e}")
 
         if cancelar_pag:
-            st.session_state["grid_mens_counter"] = st.session_state.get("grid_mens_counter", 0) + 1
-            st.session_state.pop("last_selected_mensalidade_id", None)
-            st.session_state.pop("last_selected_mensalidade_admin_id", None)
             if hasattr(st, "rerun"):
                 st.rerun()
             else:
@@ -564,14 +532,9 @@ def dialog_editar_associado(row) -> None:
 
     if str(_get_query_param("close_dialog")).lower() in ("1", "true"):
         _clear_close_param()
-        st.session_state.pop("last_selected_row_id", None)
-        st.session_state["associado_dialog_active"] = False
-        st.session_state["grid_counter"] = st.session_state.get("grid_counter", 0) + 1
-        st.session_state.pop("last_selected_associado_id", None)
         st.rerun()
 
     st.markdown("<div id='dialog_editar_associado_marker'></div>", unsafe_allow_html=True)
-    st.session_state["associado_dialog_active"] = True
 
     components.html(
         """
@@ -601,18 +564,11 @@ def dialog_editar_associado(row) -> None:
         width=0,
     )
 
-    identidade_map = {
-        "SURDO": "Surdo",
-        "SURDOCEGO": "Surdocego",
-        "DEFICIENCIA_AUDITIVA": "Deficiência Auditiva (DA)",
-        "OUVINTE": "Ouvinte",
-    }
-
     aba_pessoal, aba_admin = st.tabs(["Dados Pessoais", "Dados Administrativos"])
 
     with aba_pessoal:
         data_nasc_valor = row.get("data_nascimento")
-        if data_nasc_valor is None or (isinstance(data_nasc_valor, float) and pd.isna(data_nasc_valor)):
+        if data_nasc_valor is None or (isinstance(data_nasc_valor, float) and valor_ausente(data_nasc_valor)):
             data_nasc_valor = date(2000, 1, 1)
         elif isinstance(data_nasc_valor, str):
             from datetime import datetime
@@ -707,12 +663,12 @@ def dialog_editar_associado(row) -> None:
             )
             tipo_sanguineo = st.selectbox(
                 "Tipo sanguíneo",
-                ["", "A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"],
+                rotulos.TIPOS_SANGUINEOS,
                 index=max(
                     0,
-                    ["", "A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"].index(
+                    rotulos.TIPOS_SANGUINEOS.index(
                         str(row.get("tipo_sanguineo") or "").strip() 
-                        if not (isinstance(row.get("tipo_sanguineo"), float) and pd.isna(row.get("tipo_sanguineo"))) 
+                        if not (isinstance(row.get("tipo_sanguineo"), float) and valor_ausente(row.get("tipo_sanguineo"))) 
                         else ""
                     ),
                 ),
@@ -720,14 +676,13 @@ def dialog_editar_associado(row) -> None:
             )
 
             identidade_codigo_atual = row.get("identidade") or "SURDO"
-            if isinstance(identidade_codigo_atual, float) and pd.isna(identidade_codigo_atual):
+            if isinstance(identidade_codigo_atual, float) and valor_ausente(identidade_codigo_atual):
                 identidade_codigo_atual = "SURDO"
-            identidade_label_atual = identidade_map.get(identidade_codigo_atual, "Surdo")
-            identidade_opcoes = list(identidade_map.values())
-            identidade_indice = identidade_opcoes.index(identidade_label_atual)
+            identidade_label_atual = rotulos.IDENTIDADE.get(identidade_codigo_atual, "Surdo")
+            identidade_indice = rotulos.IDENTIDADE_ROTULOS.index(identidade_label_atual)
             identidade_label_sel = st.selectbox(
                 "Identidade",
-                identidade_opcoes,
+                rotulos.IDENTIDADE_ROTULOS,
                 index=identidade_indice,
                 key=f"dialog_identidade_{row['id']}",
             )
@@ -737,7 +692,7 @@ def dialog_editar_associado(row) -> None:
                 min_value=0,
                 step=1,
                 value=int(row.get("quantidade_filhos") or 0) 
-                    if not (isinstance(row.get("quantidade_filhos"), float) and pd.isna(row.get("quantidade_filhos"))) 
+                    if not (isinstance(row.get("quantidade_filhos"), float) and valor_ausente(row.get("quantidade_filhos"))) 
                     else 0,
                 key=f"dialog_qtd_filhos_{row['id']}",
             )
@@ -748,16 +703,12 @@ def dialog_editar_associado(row) -> None:
 
             if salvar_pessoal:
                 try:
-                    identidade_codigo = None
-                    for codigo, label in identidade_map.items():
-                        if label == identidade_label_sel:
-                            identidade_codigo = codigo
-                            break
+                    identidade_codigo = rotulos.IDENTIDADE_POR_ROTULO.get(identidade_label_sel)
                     if identidade_codigo is None:
                         raise ValueError("Identidade inválida selecionada.")
 
                     def safe_convert_date(val):
-                        if val is None or (isinstance(val, float) and pd.isna(val)):
+                        if val is None or (isinstance(val, float) and valor_ausente(val)):
                             return None
                         if isinstance(val, str):
                             from datetime import datetime
@@ -772,12 +723,12 @@ def dialog_editar_associado(row) -> None:
                         return None
                     
                     def safe_int(val, default=None):
-                        if val is None or (isinstance(val, float) and pd.isna(val)):
+                        if val is None or (isinstance(val, float) and valor_ausente(val)):
                             return default
                         return int(val)
                     
                     def safe_str(val):
-                        if val is None or (isinstance(val, float) and pd.isna(val)):
+                        if val is None or (isinstance(val, float) and valor_ausente(val)):
                             return ""
                         return str(val)
 
@@ -810,10 +761,6 @@ def dialog_editar_associado(row) -> None:
                     nome_exibicao = (nome_completo or "").strip() or str(row.get("nome_completo", "")).strip()
                     mensagem = f"Dados de {nome_exibicao} atualizados com sucesso."
                     st.session_state["msg_sucesso"] = mensagem
-                    st.session_state.pop("last_selected_row_id", None)
-                    st.session_state["associado_dialog_active"] = False
-                    st.session_state["grid_counter"] = st.session_state.get("grid_counter", 0) + 1
-                    st.session_state.pop("last_selected_associado_id", None)
                     st.rerun()
                 except ValueError as e:
                     st.error(str(e))
@@ -821,16 +768,12 @@ def dialog_editar_associado(row) -> None:
                     st.error(f"Erro ao atualizar dados pessoais: {e}")
 
             if cancelar_pessoal:
-                st.session_state.pop("last_selected_row_id", None)
-                st.session_state["associado_dialog_active"] = False
-                st.session_state["grid_counter"] = st.session_state.get("grid_counter", 0) + 1
-                st.session_state.pop("last_selected_associado_id", None)
                 st.rerun()
     
     with aba_admin:
         data_inicio_valor = row.get("data_inicio")
         
-        if isinstance(data_inicio_valor, dict) or (isinstance(data_inicio_valor, float) and pd.isna(data_inicio_valor)) or pd.isna(data_inicio_valor):
+        if isinstance(data_inicio_valor, dict) or (isinstance(data_inicio_valor, float) and valor_ausente(data_inicio_valor)) or valor_ausente(data_inicio_valor):
             data_inicio_valor = None
         elif data_inicio_valor is not None and not isinstance(data_inicio_valor, date):
             if isinstance(data_inicio_valor, str):
@@ -846,7 +789,7 @@ def dialog_editar_associado(row) -> None:
                     data_inicio_valor = None
         
         data_desligamento_valor = row.get("data_desligamento")
-        if isinstance(data_desligamento_valor, dict) or (isinstance(data_desligamento_valor, float) and pd.isna(data_desligamento_valor)) or pd.isna(data_desligamento_valor):
+        if isinstance(data_desligamento_valor, dict) or (isinstance(data_desligamento_valor, float) and valor_ausente(data_desligamento_valor)) or valor_ausente(data_desligamento_valor):
             data_desligamento_valor = None
         elif data_desligamento_valor is not None and not isinstance(data_desligamento_valor, date):
             if isinstance(data_desligamento_valor, str):
@@ -871,8 +814,8 @@ def dialog_editar_associado(row) -> None:
             
             situacao_associado = st.selectbox(
                 "Situação do Associado",
-                [1, 2],
-                format_func=lambda x: "Habilitado" if x == 1 else "Desabilitado",
+                list(rotulos.SITUACAO_ASSOCIADO),
+                format_func=rotulos.SITUACAO_ASSOCIADO.get,
                 index=0 if (row.get("situacao_associado") or 1) == 1 else 1,
                 key=f"dialog_admin_situacao_assoc_{row['id']}",
             )
@@ -895,16 +838,16 @@ def dialog_editar_associado(row) -> None:
             
             tipo_associado = st.selectbox(
                 "Tipo de Associado",
-                [1, 2, 3],
-                format_func=lambda x: {1: "Honorário", 2: "Contribuinte", 3: "Comunitário"}[x],
+                list(rotulos.TIPO_ASSOCIADO),
+                format_func=rotulos.TIPO_ASSOCIADO.get,
                 index=[1, 2, 3].index(row.get("tipo_associado") or 2),
                 key=f"dialog_admin_tipo_assoc_{row['id']}",
             )
             
             ciclo_cobranca = st.selectbox(
                 "Ciclo de Cobrança",
-                [1, 2],
-                format_func=lambda x: "Mensal" if x == 1 else "Anual",
+                list(rotulos.CICLO_COBRANCA),
+                format_func=rotulos.CICLO_COBRANCA.get,
                 index=0 if (row.get("ciclo_cobranca") or 1) == 1 else 1,
                 key=f"dialog_admin_ciclo_cobr_{row['id']}",
             )
@@ -919,7 +862,7 @@ def dialog_editar_associado(row) -> None:
                         raise ValueError("Data de desligamento é obrigatória quando a situação é Desabilitado.")
                     
                     data_nasc_valor = row.get("data_nascimento")
-                    if data_nasc_valor is None or (isinstance(data_nasc_valor, float) and pd.isna(data_nasc_valor)):
+                    if data_nasc_valor is None or (isinstance(data_nasc_valor, float) and valor_ausente(data_nasc_valor)):
                         data_nasc_final = date(2000, 1, 1)
                     elif isinstance(data_nasc_valor, str):
                         from datetime import datetime
@@ -938,13 +881,13 @@ def dialog_editar_associado(row) -> None:
                         data_nasc_final = date(2000, 1, 1)
                     
                     qtd_filhos = row.get("quantidade_filhos")
-                    if qtd_filhos is None or (isinstance(qtd_filhos, float) and pd.isna(qtd_filhos)):
+                    if qtd_filhos is None or (isinstance(qtd_filhos, float) and valor_ausente(qtd_filhos)):
                         qtd_filhos = 0
                     else:
                         qtd_filhos = int(qtd_filhos)
                     
                     def safe_str(val):
-                        if val is None or (isinstance(val, float) and pd.isna(val)):
+                        if val is None or (isinstance(val, float) and valor_ausente(val)):
                             return ""
                         return str(val)
                     
@@ -975,10 +918,6 @@ def dialog_editar_associado(row) -> None:
                     )
                     mensagem = f"Dados de {row['nome_completo']} atualizados com sucesso."
                     st.session_state["msg_sucesso"] = mensagem
-                    st.session_state.pop("last_selected_row_id", None)
-                    st.session_state["associado_dialog_active"] = False
-                    st.session_state["grid_counter"] = st.session_state.get("grid_counter", 0) + 1
-                    st.session_state.pop("last_selected_associado_id", None)
                     st.rerun()
                 except ValueError as e:
                     st.error(str(e))
@@ -986,8 +925,4 @@ def dialog_editar_associado(row) -> None:
                     st.error(f"Erro ao atualizar dados administrativos: {e}")
             
             if cancelar_admin:
-                st.session_state.pop("last_selected_row_id", None)
-                st.session_state["associado_dialog_active"] = False
-                st.session_state["grid_counter"] = st.session_state.get("grid_counter", 0) + 1
-                st.session_state.pop("last_selected_associado_id", None)
                 st.rerun()
@@ -0,0 +1,138 @@
+"""Exportação de associados e mensalidades em CSV ou XLSX, sem materializar a tabela.
+
+- CSV: `COPY (...) TO STDOUT` do PostgreSQL escrito direto no arquivo de destino.
+- XLSX: cursor nomeado com `fetchmany` alimentando uma planilha `write_only` do
+  openpyxl, que grava as linhas em disco à medida que chegam.
+
+Nenhum dos dois monta a tabela em Python. Na interface, `gerar_arquivo` grava
+a exportação em um arquivo temporário em disco (memória constante) e entrega ao
+`st.download_button` um leitor desse arquivo; o Streamlit ainda guarda uma cópia
+em memória para servir o download, por isso a interface recusa exportações
+acima de `EXPORTACAO_LIMITE_LINHAS` linhas (default 100000) e indica a linha de
+comando, que grava direto no destino.
+
+Pela linha de comando, a exportação é gravada direto em arquivo:
+
+    python exportacao.py mensalidades --formato xlsx --saida mensalidades.xlsx
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from datetime import date
+from io import BytesIO
+from typing import BinaryIO, List, Optional
+
+import db
+
+EXPORTACOES = {
+    "associados": "Associados",
+    "mensalidades": "Mensalidades",
+}
+FORMATOS = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+LIMITE_LINHAS_PADRAO = 100_000
+
+
+def escrever_csv(nome: str, destino: BinaryIO) -> None:
+    """Grava a exportação em CSV UTF-8 (com BOM, para abrir acentuado no Excel)."""
+    destino.write("\ufeff".encode("utf-8"))
+    db.copiar_exportacao_csv(nome, destino)
+
+
+def escrever_xlsx(nome: str, destino: BinaryIO) -> None:
+    """Grava a exportação em XLSX, uma linha do cursor por vez."""
+    from openpyxl import Workbook
+
+    planilha = Workbook(write_only=True)
+    aba = planilha.create_sheet(EXPORTACOES[nome])
+    for linha in db.iterar_exportacao(nome):
+        aba.append(linha)
+    planilha.save(destino)
+
+
+def escrever(nome: str, formato: str, destino: BinaryIO) -> None:
+    if nome not in EXPORTACOES:
+        raise ValueError(f"Exportação desconhecida: {nome}")
+    if formato == "csv":
+        escrever_csv(nome, destino)
+    elif formato == "xlsx":
+        escrever_xlsx(nome, destino)
+    else:
+        raise ValueError(f"Formato desconhecido: {formato}")
+
+
+def limite_linhas_interface() -> int:
+    """Máximo de linhas exportadas pela interface (`EXPORTACAO_LIMITE_LINHAS`)."""
+    try:
+        return max(0, int(os.getenv("EXPORTACAO_LIMITE_LINHAS", LIMITE_LINHAS_PADRAO)))
+    except ValueError:
+        return LIMITE_LINHAS_PADRAO
+
+
+def contar_linhas(nome: str) -> int:
+    if nome == "associados":
+        return db.contar_associados()
+    if nome == "mensalidades":
+        return db.contar_mensalidades()
+    raise ValueError(f"Exportação desconhecida: {nome}")
+
+
+def gerar_arquivo(nome: str, formato: str) -> BinaryIO:
+    """Gera a exportação em um arquivo temporário e retorna um leitor dele.
+
+    O leitor vai direto para o `st.download_button`, que o lê uma única vez; o
+    arquivo é removido do disco assim que o leitor é fechado.
+    """
+    descritor, caminho = tempfile.mkstemp(prefix=f"exportacao_{nome}_", suffix=f".{formato}")
+    try:
+        with open(descritor, "wb") as destino:
+            escrever(nome, formato, destino)
+        leitor = open(caminho, "rb")
+    except BaseException:
+        os.remove(caminho)
+        raise
+    try:
+        # POSIX: o nome some agora e os dados quando o leitor for fechado
+        os.remove(caminho)
+    except OSError:
+        # Windows não remove arquivo aberto: lê o conteúdo e remove em seguida
+        with leitor:
+            dados = leitor.read()
+        os.remove(caminho)
+        return BytesIO(dados)
+    return leitor
+
+
+def nome_arquivo(nome: str, formato: str) -> str:
+    return f"{nome}_{date.today():%Y-%m-%d}.{formato}"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Exporta associados ou mensalidades em CSV/XLSX.")
+    parser.add_argument("exportacao", choices=sorted(EXPORTACOES))
+    parser.add_argument("--formato", choices=sorted(FORMATOS), default="csv")
+    parser.add_argument("--saida", help="arquivo de saída (default: nome_AAAA-MM-DD.formato; '-' = stdout)")
+    args = parser.parse_args(argv)
+
+    saida = args.saida or nome_arquivo(args.exportacao, args.formato)
+    if saida == "-":
+        escrever(args.exportacao, args.formato, sys.stdout.buffer)
+    else:
+        with open(saida, "wb") as destino:
+            escrever(args.exportacao, args.formato, destino)
+        print(f"Exportação gravada em {saida}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+    except ImportError:
+        pass
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""Grades AgGrid estáveis (chave fixa, `getRowId` e botão "Editar").
+
+Usado apenas pelas áreas autenticadas; fica fora de `helpers.py` para que a tela
+de login não carregue o `st_aggrid`.
+"""
+
+from typing import List
+
+import streamlit as st
+from st_aggrid import JsCode
+
+# As grades mantêm sempre a mesma `key`: nada de remontar o componente ao fechar um
+# diálogo. Com `getRowId` pelo `id`, o AG Grid aplica apenas as diferenças quando os
+# dados mudam (linhas alteradas/incluídas/removidas), preservando o restante.
+# O botão "Editar" grava um carimbo de clique (`_clique`) na linha antes de
+# selecioná-la; o Python abre o diálogo só para carimbos ainda não tratados, de modo
+# que a seleção antiga que permanece na grade não reabre nada e não precisa ser
+# limpa por remontagem.
+# Com seleção múltipla (caixas de marcação para ações em lote), o clique em
+# "Editar" também desmarca as demais linhas e deixa só a linha editada marcada.
+_GRID_ROW_ID = JsCode("""
+    function(params) {
+        return String(params.data.id);
+    }
+""")
+
+_BOTAO_EDITAR = JsCode("""
+    class BtnCellRenderer {
+        init(params) {
+            this.eGui = document.createElement('button');
+            this.eGui.innerHTML = 'Editar';
+            this.eGui.style.cssText = 'padding:3px 8px; border:none; background-color:#2c7be5; color:white; border-radius:4px; cursor:pointer;';
+            this.eGui.addEventListener('click', (event) => {
+                event.stopPropagation();
+                params.node.data._clique = Date.now();
+                if (params.api && params.api.deselectAll) {
+                    params.api.deselectAll();
+                }
+                params.node.setSelected(true);
+            });
+        }
+        getGui() {
+            return this.eGui;
+        }
+    }
+""")
+
+
+def configurar_grade_editavel(gb, coluna_acao: str = "acao", multipla: bool = False) -> None:
+    """Configura `getRowId`, a seleção e o botão "Editar" em um GridOptionsBuilder.
+
+    `multipla=True` adiciona caixas de marcação (inclusive no cabeçalho) para
+    selecionar várias linhas; sem ela a seleção é única.
+    """
+    gb.configure_grid_options(getRowId=_GRID_ROW_ID)
+    gb.configure_column(
+        coluna_acao,
+        header_name="Ação",
+        cellRenderer=_BOTAO_EDITAR,
+        width=120,
+        suppressMenu=True,
+    )
+    gb.configure_selection(
+        "multiple" if multipla else "single",
+        use_checkbox=multipla,
+        header_checkbox=multipla,
+        rowMultiSelectWithClick=False,
+        suppressRowClickSelection=True,
+    )
+
+
+def ids_selecionados_na_grade(selected_rows) -> List[int]:
+    """Ids das linhas marcadas na grade (seleção múltipla), na ordem da grade."""
+    if selected_rows is None or len(selected_rows) == 0 or "id" not in selected_rows.columns:
+        return []
+    ids = []
+    for valor in selected_rows["id"]:
+        try:
+            ids.append(int(valor))
+        except (TypeError, ValueError):
+            continue
+    return ids
+
+
+def clique_editar_na_grade(selected_rows, chave_estado: str):
+    """Retorna o id da linha cujo botão "Editar" foi clicado desde o último rerun.
+
+    Devolve None se não houver clique novo (seleção antiga ou nenhuma seleção).
+    """
+    if selected_rows is None or len(selected_rows) == 0:
+        return None
+    if "_clique" not in selected_rows.columns:
+        return None
+    # Com seleção múltipla, vale o clique mais recente entre as linhas marcadas
+    cliques = [
+        (clique, posicao)
+        for posicao, clique in enumerate(selected_rows["_clique"])
+        if clique is not None and clique == clique  # ignora ausentes e NaN
+    ]
+    if not cliques:
+        return None
+    linha = selected_rows.iloc[max(cliques)[1]]
+    try:
+        row_id = int(linha.get("id"))
+    except (TypeError, ValueError):
+        return None
+    marca = (row_id, int(linha.get("_clique")))
+    if st.session_state.get(chave_estado) == marca:
+        return None
+    st.session_state[chave_estado] = marca
+    return row_id
@@ -1,14 +1,17 @@
 """Funções auxiliares e utilitárias para a aplicação."""
 
-import pandas as pd
 import streamlit as st
 import streamlit.components.v1 as components
 from datetime import date, datetime
 from decimal import Decimal
 import os
+import re
 import smtplib
+import time
 from email.message import EmailMessage
 
+import metricas
+
 
 def esconder_botao_fechar_dialog() -> None:
     """Esconde o botão "X" de diálogos específicos via CSS.
@@ -119,9 +122,63 @@ def fechar_sidebar_ao_clicar_menu() -> None:
     )
 
 
+_CHAVE_MODO_MOBILE = "_modo_mobile"
+_USER_AGENT_MOBILE = re.compile(r"Mobi|Android|iPhone|iPad|iPod|Windows Phone", re.IGNORECASE)
+
+
+def _user_agent_mobile() -> bool:
+    """Indica se o User-Agent da requisição é de um dispositivo móvel."""
+    try:
+        user_agent = st.context.headers.get("User-Agent") or ""
+    except Exception:
+        return False
+    return bool(_USER_AGENT_MOBILE.search(user_agent))
+
+
+def resolver_modo_mobile() -> bool:
+    """Resolve o layout (mobile ou desktop) uma única vez por sessão.
+
+    Chamado no início do `main()`, antes de qualquer consulta, para que a página
+    seja renderizada já no layout certo, sem recarregar via JavaScript.
+    Prioridade: `?mobile=1/0` na URL (ajuste manual), valor já resolvido na
+    sessão e, por fim, o User-Agent da requisição.
+    """
+    try:
+        mobile_param = str(st.query_params.get("mobile")).lower()
+    except Exception:
+        mobile_param = ""
+    if mobile_param in ("1", "true"):
+        st.session_state[_CHAVE_MODO_MOBILE] = True
+    elif mobile_param in ("0", "false"):
+        st.session_state[_CHAVE_MODO_MOBILE] = False
+    elif _CHAVE_MODO_MOBILE not in st.session_state:
+        st.session_state[_CHAVE_MODO_MOBILE] = _user_agent_mobile()
+    return st.session_state[_CHAVE_MODO_MOBILE]
+
+
+def fragmento(func):
+    """Decora uma seção como `st.fragment`, quando disponível.
+
+    Interações dentro da seção (busca, clique na grade, abrir diálogo) reexecutam
+    apenas a seção, sem repetir autenticação, init_db e as demais consultas da página.
+    """
+    decorador = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+    return decorador(func) if decorador else func
+
+
+def valor_ausente(v) -> bool:
+    """True para None, NaN e NaT (nulos vindos de DataFrames), sem depender do pandas."""
+    if v is None:
+        return True
+    try:
+        return bool(v != v)  # NaN e NaT são os únicos valores diferentes de si mesmos
+    except Exception:
+        return False
+
+
 def safe_convert_date(value):
     """Converte diversos formatos de data para date, retorna None se inválido."""
-    if value is None or (isinstance(value, float) and pd.isna(value)):
+    if value is None or (isinstance(value, float) and valor_ausente(value)):
         return None
     if isinstance(value, date):
         return value
@@ -140,14 +197,14 @@ def safe_convert_date(value):
 
 def safe_str(val):
     """Converte valor para string, retorna vazia se None ou NaN."""
-    if val is None or (isinstance(val, float) and pd.isna(val)):
+    if val is None or (isinstance(val, float) and valor_ausente(val)):
         return ""
     return str(val)
 
 
 def safe_int(val, default=0):
     """Converte valor para int, retorna default se inválido."""
-    if val is None or (isinstance(val, float) and pd.isna(val)):
+    if val is None or (isinstance(val, float) and valor_ausente(val)):
         return default
     try:
         return int(val)
@@ -180,21 +237,13 @@ def valor_to_float(v):
 
 def date_to_str(v):
     """Converte data/datetime para string no formato DD/MM/YYYY."""
-    if v is None:
+    if valor_ausente(v):
         return ""
-    try:
-        if pd.isna(v):
-            return ""
-    except TypeError:
-        pass
-    
+
     if isinstance(v, str):
         try:
-            dt = pd.to_datetime(v, errors="coerce")
-            if pd.isna(dt):
-                return v
-            return dt.strftime("%d/%m/%Y")
-        except Exception:
+            return datetime.fromisoformat(v.strip()).strftime("%d/%m/%Y")
+        except ValueError:
             return v
     
     if hasattr(v, "strftime"):
@@ -248,11 +297,17 @@ def enviar_email_codigo(destinatario: str, nome: str, codigo: str) -> None:
     msg["To"] = destinatario
     msg.set_content(body)
 
-    # Envia via TLS
-    with smtplib.SMTP(smtp_host, smtp_port, timeout=30) as server:
-        server.starttls()
-        server.login(smtp_user, smtp_password)
-        server.send_message(msg)
+    # Envia via TLS (latência registrada em metricas.SMTP_ENVIO_DURACAO)
+    inicio = time.perf_counter()
+    resultado = "erro"
+    try:
+        with smtplib.SMTP(smtp_host, smtp_port, timeout=30) as server:
+            server.starttls()
+            server.login(smtp_user, smtp_password)
+            server.send_message(msg)
+        resultado = "sucesso"
+    finally:
+        metricas.SMTP_ENVIO_DURACAO.observe(time.perf_counter() - inicio, resultado=resultado)
 
 
 def status_to_text(valor):
@@ -264,9 +319,6 @@ def status_to_text(valor):
             if chave in valor and valor[chave] is not None:
                 return str(valor[chave])
         return str(valor)
-    try:
-        if pd.isna(valor):
-            return ""
-    except TypeError:
-        pass
+    if valor_ausente(valor):
+        return ""
     return str(valor)
@@ -0,0 +1,246 @@
+"""Importação em lote de associados a partir de planilha (CSV ou XLSX).
+
+Fluxo de `importar()`:
+1. `ler_planilha` lê o arquivo com todas as colunas como texto (CPFs mantêm os zeros
+   à esquerda) e normaliza os nomes das colunas;
+2. `validar_planilha` valida todas as linhas de uma vez com operações vetorizadas
+   do pandas, inclusive CPFs repetidos na planilha ou já cadastrados (uma consulta);
+3. `gerar_hashes` calcula os hashes bcrypt em um pool de threads (o bcrypt libera
+   o GIL durante o hash);
+4. `db.importar_associados_em_lote` grava tudo com COPY + INSERT ... SELECT.
+
+O relatório traz um erro por linha/campo, com o número da linha na planilha, e as
+senhas temporárias geradas para linhas sem a coluna `senha` preenchida.
+"""
+
+import io
+import os
+import secrets
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+import db
+import rotulos
+
+COLUNAS_OBRIGATORIAS = ("cpf", "nome_completo", "identidade")
+COLUNAS_OPCIONAIS = (
+    "senha",
+    "data_nascimento",
+    "email",
+    "telefone",
+    "endereco",
+    "cidade",
+    "estado_uf",
+    "situacao_trabalho",
+    "tipo_sanguineo",
+    "quantidade_filhos",
+)
+
+# Nomes alternativos aceitos no cabeçalho (após remover acentos e espaços)
+_SINONIMOS = {
+    "nome": "nome_completo",
+    "nascimento": "data_nascimento",
+    "data_de_nascimento": "data_nascimento",
+    "e_mail": "email",
+    "celular": "telefone",
+    "whatsapp": "telefone",
+    "telefone_whatsapp": "telefone",
+    "uf": "estado_uf",
+    "estado": "estado_uf",
+    "situacao_de_trabalho": "situacao_trabalho",
+    "filhos": "quantidade_filhos",
+    "quantidade_de_filhos": "quantidade_filhos",
+}
+
+# Tamanho máximo das colunas texto (mesmos limites das tabelas login/associado)
+_TAMANHOS = {
+    "nome_completo": 150,
+    "email": 150,
+    "telefone": 20,
+    "cidade": 100,
+    "estado_uf": 10,
+    "situacao_trabalho": 100,
+}
+
+# Identidade aceita pelo código (SURDO) ou pelo rótulo (Surdo), sem diferenciar maiúsculas
+_IDENTIDADE_POR_TEXTO = {
+    **{codigo.lower(): codigo for codigo in rotulos.IDENTIDADE},
+    **{rotulo.lower(): codigo for codigo, rotulo in rotulos.IDENTIDADE.items()},
+}
+
+
+def _normalizar_coluna(nome: str) -> str:
+    texto = unicodedata.normalize("NFKD", str(nome)).encode("ascii", "ignore").decode()
+    texto = "_".join(texto.strip().lower().replace("-", " ").replace("/", " ").split())
+    return _SINONIMOS.get(texto, texto)
+
+
+def ler_planilha(conteudo: bytes, nome_arquivo: str) -> pd.DataFrame:
+    """Lê CSV (separador detectado automaticamente) ou XLSX como texto, com colunas normalizadas."""
+    if nome_arquivo.lower().endswith((".xlsx", ".xlsm")):
+        df = pd.read_excel(io.BytesIO(conteudo), dtype=str, keep_default_na=False, engine="openpyxl")
+    else:
+        texto = conteudo.decode("utf-8-sig", errors="replace")
+        df = pd.read_csv(io.StringIO(texto), dtype=str, keep_default_na=False, sep=None, engine="python")
+    df = df.rename(columns=_normalizar_coluna)
+
+    faltando = [c for c in COLUNAS_OBRIGATORIAS if c not in df.columns]
+    if faltando:
+        raise ValueError(f"Colunas obrigatórias ausentes na planilha: {', '.join(faltando)}")
+    for coluna in COLUNAS_OPCIONAIS:
+        if coluna not in df.columns:
+            df[coluna] = ""
+
+    df = df[list(COLUNAS_OBRIGATORIAS + COLUNAS_OPCIONAIS)].apply(lambda col: col.str.strip())
+    # Número da linha como o usuário vê na planilha (cabeçalho na linha 1)
+    df.insert(0, "linha", range(2, len(df) + 2))
+    return df.reset_index(drop=True)
+
+
+def _converter_datas(texto: pd.Series) -> pd.Series:
+    """Converte 'aaaa-mm-dd' (inclusive com hora, como vem do Excel) e 'dd/mm/aaaa'."""
+    iso = texto.str.match(r"^\d{4}-\d{2}-\d{2}")
+    datas = pd.to_datetime(texto.where(iso).str[:10], format="%Y-%m-%d", errors="coerce")
+    brasileiras = pd.to_datetime(texto.where(~iso), format="%d/%m/%Y", errors="coerce")
+    return datas.fillna(brasileiras)
+
+
+def validar_planilha(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Valida a planilha lida por `ler_planilha`.
+
+    Retorna (validos, erros): `validos` tem as linhas sem nenhum erro, já
+    normalizadas; `erros` tem uma linha por problema encontrado (linha, cpf, erro).
+    """
+    df = df.copy()
+    erros: List[pd.DataFrame] = []
+
+    def marcar(mascara: pd.Series, mensagem) -> None:
+        if mascara.any():
+            erros.append(
+                pd.DataFrame({
+                    "linha": df.loc[mascara, "linha"],
+                    "cpf": df.loc[mascara, "cpf"],
+                    "erro": mensagem if isinstance(mensagem, str) else mensagem[mascara],
+                })
+            )
+
+    df["cpf_digitos"] = df["cpf"].str.replace(r"\D", "", regex=True)
+    cpf_valido = df["cpf_digitos"].str.len() == 11
+    marcar(~cpf_valido, "CPF deve conter 11 dígitos.")
+    marcar(cpf_valido & df["cpf_digitos"].duplicated(keep=False), "CPF repetido na planilha.")
+    existentes = db.cpfs_cadastrados(df.loc[cpf_valido, "cpf_digitos"].unique().tolist())
+    marcar(df["cpf_digitos"].isin(existentes), "CPF já cadastrado.")
+
+    marcar(df["nome_completo"] == "", "Nome completo não informado.")
+
+    df["identidade"] = df["identidade"].str.lower().map(_IDENTIDADE_POR_TEXTO)
+    marcar(
+        df["identidade"].isna(),
+        "Identidade inválida (use: " + ", ".join(rotulos.IDENTIDADE_ROTULOS) + ").",
+    )
+
+    nascimento = _converter_datas(df["data_nascimento"])
+    marcar((df["data_nascimento"] != "") & nascimento.isna(), "Data de nascimento inválida (use dd/mm/aaaa).")
+    df["data_nascimento"] = nascimento.dt.date.astype(object).where(nascimento.notna(), None)
+
+    filhos = pd.to_numeric(df["quantidade_filhos"].replace("", None), errors="coerce")
+    filhos_invalidos = (df["quantidade_filhos"] != "") & (filhos.isna() | (filhos < 0) | (filhos % 1 != 0))
+    marcar(filhos_invalidos, "Quantidade de filhos inválida.")
+    df["quantidade_filhos"] = filhos.where(~filhos_invalidos).astype("Int64")
+
+    df["tipo_sanguineo"] = df["tipo_sanguineo"].str.upper().str.replace(" ", "", regex=False)
+    marcar(
+        ~df["tipo_sanguineo"].isin(rotulos.TIPOS_SANGUINEOS),
+        "Tipo sanguíneo inválido.",
+    )
+
+    df["estado_uf"] = df["estado_uf"].str.upper()
+    for coluna, tamanho in _TAMANHOS.items():
+        marcar(df[coluna].str.len() > tamanho, f"{coluna}: máximo de {tamanho} caracteres.")
+
+    relatorio = (
+        pd.concat(erros, ignore_index=True).sort_values("linha", kind="stable")
+        if erros
+        else pd.DataFrame(columns=["linha", "cpf", "erro"])
+    )
+    validos = df[~df["linha"].isin(relatorio["linha"])].reset_index(drop=True)
+    return validos, relatorio.reset_index(drop=True)
+
+
+def _hash_senha(senha: str) -> str:
+    import streamlit_authenticator as stauth
+
+    return stauth.Hasher.hash(senha)
+
+
+def gerar_hashes(senhas: Sequence[str], max_workers: Optional[int] = None) -> List[str]:
+    """Calcula os hashes bcrypt em paralelo (um worker por CPU, por padrão)."""
+    workers = max_workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="importacao-hash") as pool:
+        return list(pool.map(_hash_senha, senhas))
+
+
+def importar(conteudo: bytes, nome_arquivo: str) -> Dict[str, object]:
+    """Lê, valida e importa a planilha.
+
+    Retorna {"total", "inseridos", "erros" (DataFrame linha/cpf/erro),
+    "senhas_geradas" (DataFrame linha/cpf/nome_completo/senha_temporaria)}.
+    """
+    df = ler_planilha(conteudo, nome_arquivo)
+    validos, erros = validar_planilha(df)
+
+    sem_senha = validos["senha"] == ""
+    validos.loc[sem_senha, "senha"] = [secrets.token_urlsafe(9) for _ in range(int(sem_senha.sum()))]
+    senhas_geradas = validos.loc[sem_senha, ["linha", "cpf", "nome_completo", "senha"]].rename(
+        columns={"senha": "senha_temporaria"}
+    )
+
+    validos["senha_hash"] = gerar_hashes(validos["senha"].tolist())
+    validos["username"] = validos["cpf_digitos"]
+    validos["cpf"] = validos["cpf_digitos"].map(db.formatar_cpf)
+    registros = (
+        validos[list(db.COLUNAS_IMPORTACAO)]
+        .astype(object)
+        .where(validos[list(db.COLUNAS_IMPORTACAO)].notna(), None)
+        .replace("", None)
+        .to_dict("records")
+    )
+    resultado = db.importar_associados_em_lote(registros)
+
+    if resultado["conflitos"]:
+        conflitos = validos[validos["linha"].isin(resultado["conflitos"])]
+        erros = pd.concat(
+            [erros, pd.DataFrame({"linha": conflitos["linha"], "cpf": conflitos["cpf"], "erro": "CPF já cadastrado."})],
+            ignore_index=True,
+        ).sort_values("linha", kind="stable")
+        senhas_geradas = senhas_geradas[~senhas_geradas["linha"].isin(resultado["conflitos"])]
+
+    return {
+        "total": len(df),
+        "inseridos": resultado["inseridos"],
+        "erros": erros.reset_index(drop=True),
+        "senhas_geradas": senhas_geradas.reset_index(drop=True),
+    }
+
+
+def modelo_csv() -> bytes:
+    """Planilha modelo (CSV) com o cabeçalho esperado e uma linha de exemplo."""
+    exemplo = pd.DataFrame([{
+        "cpf": "000.000.000-00",
+        "nome_completo": "Nome do Associado",
+        "identidade": rotulos.IDENTIDADE_ROTULOS[0],
+        "senha": "",
+        "data_nascimento": "31/12/1990",
+        "email": "associado@example.com",
+        "telefone": "",
+        "endereco": "",
+        "cidade": "",
+        "estado_uf": "",
+        "situacao_trabalho": "",
+        "tipo_sanguineo": "",
+        "quantidade_filhos": "0",
+    }])
+    return exemplo.to_csv(index=False, sep=";").encode("utf-8-sig")
@@ -0,0 +1,119 @@
+"""Limitador de taxa (token bucket) para login e redefinição de senha.
+
+Cada tentativa de login custa uma verificação bcrypt, e cada pedido de código
+custa um INSERT e uma sessão SMTP. As telas consultam o limitador antes de
+qualquer hash, consulta ou envio de e-mail e recusam o excesso com uma mensagem.
+
+Cada política é um balde de `capacidade` fichas que se recarrega continuamente
+(`recarga_por_segundo`); cada tentativa consome uma ficha do balde da chave
+(IP, usuário, e-mail ou login). Backends (`LIMITADOR_BACKEND`):
+- `memoria` (default): baldes no processo, sem I/O;
+- `postgres`: tabela `limite_taxa`, compartilhada pelos processos do app
+  (`db.consumir_limite_taxa`, um UPSERT atômico por tentativa);
+- `desligado`: não limita.
+
+Recusas são contadas em `gestao_limite_taxa_rejeicoes_total{politica}`.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import db
+import metricas
+
+logger = logging.getLogger(__name__)
+
+
+class Politica(NamedTuple):
+    capacidade: float
+    recarga_por_segundo: float
+
+
+POLITICAS: Dict[str, Politica] = {
+    # 20 tentativas seguidas por IP; depois, uma a cada 30 s
+    "login_ip": Politica(20, 1 / 30),
+    # 5 tentativas seguidas por usuário; depois, uma a cada 3 min
+    "login_usuario": Politica(5, 1 / 180),
+    # Envio de código: 5 por IP e 3 por e-mail; depois, um a cada 10 min
+    "codigo_ip": Politica(5, 1 / 600),
+    "codigo_email": Politica(3, 1 / 600),
+    # Conferência do código de 8 dígitos: 5 tentativas por login; depois, uma a cada 3 min
+    "codigo_login": Politica(5, 1 / 180),
+}
+
+# Acima deste número de baldes em memória, os que já se recarregaram são descartados
+_MAXIMO_BALDES = 10_000
+
+_baldes: Dict[str, Tuple[float, float]] = {}  # chave -> (fichas, instante [monotonic])
+_baldes_lock = threading.Lock()
+
+
+def _consumir_memoria(chave: str, politica: Politica) -> bool:
+    agora = time.monotonic()
+    with _baldes_lock:
+        if len(_baldes) >= _MAXIMO_BALDES:
+            _descartar_baldes_cheios(agora)
+        fichas, instante = _baldes.get(chave, (politica.capacidade, agora))
+        fichas = min(politica.capacidade, fichas + (agora - instante) * politica.recarga_por_segundo)
+        if fichas < 1:
+            return False
+        _baldes[chave] = (fichas - 1, agora)
+        return True
+
+
+def _descartar_baldes_cheios(agora: float) -> None:
+    for chave, (fichas, instante) in list(_baldes.items()):
+        politica = POLITICAS[chave.split(":", 1)[0]]
+        if fichas + (agora - instante) * politica.recarga_por_segundo >= politica.capacidade:
+            del _baldes[chave]
+
+
+def _backend() -> str:
+    return (os.getenv("LIMITADOR_BACKEND") or "memoria").strip().lower()
+
+
+def permitir(politica: str, identificador: Optional[str]) -> bool:
+    """Consome uma ficha do balde (politica, identificador); False se estiver vazio.
+
+    Sem identificador (p.ex. IP indisponível) a tentativa é permitida.
+    """
+    if not identificador:
+        return True
+    backend = _backend()
+    if backend == "desligado":
+        return True
+    regra = POLITICAS[politica]
+    chave = f"{politica}:{identificador}"
+    if backend == "postgres":
+        try:
+            permitido = db.consumir_limite_taxa(chave, regra.capacidade, regra.recarga_por_segundo)
+        except Exception:  # noqa: BLE001
+            # Banco indisponível: não bloqueia (a própria tentativa vai falhar adiante)
+            logger.exception("Falha ao consultar o limitador de taxa no banco")
+            return True
+    else:
+        permitido = _consumir_memoria(chave, regra)
+    if not permitido:
+        metricas.LIMITE_TAXA_REJEICOES.inc(politica=politica)
+    return permitido
+
+
+def exigir(*tentativas: Tuple[str, Optional[str]], mensagem: str) -> None:
+    """Consome os baldes na ordem dada e levanta ValueError(mensagem) no primeiro vazio."""
+    for politica, identificador in tentativas:
+        if not permitir(politica, identificador):
+            raise ValueError(mensagem)
+
+
+def ip_cliente() -> Optional[str]:
+    """IP do navegador da sessão atual, quando o Streamlit o informa."""
+    try:
+        import streamlit as st
+
+        ip = getattr(st.context, "ip_address", None)
+    except Exception:  # noqa: BLE001
+        return None
+    return ip if isinstance(ip, str) else None
@@ -0,0 +1,412 @@
+"""Gerador de carga com sessões simultâneas usando o AppTest do Streamlit.
+
+Simula N administradores e M associados executando, em paralelo, o fluxo real do
+app (login, visualização de mensalidades e edição de pagamento) contra um
+PostgreSQL local, e reporta:
+- latência de rerun por etapa (p50/p95/p99)
+- conexões com o banco (pico em pg_stat_activity e total aberto pelo processo)
+- memória residente (RSS) do processo
+
+Todas as sessões rodam no mesmo processo, em threads, como no servidor do
+Streamlit. Exemplo:
+
+    python loadtest.py --preparar 50 --admins 2 --associados 20 --iteracoes 5
+
+As variáveis DB_* devem apontar para um banco local de testes: `--preparar`
+cria associados "Carga NNNN" (CPFs 999xxxxxxxx) com mensalidades.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import date
+from typing import Dict, List, Optional
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except Exception:
+    pass
+
+import db
+import metricas
+
+PREFIXO_CPF = "999"
+SENHA_PADRAO = "carga1234"
+
+
+# --- Preparação dos dados -----------------------------------------------------------
+def _cpf_carga(indice: int) -> str:
+    return f"{PREFIXO_CPF}{indice:08d}"
+
+
+def preparar_dados(quantidade: int, meses: int = 12, senha: str = SENHA_PADRAO) -> None:
+    """Cria `quantidade` associados de carga, cada um com `meses` mensalidades."""
+    import streamlit_authenticator as stauth
+
+    senha_hash = stauth.Hasher.hash_list([senha])[0]
+    hoje = date.today()
+    criados = 0
+    for i in range(1, quantidade + 1):
+        username = _cpf_carga(i)
+        if db.verificar_usuario_existe(username):
+            continue
+        nome = f"Carga {i:04d}"
+        db.inserir_usuario(username, nome, senha_hash)
+        login_id = db.obter_login_id(username)
+        db.inserir_associado(
+            login_id=login_id,
+            cpf=username,
+            nome_completo=nome,
+            data_nascimento=date(1990, 1, 1),
+            email=f"carga{i:04d}@example.com",
+            telefone="",
+            endereco="",
+            cidade="",
+            estado_uf="",
+            situacao_trabalho="",
+            tipo_sanguineo="",
+            quantidade_filhos=0,
+            identidade="SURDO",
+            foto_bytes=None,
+        )
+        associado = db.obter_associado_por_login_id(login_id)
+        for m in range(meses):
+            mes = (hoje.month - 1 - m) % 12 + 1
+            ano = hoje.year + (hoje.month - 1 - m) // 12
+            mensalidade_id = db.inserir_mensalidade(
+                associado_id=associado["id"],
+                valor=50.0,
+                data_vencimento=date(ano, mes, 10),
+            )
+            db.inserir_pagamento_inicial(mensalidade_id, 50.0)
+        criados += 1
+    print(f"Associados de carga criados: {criados} (solicitados: {quantidade})")
+
+
+def _mensalidades_de_carga() -> Dict[str, List[dict]]:
+    """Mensalidades dos associados de carga, agrupadas por username (CPF)."""
+    por_usuario: Dict[str, List[dict]] = defaultdict(list)
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT l.username, m.id, m.valor, m.pagamento_id
+                FROM mensalidade m
+                JOIN associado a ON a.id = m.associado_id
+                JOIN login l ON l.id = a.login_id
+                WHERE l.username LIKE %s
+                """,
+                (PREFIXO_CPF + "%",),
+            )
+            for row in cur.fetchall():
+                por_usuario[row["username"]].append(row)
+    return por_usuario
+
+
+# --- Amostragem de recursos ---------------------------------------------------------
+def _rss_bytes() -> int:
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss
+    except Exception:
+        pass
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for linha in f:
+                if linha.startswith("VmRSS:"):
+                    return int(linha.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Amostrador(threading.Thread):
+    """Coleta periodicamente conexões do banco e RSS enquanto a carga roda."""
+
+    def __init__(self, intervalo: float = 0.2) -> None:
+        super().__init__(name="amostrador-carga", daemon=True)
+        self.intervalo = intervalo
+        self.parar = threading.Event()
+        self.pico_conexoes_banco = 0
+        self.pico_conexoes_processo = 0
+        self.pico_rss = 0
+        self.amostras_rss: List[int] = []
+
+    def run(self) -> None:
+        import psycopg2
+
+        conn = psycopg2.connect(**db._parametros_conexao())
+        conn.autocommit = True
+        try:
+            while not self.parar.is_set():
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "SELECT count(*) FROM pg_stat_activity WHERE datname = current_database()"
+                    )
+                    # Desconta a própria conexão do amostrador
+                    self.pico_conexoes_banco = max(self.pico_conexoes_banco, cur.fetchone()[0] - 1)
+                self.pico_conexoes_processo = max(
+                    self.pico_conexoes_processo, int(metricas.DB_CONEXOES_ATIVAS.valor())
+                )
+                rss = _rss_bytes()
+                self.pico_rss = max(self.pico_rss, rss)
+                self.amostras_rss.append(rss)
+                self.parar.wait(self.intervalo)
+        finally:
+            conn.close()
+
+
+# --- Usuários virtuais --------------------------------------------------------------
+def _preparar_apptest_concorrente() -> None:
+    """Ajusta estado global do AppTest para várias sessões em paralelo.
+
+    Cada `AppTest.run()` publica um Runtime falso em `Runtime._instance` e liga
+    `global.appTest` via patch de `config.get_option`, desfazendo ambos ao terminar.
+    Com sessões em paralelo, uma sessão que termina desfaz o estado de outra ainda
+    em execução (`st.context.cookies` falha e o estado dos widgets não é registrado,
+    perdendo cliques). Aqui `global.appTest` fica ligado durante todo o teste e
+    `Runtime.instance()` devolve o último Runtime publicado nesse intervalo.
+
+    As áreas autenticadas também são importadas aqui, uma vez: cada AppTest compila
+    o `app.py` com `ast.parse`, e no CPython 3.11 isso não pode ocorrer em paralelo
+    à importação do numpy (que também chama `ast.parse`) sem corromper o parser
+    ("AST constructor recursion depth mismatch"). O custo de importação a frio é
+    medido por `bench_importtime.py`.
+    """
+    import area_admin  # noqa: F401
+    import area_associado  # noqa: F401
+    from streamlit import config
+    from streamlit.runtime import Runtime
+
+    config._set_option("global.appTest", True, "loadtest")
+
+    original = Runtime.instance.__func__
+    ultimo: Dict[str, object] = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            ultimo["runtime"] = cls._instance
+            return cls._instance
+        if "runtime" in ultimo:
+            return ultimo["runtime"]
+        return original(cls)
+
+    Runtime.instance = classmethod(instance)
+
+
+class UsuarioVirtual(threading.Thread):
+    """Uma sessão do app conduzida pelo AppTest."""
+
+    def __init__(
+        self,
+        perfil: str,
+        username: str,
+        senha: str,
+        iteracoes: int,
+        mensalidades: List[dict],
+        app_path: str,
+        timeout: float,
+    ) -> None:
+        super().__init__(name=f"{perfil}-{username}", daemon=True)
+        self.perfil = perfil
+        self.username = username
+        self.senha = senha
+        self.iteracoes = iteracoes
+        self.mensalidades = mensalidades
+        self.app_path = app_path
+        self.timeout = timeout
+        self.latencias: Dict[str, List[float]] = defaultdict(list)
+        self.erros: List[str] = []
+
+    def _medir(self, etapa: str, acao) -> None:
+        inicio = time.perf_counter()
+        at = acao()
+        self.latencias[etapa].append(time.perf_counter() - inicio)
+        if at is not None and len(at.exception):
+            self.erros.append(f"{etapa}: {at.exception[0].value}")
+
+    def run(self) -> None:
+        from streamlit.testing.v1 import AppTest
+
+        try:
+            at = AppTest.from_file(self.app_path, default_timeout=self.timeout)
+            self._medir("carregar_login", at.run)
+
+            campo_usuario = next(t for t in at.text_input if t.label == "CPF" and t.key is None)
+            campo_senha = next(t for t in at.text_input if t.label == "Senha" and t.key is None)
+            campo_usuario.input(self.username)
+            campo_senha.input(self.senha)
+            entrar = next(b for b in at.button if b.label == "Entrar")
+            self._medir("login", lambda: entrar.click().run())
+            if not at.session_state["authentication_status"]:
+                self.erros.append("login: autenticação falhou")
+                return
+
+            chave_menu = "admin_menu" if self.perfil == "admin" else "assoc_menu"
+            menu = at.sidebar.radio(key=chave_menu)
+            self._medir("abrir_mensalidades", lambda: menu.set_value("Mensalidades").run())
+
+            for _ in range(self.iteracoes):
+                self._medir("ver_mensalidades", at.run)
+                if self.mensalidades:
+                    self._medir("editar_pagamento", lambda: self._editar_pagamento(at))
+        except Exception as e:  # noqa: BLE001
+            self.erros.append(f"{type(e).__name__}: {e}")
+
+    def _editar_pagamento(self, at):
+        """Salva um pagamento como o diálogo de edição faz e reexecuta a página."""
+        alvo = random.choice(self.mensalidades)
+        db.registrar_pagamento(
+            mensalidade_id=alvo["id"],
+            data_pagamento=date.today(),
+            status_pagamento_id=random.choice((1, 2)),
+            valor_pagamento=float(alvo["valor"]),
+        )
+        return at.run()
+
+
+# --- Relatório ----------------------------------------------------------------------
+def _percentil(valores: List[float], p: float) -> float:
+    ordenados = sorted(valores)
+    if not ordenados:
+        return 0.0
+    # Método nearest-rank
+    posicao = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[posicao]
+
+
+def executar(args: argparse.Namespace) -> dict:
+    if args.preparar:
+        preparar_dados(args.preparar)
+
+    por_usuario = _mensalidades_de_carga()
+    usernames = sorted(por_usuario)
+    if args.associados and not usernames:
+        raise SystemExit("Nenhum associado de carga encontrado. Use --preparar N.")
+
+    _preparar_apptest_concorrente()
+    usuarios: List[UsuarioVirtual] = []
+    for _ in range(args.admins):
+        todas = [m for ms in por_usuario.values() for m in ms]
+        usuarios.append(
+            UsuarioVirtual("admin", args.usuario_admin, args.senha_admin, args.iteracoes,
+                           todas, args.app, args.timeout)
+        )
+    for i in range(args.associados):
+        username = usernames[i % len(usernames)]
+        usuarios.append(
+            UsuarioVirtual("associado", username, args.senha_associado, args.iteracoes,
+                           por_usuario[username], args.app, args.timeout)
+        )
+
+    conexoes_antes = metricas.DB_CONEXOES_ABERTAS.valor()
+    rss_inicial = _rss_bytes()
+    amostrador = Amostrador()
+    amostrador.start()
+    inicio = time.perf_counter()
+    for u in usuarios:
+        u.start()
+        time.sleep(args.rampa)
+    for u in usuarios:
+        u.join()
+    duracao = time.perf_counter() - inicio
+    amostrador.parar.set()
+    amostrador.join()
+
+    por_etapa: Dict[str, List[float]] = defaultdict(list)
+    for u in usuarios:
+        for etapa, valores in u.latencias.items():
+            por_etapa[f"{u.perfil}:{etapa}"].extend(valores)
+    todas_latencias = [v for vs in por_etapa.values() for v in vs]
+
+    def _resumo(valores: List[float]) -> dict:
+        return {
+            "n": len(valores),
+            "p50_ms": round(_percentil(valores, 50) * 1000, 1),
+            "p95_ms": round(_percentil(valores, 95) * 1000, 1),
+            "p99_ms": round(_percentil(valores, 99) * 1000, 1),
+        }
+
+    return {
+        "sessoes": {"admins": args.admins, "associados": args.associados},
+        "duracao_s": round(duracao, 2),
+        "reruns": _resumo(todas_latencias),
+        "etapas": {etapa: _resumo(v) for etapa, v in sorted(por_etapa.items())},
+        "conexoes": {
+            "pico_pg_stat_activity": amostrador.pico_conexoes_banco,
+            "pico_abertas_processo": amostrador.pico_conexoes_processo,
+            "total_abertas_processo": int(metricas.DB_CONEXOES_ABERTAS.valor() - conexoes_antes),
+        },
+        "memoria": {
+            "rss_inicial_mb": round(rss_inicial / 2**20, 1),
+            "rss_pico_mb": round(amostrador.pico_rss / 2**20, 1),
+            "rss_final_mb": round(_rss_bytes() / 2**20, 1),
+        },
+        "erros": [f"{u.name}: {e}" for u in usuarios for e in u.erros],
+    }
+
+
+def _imprimir(relatorio: dict) -> None:
+    sessoes = relatorio["sessoes"]
+    print(
+        f"\nSessões: {sessoes['admins']} admin(s) + {sessoes['associados']} associado(s)"
+        f" em {relatorio['duracao_s']} s"
+    )
+    print(f"{'etapa':<34}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    linhas = list(relatorio["etapas"].items()) + [("TODOS OS RERUNS", relatorio["reruns"])]
+    for etapa, r in linhas:
+        print(f"{etapa:<34}{r['n']:>6}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}")
+    c = relatorio["conexoes"]
+    print(
+        f"\nConexões: pico no banco {c['pico_pg_stat_activity']}, pico abertas pelo processo "
+        f"{c['pico_abertas_processo']}, total abertas {c['total_abertas_processo']}"
+    )
+    m = relatorio["memoria"]
+    print(f"RSS: inicial {m['rss_inicial_mb']} MB, pico {m['rss_pico_mb']} MB, final {m['rss_final_mb']} MB")
+    if relatorio["erros"]:
+        print(f"\nErros ({len(relatorio['erros'])}):")
+        for erro in relatorio["erros"][:20]:
+            print(f"  - {erro}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--admins", type=int, default=1, help="sessões de administrador")
+    parser.add_argument("--associados", type=int, default=5, help="sessões de associado")
+    parser.add_argument("--iteracoes", type=int, default=5, help="ciclos ver/editar por sessão")
+    parser.add_argument("--preparar", type=int, default=0, metavar="N",
+                        help="cria N associados de carga antes de rodar")
+    parser.add_argument("--rampa", type=float, default=0.05, help="intervalo (s) entre inícios de sessão")
+    parser.add_argument("--timeout", type=float, default=60.0, help="timeout (s) de cada rerun")
+    parser.add_argument("--usuario-admin", default="admin")
+    parser.add_argument("--senha-admin", default=os.getenv("LOADTEST_ADMIN_PASSWORD", "1234"))
+    parser.add_argument("--senha-associado", default=SENHA_PADRAO)
+    parser.add_argument("--app", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py"))
+    parser.add_argument("--json", metavar="ARQUIVO", help="grava o relatório em JSON")
+    args = parser.parse_args(argv)
+
+    # Chave fixa para o cookie de sessão não gerar aviso a cada sessão simulada
+    os.environ.setdefault("GESTAO_SECRET_KEY", "loadtest-" + "x" * 48)
+    # Todas as sessões simuladas entram com o mesmo admin, no mesmo processo
+    os.environ.setdefault("LIMITADOR_BACKEND", "desligado")
+
+    relatorio = executar(args)
+    _imprimir(relatorio)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    return 1 if relatorio["erros"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Limpeza periódica da tabela `password_reset_tokens` e outras rotinas agendadas.
+
+Cada pedido de "Esqueceu a senha?" grava uma linha, e códigos usados ou expirados
+não servem para mais nada. `limpar_tokens_redefinicao()` remove os que expiraram
+há mais de `TOKENS_RETENCAO_HORAS` (default 24) em lotes de tamanho fixo, cada
+um em sua própria transação curta, e registra quantas linhas saíram por execução.
+
+As limpezas rodam pelo agendador (`agendador.py`, de hora em hora para os códigos
+e uma vez por dia para os baldes ociosos do limitador de taxa). Execuções
+simultâneas não disputam as mesmas linhas: os lotes usam `FOR UPDATE SKIP LOCKED`.
+O agendador também chama `atualizar_resumo_financeiro()` logo após a meia-noite.
+
+Também pode ser executada pela linha de comando:
+
+    python manutencao.py --retencao-horas 24
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import db
+import metricas
+
+logger = logging.getLogger(__name__)
+
+RETENCAO_HORAS_PADRAO = 24.0
+TAMANHO_LOTE = 1000
+
+
+def _float_env(nome: str, padrao: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(nome, padrao)))
+    except ValueError:
+        return padrao
+
+
+def limpar_tokens_redefinicao(
+    retencao_horas: Optional[float] = None, lote: int = TAMANHO_LOTE
+) -> Dict[str, float]:
+    """Remove, em lotes, os códigos expirados antes da janela de retenção.
+
+    Retorna {"removidos", "lotes", "duracao_ms"}.
+    """
+    if retencao_horas is None:
+        retencao_horas = _float_env("TOKENS_RETENCAO_HORAS", RETENCAO_HORAS_PADRAO)
+    corte = datetime.now(timezone.utc) - timedelta(hours=retencao_horas)
+    inicio = time.perf_counter()
+    removidos = 0
+    lotes = 0
+    while True:
+        quantidade = db.remover_tokens_expirados(corte, lote)
+        lotes += 1
+        removidos += quantidade
+        if quantidade < lote:
+            break
+    metricas.TOKENS_REDEFINICAO_REMOVIDOS.inc(removidos)
+    duracao_ms = (time.perf_counter() - inicio) * 1000
+    logger.info(
+        "Limpeza de password_reset_tokens: %d linhas removidas em %d lotes (%.1f ms)",
+        removidos, lotes, duracao_ms,
+    )
+    return {"removidos": removidos, "lotes": lotes, "duracao_ms": round(duracao_ms, 1)}
+
+
+def limpar_limites_taxa() -> int:
+    """Remove baldes do limitador sem uso há um dia (já estariam cheios de novo)."""
+    removidos = db.remover_limites_taxa_ociosos(datetime.now(timezone.utc) - timedelta(days=1))
+    logger.info("Limpeza de limite_taxa: %d baldes ociosos removidos", removidos)
+    return removidos
+
+
+def atualizar_resumo_financeiro() -> int:
+    """Recalcula o resumo financeiro de todos os associados.
+
+    Os gatilhos mantêm `associado_financeiro` a cada escrita, mas uma mensalidade
+    passa a vencida só com a virada do dia; recalcular todos (e não só quem tem
+    mensalidade em aberto) também corrige qualquer resumo que tenha divergido.
+    """
+    atualizados = db.atualizar_resumo_financeiro(completo=True)
+    logger.info("Resumo financeiro: %d associados recalculados", atualizados)
+    return atualizados
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Remove códigos de redefinição de senha expirados.")
+    parser.add_argument("--retencao-horas", type=float, default=None,
+                        help=f"mantém os expirados há menos tempo (default: TOKENS_RETENCAO_HORAS ou {RETENCAO_HORAS_PADRAO:g})")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE, help="linhas removidas por transação")
+    args = parser.parse_args(argv)
+
+    resultado = limpar_tokens_redefinicao(args.retencao_horas, args.lote)
+    print(
+        f"{resultado['removidos']} linhas removidas em {resultado['lotes']} lotes "
+        f"({resultado['duracao_ms']} ms)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+    except ImportError:
+        pass
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,383 @@
+"""Registro de métricas em processo e exportação no formato texto do Prometheus.
+
+As métricas são alimentadas por `db.py` (conexões e latência de consultas) e por
+`helpers.enviar_email_codigo` (latência de envio SMTP). Para expor o endpoint
+`/metrics` em uma porta lateral, defina a variável de ambiente `METRICS_PORT`
+(opcionalmente `METRICS_HOST`, default 0.0.0.0).
+"""
+
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+BUCKETS_PADRAO: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# Janela (segundos) em que uma sessão sem atividade ainda é considerada ativa
+JANELA_SESSAO_ATIVA = 300
+
+
+def _escapar_rotulo(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatar_rotulos(nomes: Sequence[str], valores: Sequence[str], extra: str = "") -> str:
+    partes = [f'{n}="{_escapar_rotulo(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _formatar_numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+class _Metrica:
+    """Base das métricas: nome, descrição, rótulos e lock próprio."""
+
+    tipo = "untyped"
+
+    def __init__(self, nome: str, descricao: str, rotulos: Sequence[str] = ()) -> None:
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self._lock = threading.Lock()
+
+    def _chave(self, valores: Dict[str, str]) -> Tuple[str, ...]:
+        if set(valores) != set(self.rotulos):
+            raise ValueError(
+                f"Métrica {self.nome} espera os rótulos {self.rotulos}, recebeu {tuple(valores)}."
+            )
+        return tuple(str(valores[r]) for r in self.rotulos)
+
+    def _linhas(self) -> List[str]:
+        raise NotImplementedError
+
+    def exportar(self) -> str:
+        cabecalho = [
+            f"# HELP {self.nome} {self.descricao}",
+            f"# TYPE {self.nome} {self.tipo}",
+        ]
+        return "\n".join(cabecalho + self._linhas())
+
+
+class Contador(_Metrica):
+    """Contador monotônico."""
+
+    tipo = "counter"
+
+    def __init__(self, nome: str, descricao: str, rotulos: Sequence[str] = ()) -> None:
+        super().__init__(nome, descricao, rotulos)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, valor: float = 1.0, **rotulos: str) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0.0) + valor
+
+    def valor(self, **rotulos: str) -> float:
+        with self._lock:
+            return self._valores.get(self._chave(rotulos), 0.0)
+
+    def _linhas(self) -> List[str]:
+        with self._lock:
+            itens = sorted(self._valores.items())
+        if not itens and not self.rotulos:
+            itens = [((), 0.0)]
+        return [
+            f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {_formatar_numero(v)}"
+            for chave, v in itens
+        ]
+
+
+class Medidor(_Metrica):
+    """Valor que sobe e desce (gauge). Pode ser calculado por função na coleta."""
+
+    tipo = "gauge"
+
+    def __init__(self, nome: str, descricao: str, rotulos: Sequence[str] = ()) -> None:
+        super().__init__(nome, descricao, rotulos)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+        self._funcao: Optional[Callable[[], float]] = None
+
+    def set(self, valor: float, **rotulos: str) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = float(valor)
+
+    def inc(self, valor: float = 1.0, **rotulos: str) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0.0) + valor
+
+    def dec(self, valor: float = 1.0, **rotulos: str) -> None:
+        self.inc(-valor, **rotulos)
+
+    def definir_funcao(self, funcao: Callable[[], float]) -> None:
+        """Calcula o valor no momento da coleta (somente para métricas sem rótulos)."""
+        self._funcao = funcao
+
+    def valor(self, **rotulos: str) -> float:
+        if self._funcao is not None:
+            return float(self._funcao())
+        with self._lock:
+            return self._valores.get(self._chave(rotulos), 0.0)
+
+    def _linhas(self) -> List[str]:
+        if self._funcao is not None:
+            try:
+                return [f"{self.nome} {_formatar_numero(float(self._funcao()))}"]
+            except Exception:
+                return []
+        with self._lock:
+            itens = sorted(self._valores.items())
+        if not itens and not self.rotulos:
+            itens = [((), 0.0)]
+        return [
+            f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {_formatar_numero(v)}"
+            for chave, v in itens
+        ]
+
+
+class Histograma(_Metrica):
+    """Histograma com buckets cumulativos, soma e contagem."""
+
+    tipo = "histogram"
+
+    def __init__(
+        self,
+        nome: str,
+        descricao: str,
+        rotulos: Sequence[str] = (),
+        buckets: Iterable[float] = BUCKETS_PADRAO,
+    ) -> None:
+        super().__init__(nome, descricao, rotulos)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # chave -> [contagens por bucket (não cumulativas), soma, total]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, valor: float, **rotulos: str) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = [[0] * len(self.buckets), 0.0, 0]
+                self._series[chave] = serie
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    def _linhas(self) -> List[str]:
+        with self._lock:
+            itens = sorted((k, [list(s[0]), s[1], s[2]]) for k, s in self._series.items())
+        linhas: List[str] = []
+        for chave, (contagens, soma, total) in itens:
+            acumulado = 0
+            for limite, qtd in zip(self.buckets, contagens):
+                acumulado += qtd
+                rotulos = _formatar_rotulos(
+                    self.rotulos, chave, f'le="{_formatar_numero(limite)}"'
+                )
+                linhas.append(f"{self.nome}_bucket{rotulos} {acumulado}")
+            rotulos = _formatar_rotulos(self.rotulos, chave)
+            linhas.append(f"{self.nome}_sum{rotulos} {_formatar_numero(soma)}")
+            linhas.append(f"{self.nome}_count{rotulos} {total}")
+        return linhas
+
+
+class Registro:
+    """Conjunto de métricas do processo (get-or-create por nome)."""
+
+    def __init__(self) -> None:
+        self._metricas: Dict[str, _Metrica] = {}
+        self._lock = threading.Lock()
+
+    def _obter_ou_criar(self, classe, nome: str, *args, **kwargs):
+        with self._lock:
+            metrica = self._metricas.get(nome)
+            if metrica is None:
+                metrica = classe(nome, *args, **kwargs)
+                self._metricas[nome] = metrica
+            elif not isinstance(metrica, classe):
+                raise ValueError(f"Métrica {nome} já registrada com outro tipo.")
+            return metrica
+
+    def contador(self, nome: str, descricao: str, rotulos: Sequence[str] = ()) -> Contador:
+        return self._obter_ou_criar(Contador, nome, descricao, rotulos)
+
+    def medidor(self, nome: str, descricao: str, rotulos: Sequence[str] = ()) -> Medidor:
+        return self._obter_ou_criar(Medidor, nome, descricao, rotulos)
+
+    def histograma(
+        self,
+        nome: str,
+        descricao: str,
+        rotulos: Sequence[str] = (),
+        buckets: Iterable[float] = BUCKETS_PADRAO,
+    ) -> Histograma:
+        return self._obter_ou_criar(Histograma, nome, descricao, rotulos, buckets)
+
+    def exportar(self) -> str:
+        """Retorna todas as métricas no formato texto de exposição (versão 0.0.4)."""
+        with self._lock:
+            metricas = list(self._metricas.values())
+        blocos = [m.exportar() for m in sorted(metricas, key=lambda m: m.nome)]
+        return "\n".join(blocos) + "\n"
+
+
+REGISTRO = Registro()
+
+# --- Catálogo de métricas da aplicação ----------------------------------------------
+DB_CONEXOES_ABERTAS = REGISTRO.contador(
+    "gestao_db_conexoes_abertas_total",
+    "Total de conexões abertas com o PostgreSQL.",
+)
+DB_CONEXOES_ATIVAS = REGISTRO.medidor(
+    "gestao_db_conexoes_ativas",
+    "Conexões com o PostgreSQL abertas neste momento.",
+)
+DB_CONEXOES_FALHAS = REGISTRO.contador(
+    "gestao_db_conexoes_falhas_total",
+    "Tentativas de conexão com o PostgreSQL que falharam.",
+)
+DB_CONSULTA_DURACAO = REGISTRO.histograma(
+    "gestao_db_consulta_duracao_segundos",
+    "Duração das consultas SQL por função de db.py.",
+    rotulos=("consulta",),
+)
+DB_CONSULTAS_LENTAS = REGISTRO.contador(
+    "gestao_db_consultas_lentas_total",
+    "Consultas acima do limite DB_SLOW_QUERY_MS por função de db.py.",
+    rotulos=("consulta",),
+)
+CACHE_CONSULTAS = REGISTRO.contador(
+    "gestao_cache_consultas_total",
+    "Consultas aos caches em memória por resultado (hit/miss).",
+    rotulos=("cache", "resultado"),
+)
+TOKENS_REDEFINICAO_REMOVIDOS = REGISTRO.contador(
+    "gestao_tokens_redefinicao_removidos_total",
+    "Códigos de redefinição de senha expirados removidos pela limpeza periódica.",
+)
+LIMITE_TAXA_REJEICOES = REGISTRO.contador(
+    "gestao_limite_taxa_rejeicoes_total",
+    "Tentativas de login/redefinição de senha recusadas pelo limitador de taxa.",
+    rotulos=("politica",),
+)
+AGENDADOR_EXECUCOES = REGISTRO.contador(
+    "gestao_agendador_execucoes_total",
+    "Disparos das tarefas agendadas por resultado (sucesso, falha, em_outra_replica, ja_executada).",
+    rotulos=("tarefa", "resultado"),
+)
+AGENDADOR_DURACAO = REGISTRO.histograma(
+    "gestao_agendador_duracao_segundos",
+    "Duração das tarefas agendadas executadas nesta réplica.",
+    rotulos=("tarefa",),
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 1800.0),
+)
+SESSOES_ATIVAS = REGISTRO.medidor(
+    "gestao_sessoes_ativas",
+    f"Sessões Streamlit com atividade nos últimos {JANELA_SESSAO_ATIVA} segundos.",
+)
+SMTP_ENVIO_DURACAO = REGISTRO.histograma(
+    "gestao_smtp_envio_duracao_segundos",
+    "Duração do envio de e-mails via SMTP por resultado.",
+    rotulos=("resultado",),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+
+# --- Sessões ativas -----------------------------------------------------------------
+_sessoes_vistas: Dict[str, float] = {}
+_sessoes_lock = threading.Lock()
+
+
+def registrar_atividade_sessao(id_sessao: Optional[str] = None) -> None:
+    """Marca a sessão Streamlit atual (ou a informada) como ativa agora."""
+    if id_sessao is None:
+        try:
+            from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+            ctx = get_script_run_ctx()
+            id_sessao = ctx.session_id if ctx is not None else None
+        except Exception:
+            id_sessao = None
+    if not id_sessao:
+        return
+    with _sessoes_lock:
+        _sessoes_vistas[id_sessao] = time.monotonic()
+
+
+def _contar_sessoes_ativas() -> float:
+    limite = time.monotonic() - JANELA_SESSAO_ATIVA
+    with _sessoes_lock:
+        for id_sessao in [s for s, visto in _sessoes_vistas.items() if visto < limite]:
+            _sessoes_vistas.pop(id_sessao, None)
+        return float(len(_sessoes_vistas))
+
+
+SESSOES_ATIVAS.definir_funcao(_contar_sessoes_ativas)
+
+
+# --- Servidor HTTP lateral ----------------------------------------------------------
+class _MetricasHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:  # noqa: N802 - nome exigido por BaseHTTPRequestHandler
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        corpo = REGISTRO.exportar().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, format, *args) -> None:  # noqa: A002
+        # Evita poluir o log do Streamlit a cada coleta
+        pass
+
+
+_servidor: Optional[ThreadingHTTPServer] = None
+_servidor_lock = threading.Lock()
+
+
+def iniciar_servidor(porta: Optional[int] = None, host: Optional[str] = None) -> bool:
+    """Sobe o endpoint `/metrics` em uma thread daemon (uma vez por processo).
+
+    Sem `porta` explícita usa `METRICS_PORT`; se não estiver definida, não faz nada.
+    Retorna True se o servidor está (ou já estava) em execução.
+    """
+    global _servidor
+
+    if porta is None:
+        porta_env = os.getenv("METRICS_PORT")
+        if not porta_env:
+            return False
+        porta = int(porta_env)
+    host = host or os.getenv("METRICS_HOST", "0.0.0.0")
+
+    with _servidor_lock:
+        if _servidor is not None:
+            return True
+        try:
+            servidor = ThreadingHTTPServer((host, porta), _MetricasHandler)
+        except OSError:
+            # Porta ocupada (p.ex. outro processo do app já exporta as métricas)
+            return False
+        servidor.daemon_threads = True
+        thread = threading.Thread(
+            target=servidor.serve_forever, name="metricas-http", daemon=True
+        )
+        thread.start()
+        _servidor = servidor
+        return True
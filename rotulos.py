@@ -0,0 +1,88 @@
+"""Tabelas de apoio imutáveis (status, identidade, tipo/situação) em cache de processo.
+
+Os status de mensalidade/pagamento vêm das tabelas `status_mensalidade` e
+`status_pagamento`, carregadas uma única vez por processo via
+`db.carregar_tabelas_status()`. Até lá valem as sementes gravadas pelo `init_db`.
+Os demais rótulos são constantes do domínio. Todos os mapas são somente leitura
+e compartilhados entre sessões, evitando reconstruí-los a cada renderização.
+"""
+
+import threading
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+# --- Constantes do domínio ----------------------------------------------------------
+IDENTIDADE: Mapping[str, str] = MappingProxyType({
+    "SURDO": "Surdo",
+    "SURDOCEGO": "Surdocego",
+    "DEFICIENCIA_AUDITIVA": "Deficiência Auditiva (DA)",
+    "OUVINTE": "Ouvinte",
+})
+IDENTIDADE_ROTULOS: Tuple[str, ...] = tuple(IDENTIDADE.values())
+IDENTIDADE_POR_ROTULO: Mapping[str, str] = MappingProxyType({v: k for k, v in IDENTIDADE.items()})
+
+TIPO_ASSOCIADO: Mapping[int, str] = MappingProxyType({
+    1: "Honorário",
+    2: "Contribuinte",
+    3: "Comunitário",
+})
+SITUACAO_ASSOCIADO: Mapping[int, str] = MappingProxyType({
+    1: "Habilitado",
+    2: "Desabilitado",
+})
+CICLO_COBRANCA: Mapping[int, str] = MappingProxyType({
+    1: "Mensal",
+    2: "Anual",
+})
+TIPOS_SANGUINEOS: Tuple[str, ...] = ("", "A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-")
+
+# --- Tabelas de status (carregadas do banco) ----------------------------------------
+_lock = threading.Lock()
+_carregado = False
+_status_mensalidade: Mapping[int, str] = MappingProxyType({
+    1: "Não Pago",
+    2: "Ainda Falta Pagar!",
+    3: "Pago",
+})
+_status_pagamento: Mapping[int, str] = MappingProxyType({
+    1: "Pago",
+    2: "Não Pago",
+})
+
+
+def definir_status(status_mensalidade: Dict[int, str], status_pagamento: Dict[int, str]) -> None:
+    """Substitui os mapas de status pelos valores lidos do banco."""
+    global _status_mensalidade, _status_pagamento, _carregado
+    with _lock:
+        _status_mensalidade = MappingProxyType(dict(status_mensalidade))
+        _status_pagamento = MappingProxyType(dict(status_pagamento))
+        _carregado = True
+
+
+def carregado() -> bool:
+    """Indica se os status já foram lidos do banco neste processo."""
+    return _carregado
+
+
+def status_mensalidade() -> Mapping[int, str]:
+    """Mapa id -> descrição de `status_mensalidade`."""
+    return _status_mensalidade
+
+
+def status_pagamento() -> Mapping[int, str]:
+    """Mapa id -> descrição de `status_pagamento`."""
+    return _status_pagamento
+
+
+def descricao_status_mensalidade(status_id: Any) -> Optional[str]:
+    """Descrição do status da mensalidade, ou None se o id for nulo/desconhecido."""
+    if status_id is None:
+        return None
+    return _status_mensalidade.get(int(status_id))
+
+
+def descricao_status_pagamento(status_id: Any) -> Optional[str]:
+    """Descrição do status do pagamento, ou None se o id for nulo/desconhecido."""
+    if status_id is None:
+        return None
+    return _status_pagamento.get(int(status_id))